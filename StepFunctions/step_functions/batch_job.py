@@ -15,10 +15,14 @@ from aws_cdk import (
 
 from constructs import Construct
 
+from .shared_network import SharedNetwork
+
 class BatchJob(Construct):
     def __init__(self, 
                 scope: Construct, id: str,
                 cidr_block: str="172.30.0.0/24",
+                shared_network: str=None,
+                shared_network_azs: int=2,
                 **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
         # https://docs.aws.amazon.com/batch/latest/userguide/getting-started-ec2.html
@@ -30,24 +34,33 @@ class BatchJob(Construct):
         #? Security Group
         #x Private IP Address
         # create VPC
-        self._vpc = ec2.Vpc(
-            self, "VPC",
-            vpc_name="vpc-workshop",
-            ip_addresses=ec2.IpAddresses.cidr(cidr_block), 
-            enable_dns_hostnames=True,
-            enable_dns_support=True,
-            nat_gateways=0,
-            subnet_configuration=[
-                ec2.SubnetConfiguration(
-                    name="public",
-                    subnet_type=ec2.SubnetType.PUBLIC
-                ),
-                ec2.SubnetConfiguration(
-                    name="private",
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
-                )
-            ]
-        )
+        if shared_network:
+            network = SharedNetwork(
+                self, "VPC",
+                name=shared_network,
+                prefix="vpc-workshop",
+                max_azs=shared_network_azs
+            )
+            self._vpc = network.vpc
+        else:
+            self._vpc = ec2.Vpc(
+                self, "VPC",
+                vpc_name="vpc-workshop",
+                ip_addresses=ec2.IpAddresses.cidr(cidr_block), 
+                enable_dns_hostnames=True,
+                enable_dns_support=True,
+                nat_gateways=0,
+                subnet_configuration=[
+                    ec2.SubnetConfiguration(
+                        name="public",
+                        subnet_type=ec2.SubnetType.PUBLIC
+                    ),
+                    ec2.SubnetConfiguration(
+                        name="private",
+                        subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+                    )
+                ]
+            )
         # Tag VPC
         # Aspects.of(self._vpc).add( Tag("Name", "vpc-workshop-lab"))
         # # Create ssm endpoint via AWS CDk
@@ -55,11 +68,14 @@ class BatchJob(Construct):
         # self._ssm_endpoint = SsmEndpoint(self, "SsmEndpoint", vpc=self._vpc)
         
         # import SG by ID
-        security_group = ec2.SecurityGroup.from_security_group_id(
-            self, "SG", 
-            self._vpc.vpc_default_security_group,
-            mutable=False
-        )
+        if shared_network:
+            security_group = network.sg_default
+        else:
+            security_group = ec2.SecurityGroup.from_security_group_id(
+                self, "SG", 
+                self._vpc.vpc_default_security_group,
+                mutable=False
+            )
 
         # ec2.InterfaceVpcEndpoint(
         #     self, "VPC Endpoint",
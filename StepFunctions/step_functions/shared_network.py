@@ -0,0 +1,29 @@
+"""
+    Shared network of ec2spots_workshop/main/shared_network, one implementation for all apps:
+    ec2spots_workshop/lib/shared_network.py
+
+    ec2spots_workshop/lib is loaded from its path under the package name ec2spots_workshop_lib,
+    sys.path is not changed and no top-level 'lib' package is imported.
+"""
+import sys
+import importlib
+import importlib.util
+from pathlib import Path
+
+_PACKAGE = "ec2spots_workshop_lib"
+_LIB_DIR = Path(__file__).resolve().parents[2] / "ec2spots_workshop" / "lib"
+
+
+def _load_shared_network():
+    if _PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            _PACKAGE, _LIB_DIR / "__init__.py", submodule_search_locations=[str(_LIB_DIR)])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[_PACKAGE] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{_PACKAGE}.shared_network")
+
+
+_shared_network = _load_shared_network()
+SharedNetwork = _shared_network.SharedNetwork
+network_layout = _shared_network.network_layout
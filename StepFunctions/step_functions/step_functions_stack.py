@@ -121,13 +121,17 @@ class StepFunctionsRunJob(Stack):
     # https://docs.aws.amazon.com/step-functions/latest/dg/batch-job-notification.html
     # https://aws.amazon.com/ru/blogs/compute/orchestrating-high-performance-computing-with-aws-step-functions-and-aws-batch/
 
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str,
+                 shared_network: str=None, shared_network_azs: int=2, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # create a compute environment
         batch_job  = BatchJob(
             self
             , "BatchJob"
+            # VPC of ec2spots_workshop/main/shared_network instead of its own
+            , shared_network=shared_network
+            , shared_network_azs=shared_network_azs
             # , compute_environment_name="computeEnvironmentName", 
             # , job_queue_name="jobQueueName"
         )
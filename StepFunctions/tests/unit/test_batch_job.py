@@ -0,0 +1,39 @@
+import sys
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from step_functions import shared_network
+from step_functions.batch_job import BatchJob
+
+
+def _template(**kwargs):
+    stack = core.Stack(core.App(), "batch-job")
+    BatchJob(stack, "BatchJob", **kwargs)
+    return assertions.Template.from_stack(stack)
+
+
+def test_batch_job_own_vpc():
+    _template().resource_count_is("AWS::EC2::VPC", 1)
+
+
+def test_batch_job_shared_network():
+    template = _template(shared_network="shared")
+    template.resource_count_is("AWS::EC2::VPC", 0)
+    template.resource_count_is("AWS::EC2::Subnet", 0)
+    parameters = template.find_parameters("*", {"Type": "AWS::SSM::Parameter::Value<String>"})
+    assert {"/shared/network/vpc-id", "/shared/network/default-sg", "/shared/network/layout"} \
+        <= {parameter["Default"] for parameter in parameters.values()}
+    rules = template.to_json()["Rules"]
+    assert any(
+        rule["Assertions"][0]["Assert"]["Fn::Equals"][1] == "azs=2;public=PUBLIC;private=PRIVATE_WITH_EGRESS"
+        for rule in rules.values() if "Fn::Equals" in rule["Assertions"][0]["Assert"]
+    )
+
+
+def test_shared_network_import_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert shared_network.SharedNetwork.__module__ == "ec2spots_workshop_lib.shared_network"
+    # ec2spots_workshop/lib is not on sys.path as a generic 'lib' package
+    assert not any(path.rstrip("/").endswith("ec2spots_workshop") for path in sys.path)
+    assert shared_network._load_shared_network() is sys.modules["ec2spots_workshop_lib.shared_network"]
@@ -0,0 +1,160 @@
+"""
+    CDK apps of the repository and a synth runner which works like `cdk synth`
+    without the CLI: context from cdk.json + cdk.context.json, CDK_OUTDIR, CDK_CONTEXT_JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import logging
+import tempfile
+import threading
+import subprocess
+
+from dataclasses import dataclass, field
+from typing import List, Dict
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SKIP_DIRS = {"node_modules", "cdk.out", ".venv", "venv", ".git", "__pycache__"}
+
+
+@dataclass
+class CdkApp:
+    """
+    CDK app described by cdk.json
+
+    Args:
+        name (str): directory of cdk.json relative to the repository root
+        path (str): absolute directory of cdk.json, the app runs there
+        command (list): the 'app' command of cdk.json
+        context (dict): the 'context' of cdk.json
+    """
+    name: str
+    path: str
+    command: List[str]
+    context: Dict=field(default_factory=dict)
+
+    @property
+    def is_python(self) -> bool:
+        return os.path.basename(self.command[0]).startswith("python")
+
+    @property
+    def entry_point(self) -> str:
+        return os.path.normpath(os.path.join(self.path, self.command[-1]))
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.entry_point)
+
+    def load_context(self) -> dict:
+        """
+            cdk.json context + cdk.context.json, like the CDK CLI does
+        """
+        context = dict(self.context)
+        context_file = os.path.join(self.path, "cdk.context.json")
+        if os.path.exists(context_file):
+            with open(context_file) as f:
+                context.update(json.load(f))
+        return context
+
+
+@dataclass
+class SynthResult:
+    app: str
+    ok: bool
+    wall: float=0.0
+    max_rss_kb: int=0
+    templates: Dict=field(default_factory=dict)
+    missing: List=field(default_factory=list)
+    outdir: str=None
+    error: str=None
+
+
+def discover_apps(root: str=ROOT, python_only: bool=True) -> List[CdkApp]:
+    apps = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        if "cdk.json" not in filenames:
+            continue
+        with open(os.path.join(dirpath, "cdk.json")) as f:
+            cdk_json = json.load(f)
+        if "app" not in cdk_json:
+            continue
+        app = CdkApp(
+            name=os.path.relpath(dirpath, root),
+            path=dirpath,
+            command=shlex.split(cdk_json["app"]),
+            context=cdk_json.get("context", {})
+        )
+        if python_only and not app.is_python:
+            log.debug(f"Skip non python app {app.name}")
+            continue
+        apps.append(app)
+    return apps
+
+
+def _read_assembly(outdir: str):
+    templates = {}
+    missing = []
+    manifest_path = os.path.join(outdir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            missing = json.load(f).get("missing", [])
+    for name in sorted(os.listdir(outdir)):
+        if name.endswith(".template.json"):
+            templates[name[:-len(".template.json")]] = os.path.getsize(os.path.join(outdir, name))
+    return templates, missing
+
+
+def synth_app(app: CdkApp, outdir: str, env: dict=None, context: dict=None, timeout: int=600) -> SynthResult:
+    """
+        Run the app once and collect wall time, peak RSS, template sizes and missing context
+    """
+    os.makedirs(outdir, exist_ok=True)
+    full_context = app.load_context()
+    full_context.update(context or {})
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    process_env.update({
+        "CDK_OUTDIR": outdir,
+        "CDK_CONTEXT_JSON": json.dumps(full_context),
+        "JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION": "1",
+    })
+    command = list(app.command)
+    if app.is_python:
+        command[0] = sys.executable
+
+    with tempfile.TemporaryFile() as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command, cwd=app.path, env=process_env,
+            stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        # wait4 instead of Popen.wait to get rusage of this app only,
+        # ru_maxrss is in KB on Linux and includes the jsii node runtime (a waited child)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+        timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        max_rss_kb = rusage.ru_maxrss
+        stderr.seek(0)
+        error = stderr.read().decode("utf8", errors="replace").strip().splitlines()
+
+    if process.returncode != 0:
+        return SynthResult(
+            app=app.name, ok=False, wall=wall, max_rss_kb=max_rss_kb, outdir=outdir,
+            error=error[-1] if error else f"exit code {process.returncode}"
+        )
+    templates, missing = _read_assembly(outdir)
+    return SynthResult(
+        app=app.name, ok=True, wall=wall, max_rss_kb=max_rss_kb,
+        templates=templates, missing=missing, outdir=outdir
+    )
+
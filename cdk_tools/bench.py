@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+    Synth benchmark for every python CDK app of the repository.
+
+    All external lookups are stubbed (see cdk_tools/stubs.py), so it runs offline.
+    Per app it records median wall time, peak RSS and template sizes per stack,
+    and compares them with cdk_tools/synth_baseline.json.
+    Apps which fail in the baseline are expected failures, a different error is a regression too.
+
+    $ python -m cdk_tools.bench                        # compare, exit 1 on regression
+    $ python -m cdk_tools.bench --update-baseline      # store new numbers
+    $ python -m cdk_tools.bench --threshold 0.1 --runs 5 --app ec2spots_workshop
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+
+from .apps import ROOT, discover_apps, synth_app
+from .stubs import stub_environment, stub_context
+
+BASELINE = os.path.join(os.path.dirname(__file__), "synth_baseline.json")
+# wall time of a synth is noisy and machine dependent, it's a regression only
+# when it grows by both WALL_THRESHOLD and WALL_SLACK seconds
+WALL_THRESHOLD = 0.5
+WALL_SLACK = 2.0
+
+
+def bench_app(app, workdir: str, env: dict, runs: int) -> dict:
+    """
+        First synth collects missing context lookups, measured runs get stubs for them
+    """
+    if not app.exists:
+        return {"status": "no entry point"}
+    outdir = os.path.join(workdir, app.name.replace(os.sep, "__"))
+    first = synth_app(app, os.path.join(outdir, "warmup"), env=env)
+    if not first.ok:
+        return {"status": "failed", "error": first.error}
+    context = stub_context(first.missing)
+
+    results = [
+        synth_app(app, os.path.join(outdir, f"run{i}"), env=env, context=context)
+        for i in range(runs)
+    ]
+    failed = [result for result in results if not result.ok]
+    if failed:
+        return {"status": "failed", "error": failed[0].error}
+    return {
+        "status": "ok",
+        "wall": round(statistics.median(result.wall for result in results), 3),
+        "max_rss_kb": max(result.max_rss_kb for result in results),
+        "templates": results[-1].templates,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float,
+            wall_threshold: float=WALL_THRESHOLD, wall_slack: float=WALL_SLACK) -> list:
+    """
+        Regressions as text.
+        RSS and template size are regressions when they grow more than threshold, wall time
+        when it grows more than wall_threshold and wall_slack seconds (it depends on the machine).
+        An app which fails in the baseline is an expected failure, it must fail with the same error.
+    """
+    regressions = []
+    for name, result in sorted(current.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if base.get("status") != "ok":
+            if (result.get("status"), result.get("error")) != (base.get("status"), base.get("error")):
+                regressions.append(
+                    f"{name}: expected {base.get('status')} ({base.get('error')}), "
+                    f"got {result.get('status')} ({result.get('error')}), run with --update-baseline if it's intended")
+            continue
+        if result.get("status") != "ok":
+            regressions.append(f"{name}: synth {result.get('status')} ({result.get('error')})")
+            continue
+        base_wall = base["wall"]
+        if base_wall and result["wall"] > max(base_wall * (1 + wall_threshold), base_wall + wall_slack):
+            regressions.append(
+                f"{name}: wall {result['wall']} > {base_wall} (+{(result['wall'] / base_wall - 1) * 100:.0f}%)")
+        metrics = [("max_rss_kb", result["max_rss_kb"], base["max_rss_kb"])]
+        for stack, size in result["templates"].items():
+            if stack in base.get("templates", {}):
+                metrics.append((f"template {stack}", size, base["templates"][stack]))
+        for metric, value, base_value in metrics:
+            if base_value and value > base_value * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {value} > {base_value} (+{(value / base_value - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(current: dict):
+    print(f"{'app':<50} {'status':<15} {'wall, s':>8} {'rss, MB':>8} {'stacks':>6} {'templates, KB':>14}")
+    for name, result in sorted(current.items()):
+        if result["status"] != "ok":
+            print(f"{name:<50} {result['status']:<15} {result.get('error') or ''}")
+            continue
+        templates = result["templates"]
+        print(f"{name:<50} {'ok':<15} {result['wall']:>8.2f} {result['max_rss_kb'] / 1024:>8.0f} "
+              f"{len(templates):>6} {sum(templates.values()) / 1024:>14.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed relative growth of RSS and template size")
+    parser.add_argument("--wall-threshold", type=float, default=WALL_THRESHOLD,
+                        help="allowed relative growth of wall time")
+    parser.add_argument("--wall-slack", type=float, default=WALL_SLACK,
+                        help="allowed absolute growth of wall time, seconds")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--app", action="append", help="only apps with this name prefix")
+    args = parser.parse_args(argv)
+
+    apps = discover_apps(ROOT)
+    if args.app:
+        apps = [app for app in apps if any(app.name.startswith(prefix) for prefix in args.app)]
+
+    current = {}
+    with tempfile.TemporaryDirectory(prefix="cdk-synth-bench-") as workdir:
+        env = stub_environment(workdir, ROOT)
+        for app in apps:
+            current[app.name] = bench_app(app, workdir, env, args.runs)
+    print_table(current)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(current)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline is updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"there is no baseline {args.baseline}, run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(current, json.load(f), args.threshold, args.wall_threshold, args.wall_slack)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+    Resolve context lookups of CDK apps upfront and write them into cdk.context.json.
+
+    The app is synthesized without the CDK CLI, the 'missing' list of the cloud assembly
+    holds every lookup the app declares (HostedZone.from_lookup, Vpc.from_lookup, AZs, SSM, AMI)
+    with its account, region and filters. All of them are resolved concurrently with boto3,
+    then the app is synthesized again to catch lookups which depend on resolved values.
+    After that `cdk synth` needs a single pass.
+
+    $ python -m cdk_tools.prefetch --app ec2spots_workshop/main/workshope_ec2_spot/ecs
+    $ python -m cdk_tools.prefetch --shared       # also store values in cdk.context.shared.json
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .apps import ROOT, discover_apps, synth_app
+from .synth_all import SHARED_CONTEXT, load_shared_context, save_shared_context
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+CONTEXT_FILE = "cdk.context.json"
+SUBNET_TYPE_TAG = "aws-cdk:subnet-type"
+SUBNET_NAME_TAG = "aws-cdk:subnet-name"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _session(props: dict):
+    """
+        One boto3 session per lookup role, the lookup role of the CDK bootstrap is assumed
+        when it's available, the default credentials are used otherwise (like the CDK CLI does)
+    """
+    import boto3
+    role_arn = (props.get("lookupRoleArn") or "").replace("${AWS::Partition}", "aws")
+    with _sessions_lock:
+        if role_arn not in _sessions:
+            session = boto3.session.Session()
+            if role_arn:
+                try:
+                    credentials = session.client("sts").assume_role(
+                        RoleArn=role_arn, RoleSessionName="cdk-prefetch")["Credentials"]
+                    session = boto3.session.Session(
+                        aws_access_key_id=credentials["AccessKeyId"],
+                        aws_secret_access_key=credentials["SecretAccessKey"],
+                        aws_session_token=credentials["SessionToken"],
+                    )
+                except Exception as e:
+                    log.debug(f"Can't assume {role_arn}, use default credentials: {e}")
+            _sessions[role_arn] = session
+        return _sessions[role_arn]
+
+
+def _client(service: str, props: dict):
+    return _session(props).client(service, region_name=props.get("region"))
+
+
+def _tag(tags: list, key: str):
+    for tag in tags or []:
+        if tag["Key"] == key:
+            return tag["Value"]
+    return None
+
+
+def lookup_hosted_zone(props: dict) -> dict:
+    domain_name = props["domainName"].rstrip(".") + "."
+    client = _client("route53", props)
+    # ListHostedZonesByName has no paginator, zones are sorted by name starting at DNSName
+    zones = []
+    kwargs = {"DNSName": domain_name}
+    while True:
+        page = client.list_hosted_zones_by_name(**kwargs)
+        zones += [zone for zone in page["HostedZones"] if zone["Name"] == domain_name]
+        if not page.get("IsTruncated") or page.get("NextDNSName") != domain_name:
+            break
+        kwargs = {"DNSName": page["NextDNSName"], "HostedZoneId": page["NextHostedZoneId"]}
+    if "privateZone" in props:
+        zones = [zone for zone in zones if zone["Config"]["PrivateZone"] == props["privateZone"]]
+    if props.get("vpcId"):
+        zones = [
+            zone for zone in zones
+            if any(vpc["VPCId"] == props["vpcId"] for vpc in client.get_hosted_zone(Id=zone["Id"]).get("VPCs", []))
+        ]
+    if len(zones) != 1:
+        raise ValueError(f"Found {len(zones)} hosted zones matching {props['domainName']}, expected exactly one")
+    return {"Id": zones[0]["Id"], "Name": zones[0]["Name"]}
+
+
+def _subnet_type(subnet: dict, route_table: dict) -> str:
+    subnet_type = _tag(subnet.get("Tags"), SUBNET_TYPE_TAG)
+    if subnet_type:
+        return subnet_type
+    if subnet.get("MapPublicIpOnLaunch"):
+        return "Public"
+    has_igw = any(
+        (route.get("GatewayId") or "").startswith("igw-")
+        for route in (route_table or {}).get("Routes", [])
+    )
+    return "Public" if has_igw else "Private"
+
+
+def lookup_vpc(props: dict) -> dict:
+    """
+        Same shape as the CDK CLI vpc-provider with returnAsymmetricSubnets
+    """
+    if not props.get("returnAsymmetricSubnets", True):
+        raise ValueError("Only vpc lookups with returnAsymmetricSubnets are supported")
+    client = _client("ec2", props)
+    filters = [{"Name": name, "Values": [value]} for name, value in props.get("filter", {}).items()]
+    vpcs = client.describe_vpcs(Filters=filters)["Vpcs"]
+    if len(vpcs) != 1:
+        raise ValueError(f"Found {len(vpcs)} VPCs matching {props.get('filter')}, expected exactly one")
+    vpc = vpcs[0]
+    vpc_filter = [{"Name": "vpc-id", "Values": [vpc["VpcId"]]}]
+
+    subnets = [
+        subnet
+        for page in client.get_paginator("describe_subnets").paginate(Filters=vpc_filter)
+        for subnet in page["Subnets"]
+    ]
+    route_tables = [
+        table
+        for page in client.get_paginator("describe_route_tables").paginate(Filters=vpc_filter)
+        for table in page["RouteTables"]
+    ]
+    main_table = next(
+        (table for table in route_tables if any(a.get("Main") for a in table.get("Associations", []))), None)
+    subnet_tables = {
+        association["SubnetId"]: table
+        for table in route_tables
+        for association in table.get("Associations", [])
+        if association.get("SubnetId")
+    }
+    vpn_gateways = client.describe_vpn_gateways(Filters=[
+        {"Name": "attachment.vpc-id", "Values": [vpc["VpcId"]]},
+        {"Name": "attachment.state", "Values": ["attached"]},
+        {"Name": "state", "Values": ["available"]},
+    ])["VpnGateways"]
+
+    groups = {}
+    for subnet in sorted(subnets, key=lambda s: (s["AvailabilityZone"], s["CidrBlock"])):
+        table = subnet_tables.get(subnet["SubnetId"], main_table)
+        subnet_type = _subnet_type(subnet, table)
+        name = _tag(subnet.get("Tags"), SUBNET_NAME_TAG) or subnet_type
+        group = groups.setdefault(name, {"name": name, "type": subnet_type, "subnets": []})
+        group["subnets"].append({
+            "subnetId": subnet["SubnetId"],
+            "cidr": subnet["CidrBlock"],
+            "availabilityZone": subnet["AvailabilityZone"],
+            "routeTableId": table["RouteTableId"] if table else None,
+        })
+
+    value = {
+        "vpcId": vpc["VpcId"],
+        "vpcCidrBlock": vpc["CidrBlock"],
+        "ownerAccountId": vpc.get("OwnerId"),
+        "availabilityZones": [],
+        "subnetGroups": list(groups.values()),
+    }
+    if vpn_gateways:
+        value["vpnGatewayId"] = vpn_gateways[0]["VpnGatewayId"]
+    return value
+
+
+def lookup_availability_zones(props: dict) -> list:
+    zones = _client("ec2", props).describe_availability_zones(
+        Filters=[{"Name": "state", "Values": ["available"]}])["AvailabilityZones"]
+    return sorted(zone["ZoneName"] for zone in zones)
+
+
+def lookup_ssm_parameter(props: dict) -> str:
+    return _client("ssm", props).get_parameter(Name=props["parameterName"])["Parameter"]["Value"]
+
+
+def lookup_ami(props: dict) -> str:
+    kwargs = {"Filters": [{"Name": name, "Values": values} for name, values in props.get("filters", {}).items()]}
+    if props.get("owners"):
+        kwargs["Owners"] = props["owners"]
+    images = _client("ec2", props).describe_images(**kwargs)["Images"]
+    if not images:
+        raise ValueError(f"No AMI found for {props.get('filters')}")
+    return max(images, key=lambda image: image["CreationDate"])["ImageId"]
+
+
+LOOKUP_PROVIDERS = {
+    "hosted-zone": lookup_hosted_zone,
+    "vpc-provider": lookup_vpc,
+    "availability-zones": lookup_availability_zones,
+    "ssm": lookup_ssm_parameter,
+    "ami": lookup_ami,
+}
+
+
+def resolve_missing(missing: list, jobs: int=8) -> (dict, dict):
+    """
+        Resolve all lookups at once, returns (context values, errors) by lookup key
+    """
+    def resolve(entry):
+        provider = LOOKUP_PROVIDERS.get(entry["provider"])
+        if provider is None:
+            raise ValueError(f"Lookup provider {entry['provider']} is not supported")
+        return provider(entry.get("props", {}))
+
+    values, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {entry["key"]: executor.submit(resolve, entry) for entry in missing}
+        for key, future in futures.items():
+            try:
+                values[key] = future.result()
+                log.info(f"Resolved {key}")
+            except Exception as e:
+                errors[key] = str(e)
+                log.error(f"Can't resolve {key}: {e}")
+    return values, errors
+
+
+def write_context(app, values: dict):
+    """
+        Merge values into cdk.context.json of the app, the file is sorted like the CLI writes it
+    """
+    path = os.path.join(app.path, CONTEXT_FILE)
+    context = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            context = json.load(f)
+    context.update(values)
+    with open(path, "w") as f:
+        json.dump(dict(sorted(context.items())), f, indent=2)
+        f.write("\n")
+    return path
+
+
+def prefetch_app(app, shared: dict=None, rounds: int=3, jobs: int=8, env: dict=None) -> dict:
+    """
+        Synth -> resolve missing lookups -> synth again until nothing is missing.
+        Every round resolves all lookups of the round in parallel, usually one round is enough.
+    """
+    shared = shared or {}
+    resolved = {}
+    with tempfile.TemporaryDirectory(prefix="cdk-prefetch-") as workdir:
+        for round_number in range(rounds):
+            known = dict(shared)
+            known.update(resolved)
+            result = synth_app(app, os.path.join(workdir, str(round_number)), env=env, context=known)
+            if not result.ok:
+                raise RuntimeError(f"Synth of {app.name} failed: {result.error}")
+            missing = [entry for entry in result.missing if entry["key"] not in resolved]
+            if not missing:
+                break
+            values, errors = resolve_missing(missing, jobs)
+            if errors:
+                raise RuntimeError(f"{len(errors)} lookups of {app.name} failed: {', '.join(sorted(errors))}")
+            resolved.update(values)
+    if resolved:
+        log.info(f"{len(resolved)} lookups are written to {write_context(app, resolved)}")
+    return resolved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", action="append", help="only apps with this name prefix")
+    parser.add_argument("--jobs", type=int, default=8, help="lookups resolved at once")
+    parser.add_argument("--rounds", type=int, default=3, help="max synth passes per app")
+    parser.add_argument("--shared", action="store_true", help=f"use and update {os.path.basename(SHARED_CONTEXT)}")
+    args = parser.parse_args(argv)
+
+    apps = [app for app in discover_apps(ROOT) if app.exists]
+    if args.app:
+        apps = [app for app in apps if any(app.name.startswith(prefix) for prefix in args.app)]
+
+    shared = load_shared_context() if args.shared else {}
+    failed = []
+    for app in apps:
+        try:
+            resolved = prefetch_app(app, shared=shared, rounds=args.rounds, jobs=args.jobs)
+        except RuntimeError as e:
+            log.error(str(e))
+            failed.append(app.name)
+            continue
+        shared.update(resolved)
+    if args.shared:
+        save_shared_context(shared)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
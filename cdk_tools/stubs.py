@@ -0,0 +1,131 @@
+"""
+    Local stubs for every external lookup made during synth:
+
+    - ipify          -> CDK_EXTERNAL_IP
+    - EC2 AMI lookup -> CDK_AMI_RESOLUTION=deploy (SSM parameters) and an empty lookup cache
+    - sops           -> SOPS_CACHE_DIR seeded with placeholders for every *.enc file
+    - context lookups (Route53 hosted zones, VPCs, AZs, SSM, AMI) -> dummy context values
+    - any other boto3 call goes to a closed local port and fails fast
+"""
+
+import os
+import json
+import yaml
+import hashlib
+
+STUB_ACCOUNT = "123456789012"
+STUB_REGION = "us-east-1"
+STUB_IP = "203.0.113.10"
+STUB_SECRET = "stub"
+
+
+def _placeholders(value):
+    if isinstance(value, dict):
+        return {key: _placeholders(item) for key, item in value.items() if key != "sops"}
+    if isinstance(value, list):
+        return [_placeholders(item) for item in value]
+    return STUB_SECRET
+
+
+def seed_sops_cache(cache_dir: str, root: str) -> int:
+    """
+        sops keeps keys of yaml/json files in plain text, so every encrypted file
+        gets a placeholder with the same structure, stored under its content hash
+        and data type (see sagemaker_lab/functions/secrets.py)
+    """
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    os.chmod(cache_dir, 0o700)
+    seeded = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in {".git", "node_modules", "cdk.out"}]
+        for filename in filenames:
+            if not filename.endswith(".enc"):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                content = f.read()
+            try:
+                encrypted = yaml.safe_load(content)
+            except yaml.YAMLError:
+                continue
+            digest = hashlib.sha256(content).hexdigest()
+            # SopsSecrets caches a file per data type
+            for data_type in ("yaml", "json"):
+                cache_file = os.path.join(cache_dir, f"{digest}.{data_type}.json")
+                # SopsSecrets reads private files only
+                with os.fdopen(os.open(cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                    json.dump(_placeholders(encrypted), f)
+            seeded += 1
+    return seeded
+
+
+def stub_environment(workdir: str, root: str) -> dict:
+    sops_cache = os.path.join(workdir, "sops")
+    seed_sops_cache(sops_cache, root)
+    return {
+        "CDK_DEFAULT_ACCOUNT": STUB_ACCOUNT,
+        "CDK_DEFAULT_REGION": STUB_REGION,
+        "CDK_EXTERNAL_IP": STUB_IP,
+        "CDK_AMI_RESOLUTION": "deploy",
+        "CDK_LOOKUP_CACHE": os.path.join(workdir, "cdk.lookups.json"),
+        "SOPS_CACHE_DIR": sops_cache,
+        "AWS_ACCESS_KEY_ID": "stub",
+        "AWS_SECRET_ACCESS_KEY": "stub",
+        "AWS_ENDPOINT_URL": "http://127.0.0.1:9",
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "AWS_MAX_ATTEMPTS": "1",
+    }
+
+
+def _stub_vpc(props: dict) -> dict:
+    region = props.get("region", STUB_REGION)
+    azs = [f"{region}a", f"{region}b"]
+    return {
+        "vpcId": "vpc-12345",
+        "vpcCidrBlock": "10.0.0.0/16",
+        "ownerAccountId": props.get("account", STUB_ACCOUNT),
+        "availabilityZones": [],
+        "subnetGroups": [
+            {
+                "name": name,
+                "type": name,
+                "subnets": [
+                    {
+                        "subnetId": f"subnet-{name.lower()}{i}",
+                        "cidr": f"10.0.{offset + i}.0/24",
+                        "availabilityZone": az,
+                        "routeTableId": f"rtb-{name.lower()}{i}",
+                    }
+                    for i, az in enumerate(azs)
+                ],
+            }
+            for offset, name in ((0, "Public"), (10, "Private"))
+        ],
+    }
+
+
+def stub_context_value(provider: str, props: dict):
+    if provider == "hosted-zone":
+        return {"Id": "/hostedzone/ZSTUB12345", "Name": f"{props.get('domainName', 'example.com')}."}
+    if provider == "vpc-provider":
+        return _stub_vpc(props)
+    if provider == "availability-zones":
+        region = props.get("region", STUB_REGION)
+        return [f"{region}a", f"{region}b", f"{region}c"]
+    if provider == "ssm":
+        return STUB_SECRET
+    if provider == "ami":
+        return "ami-12345678"
+    return None
+
+
+def stub_context(missing: list) -> dict:
+    """
+        Dummy values for the 'missing' entries of a cloud assembly manifest
+    """
+    context = {}
+    for entry in missing:
+        value = stub_context_value(entry.get("provider"), entry.get("props", {}))
+        if value is not None:
+            context[entry["key"]] = value
+    return context
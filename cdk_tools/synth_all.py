@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+    Synth every CDK app of the repository in parallel.
+
+    Every app gets its own cloud assembly directory (<outdir>/<app>), all of them
+    share one lookup cache (external IP, AMI IDs, see ec2spots_workshop/lib/lookup_cache.py)
+    and one context file with lookup values (hosted zones, VPCs, AZs ...).
+    Lookups which are still missing after synth are reported, cdk_tools.prefetch resolves them.
+
+    $ python -m cdk_tools.synth_all
+    $ python -m cdk_tools.synth_all --jobs 2 --outdir /tmp/cdk.out --app base_account_setup
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .apps import ROOT, discover_apps, synth_app
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+OUTDIR = os.path.join(ROOT, "cdk.out.all")
+LOOKUP_CACHE = os.path.join(ROOT, "cdk.lookups.json")
+SHARED_CONTEXT = os.environ.get("CDK_SHARED_CONTEXT", os.path.join(ROOT, "cdk.context.shared.json"))
+# synth is CPU bound, a node (jsii) + python process pair of ~250MB RSS
+DEFAULT_JOBS = max(1, min(4, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1))
+
+
+def is_lookup_key(key: str) -> bool:
+    """
+        Context lookup keys look like 'vpc-provider:account=...:region=...'
+    """
+    return ":" in key and "=" in key
+
+
+def load_shared_context(path: str=SHARED_CONTEXT) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_shared_context(context: dict, path: str=SHARED_CONTEXT):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(context, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def harvest_context(apps: list, shared: dict) -> int:
+    """
+        Copy lookup values from cdk.context.json of every app into the shared context,
+        so a VPC resolved for one app is not looked up again for another one
+    """
+    added = 0
+    for app in apps:
+        for key, value in app.load_context().items():
+            if is_lookup_key(key) and key not in shared:
+                shared[key] = value
+                added += 1
+    return added
+
+
+def warm_external_ip(env: dict):
+    """
+        Resolve external IP once before the fan-out, workers read it from the shared cache
+    """
+    if os.environ.get("CDK_EXTERNAL_IP"):
+        return
+    previous = os.environ.get("CDK_LOOKUP_CACHE")
+    os.environ["CDK_LOOKUP_CACHE"] = env["CDK_LOOKUP_CACHE"]
+    try:
+        from ec2spots_workshop.lib.utils import get_my_external_ip
+        get_my_external_ip()
+    except Exception as e:
+        log.warning(f"External IP is not resolved upfront, every app resolves it on its own: {e}")
+    finally:
+        if previous is None:
+            os.environ.pop("CDK_LOOKUP_CACHE", None)
+        else:
+            os.environ["CDK_LOOKUP_CACHE"] = previous
+
+
+def synth_all(apps: list, outdir: str=OUTDIR, jobs: int=DEFAULT_JOBS,
+              lookup_cache: str=LOOKUP_CACHE, shared_context_path: str=SHARED_CONTEXT) -> list:
+    """
+        Synth apps with at most `jobs` synth processes at once, returns SynthResult per app
+    """
+    shared = load_shared_context(shared_context_path)
+    if harvest_context(apps, shared):
+        save_shared_context(shared, shared_context_path)
+    env = {"CDK_LOOKUP_CACHE": lookup_cache}
+    warm_external_ip(env)
+
+    runnable = [app for app in apps if app.exists]
+    for app in apps:
+        if not app.exists:
+            log.warning(f"Skip {app.name}: there is no entry point {app.entry_point}")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # every worker only waits for its synth subprocess, so threads are enough here
+        futures = {
+            executor.submit(
+                synth_app, app, os.path.join(outdir, app.name.replace(os.sep, "__")),
+                env=env, context=shared
+            ): app
+            for app in runnable
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            log.info(f"{result.app}: {'ok' if result.ok else 'failed'} in {result.wall:.2f}s")
+            results.append(result)
+    return sorted(results, key=lambda result: result.app)
+
+
+def missing_lookups(results: list) -> dict:
+    """
+        Missing context of all apps, deduplicated by lookup key
+    """
+    missing = {}
+    for result in results:
+        for entry in result.missing:
+            missing.setdefault(entry["key"], entry)
+    return missing
+
+
+def print_report(results: list, wall: float):
+    print(f"{'app':<50} {'status':<8} {'wall, s':>8} {'rss, MB':>8} {'stacks':>6}  outdir / error")
+    for result in results:
+        detail = result.outdir if result.ok else result.error
+        print(f"{result.app:<50} {'ok' if result.ok else 'failed':<8} {result.wall:>8.2f} "
+              f"{result.max_rss_kb / 1024:>8.0f} {len(result.templates):>6}  {detail}")
+    serial = sum(result.wall for result in results)
+    print(f"total {wall:.2f}s, sum of app synth times {serial:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="synth processes at once")
+    parser.add_argument("--outdir", default=OUTDIR)
+    parser.add_argument("--lookup-cache", default=LOOKUP_CACHE)
+    parser.add_argument("--context", default=SHARED_CONTEXT, help="shared context file")
+    parser.add_argument("--app", action="append", help="only apps with this name prefix")
+    args = parser.parse_args(argv)
+
+    apps = discover_apps(ROOT)
+    if args.app:
+        apps = [app for app in apps if any(app.name.startswith(prefix) for prefix in args.app)]
+
+    started = time.perf_counter()
+    results = synth_all(
+        apps, outdir=os.path.abspath(args.outdir), jobs=args.jobs,
+        lookup_cache=os.path.abspath(args.lookup_cache), shared_context_path=args.context
+    )
+    print_report(results, time.perf_counter() - started)
+
+    missing = missing_lookups(results)
+    if missing:
+        print(f"{len(missing)} context lookups are missing, resolve them with 'python -m cdk_tools.prefetch --shared':")
+        for key in sorted(missing):
+            print(f"  {key}")
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+from cdk_tools.apps import discover_apps
+from cdk_tools.bench import compare
+from cdk_tools.stubs import STUB_SECRET, seed_sops_cache, stub_context, stub_environment
+
+
+def _cdk_json(path, content: dict):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "cdk.json"), "w") as f:
+        json.dump(content, f)
+
+
+def _ok(wall=10.0, rss=1000, templates=None):
+    return {"status": "ok", "wall": wall, "max_rss_kb": rss, "templates": templates or {"web": 1000}}
+
+
+@pytest.mark.unit
+def test_discover_apps(tmp_path):
+    _cdk_json(tmp_path / "web", {"app": "python3 app.py", "context": {"flag": True}})
+    _cdk_json(tmp_path / "web" / "main" / "ecs", {"app": "python3 ../../app.py"})
+    _cdk_json(tmp_path / "hello", {"app": "npx ts-node bin/hello.ts"})
+    _cdk_json(tmp_path / "settings", {"context": {}})
+    _cdk_json(tmp_path / "web" / "cdk.out", {"app": "python3 app.py"})
+    _cdk_json(tmp_path / "node_modules" / "lib", {"app": "python3 app.py"})
+    (tmp_path / "web" / "app.py").write_text("")
+
+    apps = discover_apps(str(tmp_path))
+    assert [app.name for app in apps] == ["web", os.path.join("web", "main", "ecs")]
+    web, ecs = apps
+    assert web.context == {"flag": True} and web.exists
+    assert ecs.entry_point == str(tmp_path / "web" / "app.py") and ecs.exists
+    assert [app.name for app in discover_apps(str(tmp_path), python_only=False)] == [
+        "hello", "web", os.path.join("web", "main", "ecs")
+    ]
+
+
+@pytest.mark.unit
+def test_stub_context():
+    missing = [
+        {"key": "hosted-zone:domainName=example.org", "provider": "hosted-zone", "props": {"domainName": "example.org"}},
+        {"key": "availability-zones:region=eu-west-1", "provider": "availability-zones", "props": {"region": "eu-west-1"}},
+        {"key": "vpc-provider:region=eu-west-1", "provider": "vpc-provider", "props": {"region": "eu-west-1"}},
+        {"key": "ssm:parameterName=/p", "provider": "ssm", "props": {"parameterName": "/p"}},
+        {"key": "ami:filters", "provider": "ami", "props": {}},
+        {"key": "load-balancer:arn", "provider": "load-balancer", "props": {}},
+    ]
+    context = stub_context(missing)
+    assert "load-balancer:arn" not in context
+    assert context["hosted-zone:domainName=example.org"]["Name"] == "example.org."
+    assert context["availability-zones:region=eu-west-1"] == ["eu-west-1a", "eu-west-1b", "eu-west-1c"]
+    assert context["ssm:parameterName=/p"] == STUB_SECRET
+    assert context["ami:filters"].startswith("ami-")
+    vpc = context["vpc-provider:region=eu-west-1"]
+    assert [group["name"] for group in vpc["subnetGroups"]] == ["Public", "Private"]
+    assert {subnet["availabilityZone"] for subnet in vpc["subnetGroups"][0]["subnets"]} == {"eu-west-1a", "eu-west-1b"}
+
+
+@pytest.mark.unit
+def test_stub_environment_seeds_sops_cache(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    content = b"password: ENC[AES256_GCM,data:abc]\nusers:\n- ENC[AES256_GCM,data:def]\nsops:\n  version: 3.7.3\n"
+    (root / "secrets.yaml.enc").write_bytes(content)
+    (root / "broken.enc").write_bytes(b"key: [unclosed")
+
+    env = stub_environment(str(tmp_path / "work"), str(root))
+    assert env["AWS_ENDPOINT_URL"].startswith("http://127.0.0.1")
+    assert env["CDK_AMI_RESOLUTION"] == "deploy"
+    digest = hashlib.sha256(content).hexdigest()
+    assert sorted(os.listdir(env["SOPS_CACHE_DIR"])) == [f"{digest}.json.json", f"{digest}.yaml.json"]
+    with open(os.path.join(env["SOPS_CACHE_DIR"], f"{digest}.yaml.json")) as f:
+        assert json.load(f) == {"password": STUB_SECRET, "users": [STUB_SECRET]}
+    assert seed_sops_cache(env["SOPS_CACHE_DIR"], str(root)) == 1
+
+
+@pytest.mark.unit
+def test_compare_metrics():
+    baseline = {"web": _ok()}
+    assert compare({"web": _ok(wall=11.9, rss=1200, templates={"web": 1200, "extra": 5000})}, baseline, 0.25) == []
+    regressions = compare({"web": _ok(rss=1300, templates={"web": 1300})}, baseline, 0.25)
+    assert regressions == ["web: max_rss_kb 1300 > 1000 (+30%)", "web: template web 1300 > 1000 (+30%)"]
+    # wall time has to grow by both the relative threshold and the slack
+    assert compare({"web": _ok(wall=2.9)}, {"web": _ok(wall=1.0)}, 0.25) == []
+    assert compare({"web": _ok(wall=14.9)}, baseline, 0.25) == []
+    assert compare({"web": _ok(wall=15.1)}, baseline, 0.25) == ["web: wall 15.1 > 10.0 (+51%)"]
+    assert compare({"web": _ok(wall=15.1)}, baseline, 0.25, wall_threshold=1.0) == []
+    # apps without a baseline are not compared
+    assert compare({"other": {"status": "failed", "error": "boom"}}, baseline, 0.25) == []
+    assert compare({"web": {"status": "failed", "error": "boom"}}, baseline, 0.25) == ["web: synth failed (boom)"]
+
+
+@pytest.mark.unit
+def test_compare_expected_failures():
+    baseline = {
+        "broken": {"status": "failed", "error": "NameError: name 'dataclass' is not defined"},
+        "lab": {"status": "no entry point"},
+    }
+    assert compare(dict(baseline), baseline, 0.25) == []
+    regressions = compare({
+        "broken": {"status": "failed", "error": "ImportError: no module"},
+        "lab": _ok(),
+    }, baseline, 0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("broken: expected failed (NameError: name 'dataclass' is not defined), "
+                                     "got failed (ImportError: no module)")
+    assert regressions[1].startswith("lab: expected no entry point (None), got ok (None)")
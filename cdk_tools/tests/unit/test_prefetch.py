@@ -0,0 +1,159 @@
+import os
+import json
+import datetime
+
+import pytest
+
+from cdk_tools import prefetch
+from cdk_tools.apps import CdkApp, SynthResult
+from ec2spots_workshop.lib.boto_replay import BotoReplay, _to_json
+
+REGION = "us-east-1"
+VPC_FILTER = [{"Name": "vpc-id", "Values": ["vpc-1"]}]
+
+
+def _fixture(replay: BotoReplay, service: str, operation: str, region: str, params: dict, response: dict):
+    path = replay.fixture_path(service, operation, region, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"status_code": 200, "response": _to_json(response)}, f)
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    """
+        boto3 calls of prefetch are served from fixtures of tmp_path
+    """
+    import boto3
+    session = boto3.session.Session(aws_access_key_id="stub", aws_secret_access_key="stub")
+    replay = BotoReplay("replay", str(tmp_path / "fixtures")).install(session)
+    monkeypatch.setattr(prefetch, "_sessions", {"": session})
+    yield replay
+    replay.uninstall()
+
+
+def _record_lookups(replay):
+    _fixture(replay, "route53", "ListHostedZonesByName", "aws-global", {"DNSName": "example.org."}, {
+        "HostedZones": [
+            {"Id": "/hostedzone/Z1", "Name": "example.org.", "Config": {"PrivateZone": False}},
+            {"Id": "/hostedzone/Z2", "Name": "example.org.", "Config": {"PrivateZone": True}},
+            {"Id": "/hostedzone/Z3", "Name": "sub.example.org.", "Config": {"PrivateZone": False}},
+        ],
+        "IsTruncated": False,
+    })
+    _fixture(replay, "ec2", "DescribeVpcs", REGION, {"Filters": [{"Name": "tag:Name", "Values": ["workshop"]}]}, {
+        "Vpcs": [{"VpcId": "vpc-1", "CidrBlock": "10.0.0.0/16", "OwnerId": "123456789012"}],
+    })
+    _fixture(replay, "ec2", "DescribeSubnets", REGION, {"Filters": VPC_FILTER}, {"Subnets": [
+        {"SubnetId": "subnet-b", "CidrBlock": "10.0.1.0/24", "AvailabilityZone": "us-east-1b",
+         "MapPublicIpOnLaunch": True},
+        {"SubnetId": "subnet-a", "CidrBlock": "10.0.0.0/24", "AvailabilityZone": "us-east-1a",
+         "MapPublicIpOnLaunch": True},
+        {"SubnetId": "subnet-app", "CidrBlock": "10.0.2.0/24", "AvailabilityZone": "us-east-1a",
+         "Tags": [{"Key": "aws-cdk:subnet-type", "Value": "Private"}, {"Key": "aws-cdk:subnet-name", "Value": "app"}]},
+    ]})
+    _fixture(replay, "ec2", "DescribeRouteTables", REGION, {"Filters": VPC_FILTER}, {"RouteTables": [
+        {"RouteTableId": "rtb-main", "Associations": [{"Main": True}],
+         "Routes": [{"GatewayId": "igw-1"}]},
+        {"RouteTableId": "rtb-app", "Associations": [{"SubnetId": "subnet-app"}],
+         "Routes": [{"NatGatewayId": "nat-1"}]},
+    ]})
+    _fixture(replay, "ec2", "DescribeVpnGateways", REGION, {"Filters": [
+        {"Name": "attachment.vpc-id", "Values": ["vpc-1"]},
+        {"Name": "attachment.state", "Values": ["attached"]},
+        {"Name": "state", "Values": ["available"]},
+    ]}, {"VpnGateways": []})
+    _fixture(replay, "ec2", "DescribeAvailabilityZones", REGION, {
+        "Filters": [{"Name": "state", "Values": ["available"]}]
+    }, {"AvailabilityZones": [{"ZoneName": "us-east-1b"}, {"ZoneName": "us-east-1a"}]})
+    _fixture(replay, "ssm", "GetParameter", REGION, {"Name": "/workshop/vpc-id"}, {
+        "Parameter": {"Name": "/workshop/vpc-id", "Value": "vpc-1", "LastModifiedDate": datetime.datetime(2024, 1, 1)},
+    })
+    _fixture(replay, "ec2", "DescribeImages", REGION, {
+        "Filters": [{"Name": "name", "Values": ["amzn2-ami-*"]}], "Owners": ["amazon"]
+    }, {"Images": [
+        {"ImageId": "ami-old", "CreationDate": "2023-01-01T00:00:00.000Z"},
+        {"ImageId": "ami-new", "CreationDate": "2024-01-01T00:00:00.000Z"},
+    ]})
+
+
+MISSING = [
+    {"key": "hosted-zone:domainName=example.org", "provider": "hosted-zone",
+     "props": {"region": REGION, "domainName": "example.org", "privateZone": False}},
+    {"key": "vpc-provider:filter.tag:Name=workshop", "provider": "vpc-provider",
+     "props": {"region": REGION, "filter": {"tag:Name": "workshop"}, "returnAsymmetricSubnets": True}},
+    {"key": "availability-zones:region=us-east-1", "provider": "availability-zones", "props": {"region": REGION}},
+    {"key": "ssm:parameterName=/workshop/vpc-id", "provider": "ssm",
+     "props": {"region": REGION, "parameterName": "/workshop/vpc-id"}},
+    {"key": "ami:filters.name=amzn2-ami-*", "provider": "ami",
+     "props": {"region": REGION, "filters": {"name": ["amzn2-ami-*"]}, "owners": ["amazon"]}},
+]
+
+
+@pytest.mark.unit
+def test_resolve_missing_by_provider(replay):
+    _record_lookups(replay)
+    unsupported = {"key": "load-balancer:arn", "provider": "load-balancer", "props": {}}
+    values, errors = prefetch.resolve_missing(MISSING + [unsupported], jobs=4)
+
+    assert list(errors) == ["load-balancer:arn"]
+    assert values["hosted-zone:domainName=example.org"] == {"Id": "/hostedzone/Z1", "Name": "example.org."}
+    assert values["availability-zones:region=us-east-1"] == ["us-east-1a", "us-east-1b"]
+    assert values["ssm:parameterName=/workshop/vpc-id"] == "vpc-1"
+    assert values["ami:filters.name=amzn2-ami-*"] == "ami-new"
+    vpc = values["vpc-provider:filter.tag:Name=workshop"]
+    assert (vpc["vpcId"], vpc["vpcCidrBlock"], vpc["ownerAccountId"]) == ("vpc-1", "10.0.0.0/16", "123456789012")
+    assert vpc["subnetGroups"] == [
+        {"name": "Public", "type": "Public", "subnets": [
+            {"subnetId": "subnet-a", "cidr": "10.0.0.0/24", "availabilityZone": "us-east-1a", "routeTableId": "rtb-main"},
+            {"subnetId": "subnet-b", "cidr": "10.0.1.0/24", "availabilityZone": "us-east-1b", "routeTableId": "rtb-main"},
+        ]},
+        {"name": "app", "type": "Private", "subnets": [
+            {"subnetId": "subnet-app", "cidr": "10.0.2.0/24", "availabilityZone": "us-east-1a", "routeTableId": "rtb-app"},
+        ]},
+    ]
+
+
+@pytest.mark.unit
+def test_lookup_fails_on_ambiguous_match(replay):
+    _record_lookups(replay)
+    values, errors = prefetch.resolve_missing([{
+        "key": "hosted-zone:domainName=example.org", "provider": "hosted-zone",
+        "props": {"region": REGION, "domainName": "example.org"},
+    }])
+    assert values == {}
+    assert "Found 2 hosted zones" in errors["hosted-zone:domainName=example.org"]
+
+
+@pytest.mark.unit
+def test_prefetch_app_writes_context(replay, tmp_path, monkeypatch):
+    _record_lookups(replay)
+    path = tmp_path / "web"
+    path.mkdir()
+    (path / "cdk.context.json").write_text(json.dumps({"zeta": 1, "acknowledged-issue-numbers": [19836]}))
+    app = CdkApp(name="web", path=str(path), command=["python3", "app.py"])
+
+    contexts = []
+
+    def _synth(app, outdir, env=None, context=None):
+        contexts.append(dict(context))
+        # the AMI lookup depends on the VPC, it shows up in the second round
+        missing = [MISSING[1]] if len(contexts) == 1 else [MISSING[1], MISSING[4]]
+        missing = [entry for entry in missing if entry["key"] not in context]
+        return SynthResult(app=app.name, ok=True, missing=missing, outdir=outdir)
+
+    monkeypatch.setattr(prefetch, "synth_app", _synth)
+    shared = {"availability-zones:region=us-east-1": ["us-east-1a"]}
+    resolved = prefetch.prefetch_app(app, shared=shared)
+
+    assert sorted(resolved) == ["ami:filters.name=amzn2-ami-*", "vpc-provider:filter.tag:Name=workshop"]
+    assert len(contexts) == 3
+    assert contexts[0] == shared and set(contexts[2]) == set(shared) | set(resolved)
+    with open(path / "cdk.context.json") as f:
+        written = f.read()
+    context = json.loads(written)
+    # the existing values are kept, keys are sorted like the CDK CLI writes them
+    assert list(context) == sorted(context)
+    assert context["zeta"] == 1 and context["acknowledged-issue-numbers"] == [19836]
+    assert context["ami:filters.name=amzn2-ami-*"] == "ami-new"
+    assert "availability-zones:region=us-east-1" not in context
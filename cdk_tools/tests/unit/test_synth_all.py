@@ -0,0 +1,77 @@
+import os
+import json
+
+import pytest
+
+from cdk_tools import synth_all as synth_all_module
+from cdk_tools.apps import CdkApp, SynthResult
+from cdk_tools.synth_all import (
+    harvest_context, is_lookup_key, load_shared_context, missing_lookups, save_shared_context, synth_all
+)
+
+VPC_KEY = "vpc-provider:account=123456789012:filter.vpc-id=vpc-1:region=us-east-1"
+AZ_KEY = "availability-zones:account=123456789012:region=us-east-1"
+
+
+def _app(tmp_path, name: str, context: dict=None, cdk_context: dict=None) -> CdkApp:
+    path = tmp_path / name
+    path.mkdir()
+    (path / "app.py").write_text("")
+    if cdk_context is not None:
+        (path / "cdk.context.json").write_text(json.dumps(cdk_context))
+    return CdkApp(name=name, path=str(path), command=["python3", "app.py"], context=context or {})
+
+
+@pytest.mark.unit
+def test_harvest_context(tmp_path):
+    web = _app(tmp_path, "web", context={"prefix": "web"}, cdk_context={VPC_KEY: {"vpcId": "vpc-1"}, "flag": True})
+    ecs = _app(tmp_path, "ecs", cdk_context={VPC_KEY: {"vpcId": "vpc-other"}, AZ_KEY: ["us-east-1a"]})
+    shared = {AZ_KEY: ["us-east-1b"]}
+    assert is_lookup_key(VPC_KEY) and not is_lookup_key("flag") and not is_lookup_key("@aws-cdk/core:flag")
+
+    # only lookups, the first value wins, values already shared are kept
+    assert harvest_context([web, ecs], shared) == 1
+    assert shared == {VPC_KEY: {"vpcId": "vpc-1"}, AZ_KEY: ["us-east-1b"]}
+    assert harvest_context([web, ecs], shared) == 0
+
+
+@pytest.mark.unit
+def test_shared_context_round_trip(tmp_path):
+    path = str(tmp_path / "cdk.context.shared.json")
+    assert load_shared_context(path) == {}
+    save_shared_context({VPC_KEY: {"vpcId": "vpc-1"}, AZ_KEY: ["us-east-1a"]}, path)
+    assert load_shared_context(path) == {VPC_KEY: {"vpcId": "vpc-1"}, AZ_KEY: ["us-east-1a"]}
+    assert os.listdir(tmp_path) == ["cdk.context.shared.json"]
+
+
+@pytest.mark.unit
+def test_synth_all_merges_shared_context(tmp_path, monkeypatch):
+    web = _app(tmp_path, "web", cdk_context={VPC_KEY: {"vpcId": "vpc-1"}})
+    ecs = _app(tmp_path, "ecs")
+    gone = CdkApp(name="gone", path=str(tmp_path / "gone"), command=["python3", "app.py"])
+    shared_path = str(tmp_path / "cdk.context.shared.json")
+    save_shared_context({AZ_KEY: ["us-east-1a"]}, shared_path)
+
+    calls = {}
+
+    def _synth(app, outdir, env=None, context=None):
+        calls[app.name] = (outdir, env, context)
+        missing = [{"key": "ssm:parameterName=/p", "provider": "ssm"}] if app.name == "ecs" else []
+        return SynthResult(app=app.name, ok=True, missing=missing, outdir=outdir)
+
+    monkeypatch.setattr(synth_all_module, "synth_app", _synth)
+    monkeypatch.setattr(synth_all_module, "warm_external_ip", lambda env: None)
+    results = synth_all(
+        [web, ecs, gone], outdir=str(tmp_path / "out"), jobs=2,
+        lookup_cache=str(tmp_path / "cdk.lookups.json"), shared_context_path=shared_path
+    )
+
+    assert [result.app for result in results] == ["ecs", "web"]
+    expected = {AZ_KEY: ["us-east-1a"], VPC_KEY: {"vpcId": "vpc-1"}}
+    assert load_shared_context(shared_path) == expected
+    # every app gets the lookups of the others, its own assembly and the shared lookup cache
+    for name, (outdir, env, context) in calls.items():
+        assert context == expected
+        assert outdir == str(tmp_path / "out" / name)
+        assert env == {"CDK_LOOKUP_CACHE": str(tmp_path / "cdk.lookups.json")}
+    assert list(missing_lookups(results)) == ["ssm:parameterName=/p"]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+    Synth time of a stack with custom-owner AMIs: cold vs warm cdk.lookups.json.
+
+    EC2 API is replaced by a fake client with a fixed latency per page,
+    so the benchmark runs without credentials:
+
+    $ python benchmarks/bench_ami_cache.py --latency 0.3 --images 2000 --runs 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+import aws_cdk as core
+from aws_cdk import aws_ec2 as ec2
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from lib import utils  # noqa: E402
+
+PATTERNS = [
+    {"owner": "500480925365", "architecture": "x86_64", "name": "amazon-linux-2-test*"},
+    {"owner": "500480925365", "architecture": "x86_64", "name": "amazon-linux-2-web*"},
+    {"owner": "500480925365", "architecture": "arm64", "name": "amazon-linux-2-web*"},
+]
+REGIONS = ["us-east-1", "us-west-2"]
+
+
+class FakeEC2Client:
+    def __init__(self, latency: float, images: int):
+        self._latency = latency
+        self._images = images
+        self.requests = 0
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Filters, Owners):
+        page_size = 1000
+        for start in range(0, self._images, page_size):
+            self.requests += 1
+            time.sleep(self._latency)
+            yield {"Images": [
+                {
+                    "ImageId": f"ami-{i:08x}",
+                    "Name": f"amazon-linux-2-{'web' if i % 2 else 'test'}-{i}",
+                    "CreationDate": f"2023-01-01T00:00:{i % 60:02d}.000Z",
+                }
+                for i in range(start, min(start + page_size, self._images))
+            ]}
+
+
+def synth(account: str) -> float:
+    started = time.perf_counter()
+    app = core.App(outdir=tempfile.mkdtemp(prefix="cdk-bench-"))
+    # resolve all patterns and regions in one batched pass,
+    # get_latest_linux_ami_from_aws below reads them from the cache
+    utils.describe_latest_amis(PATTERNS, REGIONS)
+    for region in REGIONS:
+        stack = core.Stack(app, f"AmiCacheBench-{region}",
+                           env=core.Environment(account=account, region=region))
+        for i, pattern in enumerate(PATTERNS):
+            ec2.LaunchTemplate(
+                stack, f"LT-{region}-{i}",
+                machine_image=utils.get_latest_linux_ami_from_aws(pattern, region)
+            )
+    app.synth()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per describe_images page")
+    parser.add_argument("--images", type=int, default=2000, help="images returned per request")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    client = FakeEC2Client(args.latency, args.images)
+    utils._ec2_client = lambda region=None: client
+    account = "123456789012"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "cdk.lookups.json")
+        os.environ["CDK_LOOKUP_CACHE"] = cache_path
+        cold = []
+        for _ in range(args.runs):
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            cold.append(synth(account))
+        cold_requests = client.requests
+        warm = [synth(account) for _ in range(args.runs)]
+
+    print(f"{'cache':<6} {'median, s':>10} {'min, s':>8} {'requests':>9}")
+    print(f"{'cold':<6} {statistics.median(cold):>10.3f} {min(cold):>8.3f} {cold_requests // args.runs:>9}")
+    print(f"{'warm':<6} {statistics.median(warm):>10.3f} {min(warm):>8.3f} {(client.requests - cold_requests) // args.runs:>9}")
+
+
+if __name__ == "__main__":
+    main()
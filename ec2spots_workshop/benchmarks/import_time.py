@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+    Import time of the lib package for every app entry point (python -X importtime).
+
+    $ python benchmarks/import_time.py
+    $ python benchmarks/import_time.py --top 15 --runs 3
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# the same names the apps in main/workshope_ec2_spot/* import from lib
+ENTRY_POINTS = {
+    "ec2_spot": "from lib import utils, EC2Props, EnvProps, WorkshopEC2SpotStack, TTLProps, ttl_termination_stack_factory",
+    "web_asg": "from lib import WebAsgProps, WorkshopWebAsgStack, ttl_termination_stack_factory, TTLProps, utils",
+    "ecs": "from lib import ECSProps, EnvProps, ClusterProps, WorkshopECSStack, WorkshopEnvStask, "
+           "WorkshopServiceStack, ttl_termination_stack_factory, TTLProps, utils",
+}
+
+WATCHED = ("total", "aws_cdk", "lib", "boto3", "requests")
+
+
+def importtime(statement: str) -> dict:
+    """
+        Run the statement in a fresh interpreter and return
+        summary (total, per package, own time of lib modules) and
+        module -> cumulative import time, in microseconds
+    """
+    env = dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True, check=True
+    )
+    modules = {}
+    summary = {"total": 0, "lib": 0}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time:   self [us] | cumulative | imported package (indent is nesting)
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        if not name.startswith("  "):
+            summary["total"] += int(cumulative_us)
+        name = name.strip()
+        modules[name] = int(cumulative_us)
+        if name == "lib" or name.startswith("lib."):
+            summary["lib"] += int(self_us)
+        elif "." not in name:
+            summary[name] = int(cumulative_us)
+    return summary, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="show the slowest N lib modules")
+    args = parser.parse_args()
+
+    print(f"{'entry point':<10} " + " ".join(f"{name + ', ms':>14}" for name in WATCHED))
+    for entry_point, statement in ENTRY_POINTS.items():
+        runs = [importtime(statement) for _ in range(args.runs)]
+        row = []
+        for name in WATCHED:
+            values = [packages.get(name, 0) / 1000 for packages, _ in runs]
+            row.append(f"{statistics.median(values):>14.1f}")
+        print(f"{entry_point:<10} " + " ".join(row))
+        if args.top:
+            _, modules = runs[-1]
+            lib_modules = sorted(
+                ((us, name) for name, us in modules.items() if name.startswith("lib")), reverse=True)
+            for us, name in lib_modules[:args.top]:
+                print(f"    {name:<40} {us / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
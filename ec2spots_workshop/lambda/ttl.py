@@ -1,33 +1,168 @@
-import boto3
 import os
 import json
+import time
+import datetime
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from ttl_waves import dependency_blockers, deletion_waves
+from ttl_common import WAIT_DELAY, emit_metrics, get_client, run_all, with_backoff
+from ttl_discovery import ACTIVE_STACK_STATUSES, cached_scan, expired_stacks
+from ttl_idle import idle_or_expired
+from ttl_drain import drain_stack
 LOG = logging.getLogger()
 LOG.setLevel(logging.INFO)
 
+# DELETE_FAILED stacks are deleted again this many times, the resources which failed are retained
+DELETE_RETRIES = int(os.environ.get("DELETE_RETRIES", 1))
 
-def delete_stack(stack_name: str) -> dict:
+# drain phase (ttl_drain.py): ECS services and ASGs of a stack are scaled to zero before delete_stack
+DRAIN = os.environ.get("DRAIN", "").lower() in ("1", "true", "yes")
+
+# idle mode (ttl_idle.py, IDLE_WINDOW minutes): a stack is deleted when its ALBs, ASGs and ECS services
+# were idle for the window, HARD_TTL minutes after its creation at the latest
+IDLE_WINDOW = int(os.environ.get("IDLE_WINDOW", 0))
+HARD_TTL = int(os.environ.get("HARD_TTL", 0))
+
+# seconds kept back from the lambda timeout, the rest of the work goes to a follow-up invocation
+TIME_MARGIN = int(os.environ.get("TIME_MARGIN", 60))
+MAX_CONTINUATIONS = int(os.environ.get("MAX_CONTINUATIONS", 10))
+
+# stacks which are there to be deleted, DELETE_COMPLETE ones are history
+EXISTING_STACK_STATUSES = ACTIVE_STACK_STATUSES + [
+    "CREATE_IN_PROGRESS", "DELETE_IN_PROGRESS", "ROLLBACK_IN_PROGRESS", "REVIEW_IN_PROGRESS",
+    "UPDATE_IN_PROGRESS", "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_ROLLBACK_IN_PROGRESS", "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS",
+    "IMPORT_IN_PROGRESS", "IMPORT_ROLLBACK_IN_PROGRESS",
+]
+
+
+def stack_names_env() -> list:
+    # STACK_NAMES without empty names, "" has no stacks
+    return [name for name in os.environ.get("STACK_NAMES", "").split(",") if name]
+
+
+def regions() -> list:
+    # REGIONS of the TTL construct, the own region of the function by default
+    return [region for region in os.environ.get("REGIONS", "").split(",") if region] or [None]
+
+
+def delete_stack(stack_name: str, region: str=None, expires_at: datetime.datetime=None) -> dict:
+    started = time.monotonic()
+    metrics = {}
+    if expires_at is not None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        metrics["ExpiryLag"] = round((now - expires_at).total_seconds(), 3)
     try:
-        cfn = boto3.client("cloudformation")
-        cfn.delete_stack(
-            StackName=stack_name,
-            # OnFailure='ROLLBACK',
-            # RetainResources=False
-        )
+        cfn = get_client("cloudformation", region)
+        with_backoff(cfn.delete_stack, StackName=stack_name)
         status_code = 200
         body = f'stack \'{stack_name}\' was deleted successfully'
     except Exception as ex:
         status_code = 500
-        body = f'a try to delete stack \'{stack_name}\' was faield'
+        body = f'a try to delete stack \'{stack_name}\' was faield: {ex}'
         LOG.error(ex)
-    finally:
-        LOG.debug(f"returning response status_code {status_code}")
-        return {
-            'statusCode' : status_code,
-            'body': body
-        }
-    
+    metrics["DeleteStackDuration"] = round((time.monotonic() - started) * 1000, 3)
+    emit_metrics(metrics, StackName=stack_name, Region=region, StatusCode=status_code)
+    LOG.debug(f"returning response status_code {status_code}")
+    return {
+        'statusCode' : status_code,
+        'body': body
+    }
+
+
+def failed_resources(stack_name: str, region: str=None) -> list:
+    """
+        Logical ids of the resources which block the deletion of a DELETE_FAILED stack
+    """
+    pages = get_client("cloudformation", region).get_paginator("list_stack_resources").paginate(StackName=stack_name)
+    return [
+        resource["LogicalResourceId"]
+        for page in pages for resource in page["StackResourceSummaries"]
+        if resource["ResourceStatus"] == "DELETE_FAILED"
+    ]
+
+
+def wait_stack_deleted(stack_name: str, deadline: float, region: str=None) -> dict:
+    """
+        Poll the stack until it's gone, a stack which doesn't exist counts as deleted.
+        DELETE_FAILED is deleted again with its failed resources retained (DELETE_RETRIES),
+        a stack still deleted at the deadline (time.monotonic()) is pending: 202
+    """
+    cfn = get_client("cloudformation", region)
+    retries = 0
+    try:
+        while True:
+            try:
+                stacks = with_backoff(cfn.describe_stacks, StackName=stack_name)["Stacks"]
+            except cfn.exceptions.ClientError as ex:
+                if "does not exist" not in str(ex):
+                    raise
+                stacks = []
+            status = stacks[0]["StackStatus"] if stacks else "DELETE_COMPLETE"
+            if status == "DELETE_COMPLETE":
+                return {'statusCode': 200, 'body': f'stack \'{stack_name}\' was deleted successfully'}
+            if status == "DELETE_FAILED":
+                if retries >= DELETE_RETRIES:
+                    reason = stacks[0].get("StackStatusReason", status)
+                    return {'statusCode': 500, 'body': f'stack \'{stack_name}\' was not deleted: {reason}'}
+                retain = failed_resources(stack_name, region)
+                LOG.warning(f"{stack_name} is DELETE_FAILED, delete it again and retain {retain}")
+                with_backoff(cfn.delete_stack, StackName=stack_name, RetainResources=retain)
+                retries += 1
+            if time.monotonic() + WAIT_DELAY > deadline:
+                return {'statusCode': 202, 'body': f'stack \'{stack_name}\' is still being deleted'}
+            time.sleep(WAIT_DELAY)
+    except Exception as ex:
+        LOG.error(ex)
+        return {'statusCode': 500, 'body': f'stack \'{stack_name}\' was not deleted: {ex}'}
+
+
+def existing_stacks(stack_names: list, region: str=None) -> list:
+    """
+        Stacks of stack_names which exist in the region, STACK_NAMES are the same for every region
+    """
+    names = set(stack_names)
+    pages = get_client("cloudformation", region).get_paginator("list_stacks").paginate(
+        StackStatusFilter=EXISTING_STACK_STATUSES)
+    found = {summary["StackName"] for page in pages for summary in page["StackSummaries"] if summary["StackName"] in names}
+    return [name for name in stack_names if name in found]
+
+
+def _stack_name(stack_id: str) -> str:
+    # arn:aws:cloudformation:<region>:<account>:stack/<name>/<uuid>
+    return stack_id.split("/")[1] if stack_id.startswith("arn:") else stack_id
+
+
+def stack_blockers(stack_names: list, region: str=None) -> dict:
+    """
+        stack -> stacks which have to be deleted before it.
+        Dependencies come from synth (STACK_DEPENDENCIES, stack -> stacks it depends on)
+        and from CloudFormation exports: an importing stack blocks the exporting one.
+    """
+    names = set(stack_names)
+    blockers = dependency_blockers(stack_names, json.loads(os.environ.get("STACK_DEPENDENCIES", "{}")))
+
+    cfn = get_client("cloudformation", region)
+    for page in cfn.get_paginator("list_exports").paginate():
+        for export in page["Exports"]:
+            exporter = _stack_name(export["ExportingStackId"])
+            if exporter not in names:
+                continue
+            try:
+                pages = cfn.get_paginator("list_imports").paginate(ExportName=export["Name"])
+                importers = [_stack_name(name) for page in pages for name in page["Imports"]]
+            except cfn.exceptions.ClientError:
+                # 'Export ... is not imported by any stack'
+                importers = []
+            for importer in importers:
+                if importer in names:
+                    blockers[exporter].add(importer)
+                else:
+                    LOG.warning(f"{importer} imports {export['Name']} of {exporter}, it isn't deleted by TTL")
+    return blockers
+
+
 def say_hello(stack_name: str) -> str:
     body = f'Hello {stack_name}'
     return {
@@ -39,25 +174,186 @@ def say_hello(stack_name: str) -> str:
     }
 
 
+def _event_expiry(event):
+    """
+        Scheduled expiry of the invocation: 'expires_at' of an at() schedule.
+        The 'time' of a rate rule is its firing time, not an expiry, there is no ExpiryLag then
+    """
+    if not isinstance(event, dict):
+        return None
+    value = event.get("expires_at")
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        LOG.warning(f"Wrong expiry time {value} in the event")
+        return None
+
+
+def reap_region(region: str, event, deadline: float) -> (int, list, int, int, list, list):
+    """
+        Delete expired stacks of one region wave by wave until the deadline (time.monotonic()),
+        returns (status code, bodies, deleted stacks, failed stacks, pending stacks, kept stacks)
+    """
+    ttl_stack = os.environ.get("TTL_STACK_NAME")
+    continued = isinstance(event, dict) and "pending" in event
+    if continued:
+        # follow-up invocation, only the stacks left by the previous one
+        stack_names = event["pending"].get(region or "", [])
+    elif stack_names_env():
+        stack_names = stack_names_env()
+    else:
+        stack_names = expired_stacks(region=region)
+    if isinstance(event, dict) and event.get("stack_names"):
+        # one-shot expiry schedule of some of the stacks (TTL mode 'at')
+        stack_names = [name for name in stack_names if name in event["stack_names"]]
+    # the TTL stack removes the function itself, handler deletes it after all regions
+    stack_names = [name for name in stack_names if name != ttl_stack]
+    missing = []
+    if stack_names and not continued and stack_names_env():
+        # the stacks of a follow-up invocation existed, gone ones are deleted by the previous one
+        existing = existing_stacks(stack_names, region)
+        missing = [name for name in stack_names if name not in existing]
+        stack_names = existing
+
+    # expiry of every stack: its TTL tag (discovery), otherwise the schedule of the event
+    scan = cached_scan(region)
+    expiry = dict(scan["stacks"]) if scan is not None and not continued else {}
+    event_expiry = None if continued else _event_expiry(event)
+
+    blockers = stack_blockers(stack_names, region) if stack_names else {}
+    kept = []
+    if IDLE_WINDOW and stack_names_env() and not continued and stack_names:
+        selected = idle_or_expired(stack_names, blockers, IDLE_WINDOW, HARD_TTL, region)
+        kept = [name for name in stack_names if name not in selected]
+        stack_names = selected
+
+    waves = deletion_waves(stack_names, blockers) if stack_names else []
+    LOG.info(f"delete stacks in {region or 'own region'} in waves {waves}...\n")
+    status_code = 200
+    body = [f'stack \'{name}\' doesn\'t exist' for name in missing]
+    body += [f'stack \'{name}\' is kept, it is not idle' for name in kept]
+    deleted = failed = 0
+    pending = []
+    for number, wave in enumerate(waves):
+        if time.monotonic() >= deadline:
+            pending = [name for later in waves[number:] for name in later]
+            break
+        if DRAIN:
+            run_all(lambda stack_name: drain_stack(stack_name, deadline, region), wave)
+        results = run_all(
+            lambda stack_name: delete_stack(
+                stack_name=stack_name, region=region, expires_at=expiry.get(stack_name, event_expiry)),
+            wave
+        )
+        started = [name for name, result in zip(wave, results) if result.get("statusCode") == 200]
+        if started:
+            waited = dict(zip(started, run_all(lambda name: wait_stack_deleted(name, deadline, region), started)))
+            results = [waited.get(name, result) for name, result in zip(wave, results)]
+        body.extend(result.get("body") for result in results)
+        deleted += sum(result.get("statusCode") == 200 for result in results)
+        failed += sum(result.get("statusCode") == 500 for result in results)
+        if any(result.get("statusCode") == 500 for result in results):
+            status_code = 500
+            skipped = [name for later in waves[number + 1:] for name in later]
+            body.extend(f'stack \'{name}\' was skipped, a stack which depends on it is not deleted' for name in skipped)
+            break
+        if any(result.get("statusCode") == 202 for result in results):
+            # out of time, the follow-up invocation waits for them and goes on
+            pending = [name for name, result in zip(wave, results) if result.get("statusCode") == 202]
+            pending += [name for later in waves[number + 1:] for name in later]
+            break
+
+    # deleted stacks don't come back with the cached scan, after a failure everything is scanned again
+    if scan is not None:
+        for stack_name in stack_names:
+            if stack_name not in pending:
+                scan["stacks"].pop(stack_name, None)
+        if status_code != 200:
+            scan["expires"] = 0.0
+    if region is not None:
+        body = [f"{region}: {line}" for line in body]
+    return status_code, body, deleted, failed, pending, kept
+
+
+def continue_later(event, context, pending: dict) -> bool:
+    """
+        Hand the pending stacks (region -> names) to an asynchronous invocation of this function
+    """
+    number = event.get("continuation", 0) + 1 if isinstance(event, dict) else 1
+    if context is None or number > MAX_CONTINUATIONS:
+        LOG.error(f"Stacks {pending} are left, continuation {number} is not allowed")
+        return False
+    payload = {"pending": pending, "continuation": number}
+    if isinstance(event, dict) and event.get("stack_names"):
+        # the TTL stack is deleted only when it belongs to the schedule
+        payload["stack_names"] = event["stack_names"]
+    with_backoff(
+        get_client("lambda").invoke,
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(payload),
+    )
+    LOG.info(f"Continuation {number} for {pending}")
+    return True
+
+
 def handler(event, context):
     LOG.info(f"Received event: {event}")
     LOG.debug('## ENVIRONMENT VARIABLES')
     LOG.debug(os.environ)
     
+    started = time.monotonic()
+    remaining = context.get_remaining_time_in_millis() / 1000 if context else 900
+    deadline = started + remaining - TIME_MARGIN
+    status_code = 500
+    body = []
+    deleted = failed = 0
+    pending = {}
+    kept = False
     try:
-        stack_names = os.environ["STACK_NAMES"]
-        status_code = 200
-        body = []
-        for stack_name in stack_names.split(","):
-            LOG.info(f"delete stack {stack_name}...\n")
-            result = delete_stack(stack_name=stack_name)
-            if result.get("statusCode") == 500:
+        targets = regions()
+        # regions are independent, every one gets its own thread and clients
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            results = list(executor.map(lambda region: reap_region(region, event, deadline), targets))
+        status_code = 500 if any(result[0] != 200 for result in results) else 200
+        for region, (_, lines, region_deleted, region_failed, region_pending, region_kept) in zip(targets, results):
+            body.extend(lines)
+            kept = kept or bool(region_kept)
+            deleted += region_deleted
+            failed += region_failed
+            if region_pending:
+                pending[region or ""] = region_pending
+
+        if pending:
+            body.extend(f"stack '{name}' is left to a follow-up invocation" for names in pending.values() for name in names)
+            if not continue_later(event, context, pending):
                 status_code = 500
+            elif status_code == 200:
+                status_code = 202
+
+        ttl_stack = os.environ.get("TTL_STACK_NAME")
+        stack_names = stack_names_env()
+        if isinstance(event, dict) and event.get("stack_names"):
+            stack_names = [name for name in stack_names if name in event["stack_names"]]
+        # idle mode: the TTL stack goes with the last busy stack
+        if status_code == 200 and not kept and ttl_stack and ttl_stack in stack_names:
+            # last one, it removes this function
+            result = delete_stack(stack_name=ttl_stack)
             body.append(result.get("body"))
+            deleted += result.get("statusCode") == 200
+            failed += result.get("statusCode") == 500
     except KeyError as ex:
-        LOG.error(f"Error: there is not STACK_NAME variable {ex}")
+        LOG.error(f"Error: there is no {ex} key")
     except Exception as ex:
         LOG.error(f"Error: {ex}")
+    emit_metrics({
+        "InvocationDuration": round((time.monotonic() - started) * 1000, 3),
+        "StacksDeleted": deleted,
+        "StacksFailed": failed,
+        "StacksPending": sum(len(names) for names in pending.values()),
+    }, StatusCode=status_code)
     return {
             'statusCode' : status_code,
             'headers': {
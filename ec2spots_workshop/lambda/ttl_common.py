@@ -0,0 +1,119 @@
+"""
+Clients, retries, metrics and thread pools of the TTL function (ttl.py)
+and its helpers (ttl_discovery.py, ttl_idle.py, ttl_drain.py).
+"""
+import boto3
+import boto3.session
+import os
+import sys
+import json
+import time
+import random
+import threading
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+LOG = logging.getLogger()
+
+# deletions in flight at once, delete_stack only starts the deletion
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 8))
+
+# seconds between describe_stacks calls while a wave is deleted
+WAIT_DELAY = int(os.environ.get("WAIT_DELAY", 15))
+
+# throttled calls are retried with full jitter, sleep random(0, min(cap, base * 2^attempt))
+THROTTLING_ERRORS = {"Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException"}
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", 6))
+BACKOFF_BASE = float(os.environ.get("BACKOFF_BASE", 0.5))
+BACKOFF_CAP = float(os.environ.get("BACKOFF_CAP", 20))
+
+# CloudWatch Embedded Metric Format, the records are printed to the log of the function
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TTL")
+METRIC_UNITS = {
+    "DeleteStackDuration": "Milliseconds",
+    "DrainDuration": "Milliseconds",
+    "ExpiryLag": "Seconds",
+    "InvocationDuration": "Milliseconds",
+    "StacksDeleted": "Count",
+    "StacksFailed": "Count",
+    "StacksPending": "Count",
+}
+
+# created once per container and reused by warm invocations
+_clients = {}
+# clients are thread safe, creating them isn't: regions and deletions run in threads,
+# the clients are created under a lock from one session per region
+_clients_lock = threading.Lock()
+_sessions = {}
+_metrics_lock = threading.Lock()
+
+
+def get_client(service: str, region: str=None):
+    """
+        One client per service and region, None is the region of the function
+    """
+    key = service if region is None else (service, region)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            if key not in _clients:
+                if region not in _sessions:
+                    _sessions[region] = boto3.session.Session(region_name=region)
+                _clients[key] = _sessions[region].client(service)
+            client = _clients[key]
+    return client
+
+
+def emit_metrics(metrics: dict, **properties):
+    """
+        One EMF record, dimension FunctionName, properties are searchable in Logs Insights only
+    """
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["FunctionName"]],
+                "Metrics": [{"Name": name, "Unit": METRIC_UNITS[name]} for name in metrics],
+            }],
+        },
+        "FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local"),
+        **properties,
+        **metrics,
+    }
+    line = json.dumps(record, default=str) + "\n"
+    # deletions run in threads, one record per line
+    with _metrics_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def _error_code(ex: Exception) -> str:
+    return getattr(ex, "response", {}).get("Error", {}).get("Code")
+
+
+def with_backoff(fn, *args, **kwargs):
+    """
+        Call fn, throttling errors are retried with jittered exponential backoff
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as ex:
+            if _error_code(ex) not in THROTTLING_ERRORS or attempt == MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            LOG.warning(f"{_error_code(ex)}, retry in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def waiter_config(deadline: float) -> dict:
+    return {"Delay": WAIT_DELAY, "MaxAttempts": max(1, int((deadline - time.monotonic()) // WAIT_DELAY))}
+
+
+def run_all(fn, items: list) -> list:
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(items))) as executor:
+        # results keep the order of items
+        return list(executor.map(fn, items))
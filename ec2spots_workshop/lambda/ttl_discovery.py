@@ -0,0 +1,88 @@
+"""
+Discovery mode of the TTL function (no STACK_NAMES): stacks with one of these tags expire
+ ttl-expires-at - ISO 8601 time, e.g. 2024-01-01T12:00:00Z
+ ttl-minutes    - minutes after the last update (creation) of the stack
+"""
+import os
+import time
+import datetime
+
+import logging
+from ttl_common import get_client
+LOG = logging.getLogger()
+
+TTL_TAG = os.environ.get("TTL_TAG", "ttl-expires-at")
+TTL_MINUTES_TAG = os.environ.get("TTL_MINUTES_TAG", "ttl-minutes")
+# tagged stacks are scanned again after this time, warm invocations reuse the scan
+DISCOVERY_CACHE_SECONDS = int(os.environ.get("DISCOVERY_CACHE_SECONDS", 300))
+ACTIVE_STACK_STATUSES = [
+    "CREATE_COMPLETE", "CREATE_FAILED", "ROLLBACK_COMPLETE", "ROLLBACK_FAILED",
+    "UPDATE_COMPLETE", "UPDATE_ROLLBACK_COMPLETE", "UPDATE_ROLLBACK_FAILED",
+    "DELETE_FAILED", "IMPORT_COMPLETE", "IMPORT_ROLLBACK_COMPLETE",
+]
+
+# region -> last scan of tagged stacks
+_discovery = {}
+
+
+def _expires_at(tags: dict, summary: dict):
+    if TTL_TAG in tags:
+        return datetime.datetime.fromisoformat(tags[TTL_TAG].replace("Z", "+00:00"))
+    if TTL_MINUTES_TAG in tags:
+        updated = summary.get("LastUpdatedTime") or summary["CreationTime"]
+        return updated + datetime.timedelta(minutes=int(tags[TTL_MINUTES_TAG]))
+    return None
+
+
+def cached_scan(region: str=None):
+    """
+        Last scan of the region: {"expires": time.monotonic() of the next scan, "stacks": name -> expiry},
+        None before the first one
+    """
+    return _discovery.get(region)
+
+
+def discover_stacks(region: str=None) -> dict:
+    """
+        stack name -> expiry time of every active stack with a TTL tag.
+        Tags are filtered on the server side (resourcegroupstaggingapi), statuses by list_stacks,
+        both paginated. The result is kept for DISCOVERY_CACHE_SECONDS.
+    """
+    scan = _discovery.get(region)
+    if scan is not None and scan["expires"] > time.monotonic():
+        return scan["stacks"]
+
+    tagging = get_client("resourcegroupstaggingapi", region)
+    tagged = {}
+    for tag_key in (TTL_TAG, TTL_MINUTES_TAG):
+        pages = tagging.get_paginator("get_resources").paginate(
+            TagFilters=[{"Key": tag_key}], ResourceTypeFilters=["cloudformation:stack"])
+        for page in pages:
+            for resource in page["ResourceTagMappingList"]:
+                tags = {tag["Key"]: tag["Value"] for tag in resource["Tags"]}
+                tagged.setdefault(resource["ResourceARN"], {}).update(tags)
+
+    stacks = {}
+    if tagged:
+        pages = get_client("cloudformation", region).get_paginator("list_stacks").paginate(
+            StackStatusFilter=ACTIVE_STACK_STATUSES)
+        for page in pages:
+            for summary in page["StackSummaries"]:
+                tags = tagged.get(summary["StackId"])
+                if tags is None:
+                    continue
+                try:
+                    expires_at = _expires_at(tags, summary)
+                except ValueError as ex:
+                    LOG.error(f"Wrong TTL tag of {summary['StackName']}: {ex}")
+                    continue
+                if expires_at is not None:
+                    stacks[summary["StackName"]] = expires_at
+    LOG.info(f"Found {len(stacks)} stacks with TTL tags in {region or 'own region'}")
+    _discovery[region] = {"expires": time.monotonic() + DISCOVERY_CACHE_SECONDS, "stacks": stacks}
+    return stacks
+
+
+def expired_stacks(now: datetime.datetime=None, region: str=None) -> list:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return sorted(name for name, expires_at in discover_stacks(region).items() if expires_at <= now)
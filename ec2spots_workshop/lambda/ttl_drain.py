@@ -0,0 +1,115 @@
+"""
+Drain phase of the TTL function (DRAIN): ECS services of a stack are scaled to zero before delete_stack,
+then its ASGs, CloudFormation doesn't wait for tasks and Spot instances to drain one by one then.
+"""
+import time
+
+import logging
+from ttl_common import WAIT_DELAY, emit_metrics, get_client, run_all, waiter_config, with_backoff
+LOG = logging.getLogger()
+
+
+def drain_targets(stack_name: str, region: str=None) -> (list, list, list):
+    """
+        (ASG names, (cluster, service ARN) pairs, capacity provider names) of the stack
+    """
+    pages = get_client("cloudformation", region).get_paginator("list_stack_resources").paginate(StackName=stack_name)
+    asgs, services, capacity_providers = [], [], []
+    for page in pages:
+        for resource in page["StackResourceSummaries"]:
+            physical_id = resource.get("PhysicalResourceId")
+            if not physical_id or resource["ResourceStatus"].startswith("DELETE"):
+                continue
+            if resource["ResourceType"] == "AWS::AutoScaling::AutoScalingGroup":
+                asgs.append(physical_id)
+            elif resource["ResourceType"] == "AWS::ECS::CapacityProvider":
+                capacity_providers.append(physical_id)
+            elif resource["ResourceType"] == "AWS::ECS::Service":
+                # arn:aws:ecs:<region>:<account>:service/<cluster>/<service>
+                parts = physical_id.split(":")[-1].split("/")
+                if len(parts) == 3:
+                    services.append((parts[1], physical_id))
+                else:
+                    LOG.warning(f"Service {physical_id} has an old ARN format without cluster, not drained")
+    return asgs, services, capacity_providers
+
+
+def drain_service(cluster: str, service: str, deadline: float, region: str=None):
+    """
+        Scale the service to zero and wait until it has no running and pending tasks
+    """
+    ecs = get_client("ecs", region)
+    with_backoff(ecs.update_service, cluster=cluster, service=service, desiredCount=0)
+    while True:
+        described = with_backoff(ecs.describe_services, cluster=cluster, services=[service])["services"]
+        if not described or described[0]["runningCount"] + described[0].get("pendingCount", 0) == 0:
+            return
+        if time.monotonic() + WAIT_DELAY >= deadline:
+            raise TimeoutError(f"Service {service} still has {described[0]['runningCount']} running tasks")
+        time.sleep(WAIT_DELAY)
+
+
+def stop_managed_scaling(name: str, region: str=None):
+    """
+        Managed scaling of a capacity provider sets the desired capacity of its ASG
+        and its termination protection keeps instances with tasks, both are turned off
+        before the ASG is scaled to zero
+    """
+    with_backoff(
+        get_client("ecs", region).update_capacity_provider,
+        name=name,
+        autoScalingGroupProvider={
+            "managedScaling": {"status": "DISABLED"},
+            "managedTerminationProtection": "DISABLED",
+        }
+    )
+
+
+def drain_asg(name: str, deadline: float, region: str=None):
+    autoscaling = get_client("autoscaling", region)
+    groups = with_backoff(autoscaling.describe_auto_scaling_groups, AutoScalingGroupNames=[name])["AutoScalingGroups"]
+    if not groups:
+        return
+    instances = groups[0]["Instances"]
+    # ECS capacity providers protect their instances from scale in (managed termination protection)
+    protected = [instance["InstanceId"] for instance in instances if instance.get("ProtectedFromScaleIn")]
+    for start in range(0, len(protected), 50):
+        with_backoff(
+            autoscaling.set_instance_protection,
+            AutoScalingGroupName=name, InstanceIds=protected[start:start + 50], ProtectedFromScaleIn=False
+        )
+    with_backoff(
+        autoscaling.update_auto_scaling_group,
+        AutoScalingGroupName=name, MinSize=0, MaxSize=0, DesiredCapacity=0
+    )
+    if instances:
+        get_client("ec2", region).get_waiter("instance_terminated").wait(
+            InstanceIds=[instance["InstanceId"] for instance in instances],
+            WaiterConfig=waiter_config(deadline)
+        )
+
+
+def drain_stack(stack_name: str, deadline: float, region: str=None) -> bool:
+    """
+        Scale ECS services of the stack to zero and wait until their tasks are gone, then turn off
+        managed scaling of its capacity providers and scale its ASGs to zero.
+        A failed drain is logged only, the stack is deleted anyway
+    """
+    started = time.monotonic()
+    try:
+        asgs, services, capacity_providers = drain_targets(stack_name, region)
+        if services or asgs:
+            LOG.info(f"Drain {stack_name}: services {services}, capacity providers {capacity_providers}, ASGs {asgs}")
+        # tasks of the services would be stopped by the scale in of their instances otherwise
+        run_all(lambda target: drain_service(*target, deadline, region), services)
+        run_all(lambda name: stop_managed_scaling(name, region), capacity_providers)
+        run_all(lambda name: drain_asg(name, deadline, region), asgs)
+        drained = True
+    except Exception as ex:
+        LOG.warning(f"Drain of {stack_name} failed, it's deleted anyway: {ex}")
+        drained = False
+    emit_metrics(
+        {"DrainDuration": round((time.monotonic() - started) * 1000, 3)},
+        StackName=stack_name, Region=region, Drained=drained
+    )
+    return drained
@@ -0,0 +1,127 @@
+"""
+Idle mode of the TTL function (IDLE_WINDOW): a stack is deleted when its ALBs, ASGs and ECS services
+were idle for the window, HARD_TTL minutes after its creation at the latest.
+"""
+import os
+import datetime
+
+import logging
+from ttl_common import get_client, run_all
+from ttl_discovery import ACTIVE_STACK_STATUSES
+LOG = logging.getLogger()
+
+# busy: a CPU maximum or a number of ALB requests per period above these
+IDLE_CPU = float(os.environ.get("IDLE_CPU", 5))
+IDLE_REQUESTS = float(os.environ.get("IDLE_REQUESTS", 0))
+METRIC_PERIOD = 300
+# queries of one GetMetricData call
+MAX_METRIC_QUERIES = 500
+
+
+def activity_metrics(stack_name: str, region: str=None) -> list:
+    """
+        (namespace, metric, dimensions, statistic, busy threshold) of the ALBs, ASGs and ECS services of the stack
+    """
+    pages = get_client("cloudformation", region).get_paginator("list_stack_resources").paginate(StackName=stack_name)
+    metrics = []
+    for page in pages:
+        for resource in page["StackResourceSummaries"]:
+            physical_id = resource.get("PhysicalResourceId")
+            if not physical_id:
+                continue
+            if resource["ResourceType"] == "AWS::ElasticLoadBalancingV2::LoadBalancer" and ":loadbalancer/app/" in physical_id:
+                # arn:aws:elasticloadbalancing:<region>:<account>:loadbalancer/app/<name>/<id>
+                dimensions = {"LoadBalancer": physical_id.split(":loadbalancer/")[1]}
+                metrics.append(("AWS/ApplicationELB", "RequestCount", dimensions, "Sum", IDLE_REQUESTS))
+            elif resource["ResourceType"] == "AWS::AutoScaling::AutoScalingGroup":
+                dimensions = {"AutoScalingGroupName": physical_id}
+                metrics.append(("AWS/EC2", "CPUUtilization", dimensions, "Maximum", IDLE_CPU))
+            elif resource["ResourceType"] == "AWS::ECS::Service":
+                parts = physical_id.split(":")[-1].split("/")
+                if len(parts) == 3:
+                    dimensions = {"ClusterName": parts[1], "ServiceName": parts[2]}
+                    metrics.append(("AWS/ECS", "CPUUtilization", dimensions, "Maximum", IDLE_CPU))
+    return metrics
+
+
+def idle_stacks(stack_names: list, window: int, region: str=None, now: datetime.datetime=None) -> (set, set):
+    """
+        (stacks without activity for window minutes, stacks without activity metrics).
+        Metrics of all the stacks are read by one batched GetMetricData call
+        (MAX_METRIC_QUERIES queries each). No data points - no activity.
+        A stack without ALBs, ASGs and ECS services is neither idle nor busy, it's unknown.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    queries = []
+    owners = {}
+    unknown = set()
+    for stack_name, metrics in zip(stack_names, run_all(lambda name: activity_metrics(name, region), stack_names)):
+        if not metrics:
+            unknown.add(stack_name)
+        for namespace, metric, dimensions, statistic, threshold in metrics:
+            query_id = f"m{len(queries)}"
+            queries.append({
+                "Id": query_id,
+                "MetricStat": {
+                    "Metric": {
+                        "Namespace": namespace,
+                        "MetricName": metric,
+                        "Dimensions": [{"Name": key, "Value": value} for key, value in dimensions.items()],
+                    },
+                    "Period": METRIC_PERIOD,
+                    "Stat": statistic,
+                },
+                "ReturnData": True,
+            })
+            owners[query_id] = (stack_name, threshold)
+
+    busy = set()
+    paginator = get_client("cloudwatch", region).get_paginator("get_metric_data")
+    for offset in range(0, len(queries), MAX_METRIC_QUERIES):
+        pages = paginator.paginate(
+            MetricDataQueries=queries[offset:offset + MAX_METRIC_QUERIES],
+            StartTime=now - datetime.timedelta(minutes=window),
+            EndTime=now,
+        )
+        for page in pages:
+            for result in page["MetricDataResults"]:
+                stack_name, threshold = owners[result["Id"]]
+                if any(value > threshold for value in result["Values"]):
+                    busy.add(stack_name)
+    LOG.info(f"Busy stacks {sorted(busy)}, stacks without activity metrics {sorted(unknown)} of {stack_names}")
+    return set(stack_names) - busy - unknown, unknown
+
+
+def idle_or_expired(stack_names: list, blockers: dict, window: int, hard_ttl: int=0,
+                    region: str=None, now: datetime.datetime=None) -> list:
+    """
+        Stacks older than hard_ttl or idle for window (minutes). A stack stays while a stack
+        which depends on it stays. Stacks without activity metrics (VPC, buckets ...) go with
+        their dependents, a stack without metrics and dependents stays until hard_ttl.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    names = set(stack_names)
+    pages = get_client("cloudformation", region).get_paginator("list_stacks").paginate(
+        StackStatusFilter=ACTIVE_STACK_STATUSES)
+    created = {
+        summary["StackName"]: summary["CreationTime"]
+        for page in pages for summary in page["StackSummaries"] if summary["StackName"] in names
+    }
+    # stacks which are gone already are deleted again, it's a no-op
+    selected = names - set(created)
+    if hard_ttl:
+        selected |= {name for name, created_at in created.items() if now - created_at >= datetime.timedelta(minutes=hard_ttl)}
+    settled = [name for name in stack_names if name in created and now - created[name] >= datetime.timedelta(minutes=window)]
+    if settled:
+        idle, unknown = idle_stacks(settled, window, region, now)
+        selected |= idle
+        selected |= {name for name in unknown if blockers.get(name)}
+
+    kept = names - selected
+    while True:
+        blocked = {name for name in selected if blockers.get(name, set()) & kept}
+        if not blocked:
+            break
+        selected -= blocked
+        kept |= blocked
+    return [name for name in stack_names if name in selected]
@@ -0,0 +1,84 @@
+import boto3
+import os
+import json
+import datetime
+
+import logging
+LOG = logging.getLogger()
+LOG.setLevel(logging.INFO)
+
+# created once per container and reused by warm invocations
+_clients = {}
+
+
+def get_client(service: str):
+    if service not in _clients:
+        _clients[service] = boto3.client(service)
+    return _clients[service]
+
+
+def expiry(ttl: int, now: datetime.datetime=None) -> datetime.datetime:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now + datetime.timedelta(minutes=int(ttl))
+
+
+def deadline(ttl: int, now: datetime.datetime=None) -> str:
+    """
+        at() expression for now + ttl minutes, UTC
+    """
+    return f"at({expiry(ttl, now).strftime('%Y-%m-%dT%H:%M:%S')})"
+
+
+def put_schedule(props: dict) -> str:
+    """
+        One-shot schedule which invokes the TTL function once and deletes itself
+    """
+    scheduler = get_client("scheduler")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    schedule = dict(
+        Name=props["ScheduleName"],
+        ScheduleExpression=deadline(props["Ttl"], now),
+        ScheduleExpressionTimezone="UTC",
+        FlexibleTimeWindow={"Mode": "OFF"},
+        ActionAfterCompletion="DELETE",
+        Target={
+            "Arn": props["TargetArn"],
+            "RoleArn": props["RoleArn"],
+            # expires_at - the TTL lambda reports the lag between expiry and deletion
+            "Input": json.dumps({
+                "stack_names": props["StackNames"],
+                "expires_at": expiry(props["Ttl"], now).isoformat(),
+            }),
+        },
+    )
+    try:
+        scheduler.create_schedule(**schedule)
+    except scheduler.exceptions.ConflictException:
+        scheduler.update_schedule(**schedule)
+    LOG.info(f"Schedule {props['ScheduleName']} {schedule['ScheduleExpression']} for {props['StackNames']}")
+    return schedule["ScheduleExpression"]
+
+
+def delete_schedule(name: str):
+    scheduler = get_client("scheduler")
+    try:
+        scheduler.delete_schedule(Name=name)
+    except scheduler.exceptions.ResourceNotFoundException:
+        # fired and deleted itself already
+        pass
+
+
+def handler(event, context):
+    """
+        Custom resource (custom_resources.Provider) which registers the expiry schedule on deploy
+    """
+    LOG.info(f"Received event: {event}")
+    props = event["ResourceProperties"]
+    request_type = event["RequestType"]
+    if request_type == "Delete":
+        delete_schedule(event["PhysicalResourceId"])
+        return {"PhysicalResourceId": event["PhysicalResourceId"]}
+    if request_type == "Update" and event["PhysicalResourceId"] != props["ScheduleName"]:
+        delete_schedule(event["PhysicalResourceId"])
+    expression = put_schedule(props)
+    return {"PhysicalResourceId": props["ScheduleName"], "Data": {"ScheduleExpression": expression}}
@@ -0,0 +1,41 @@
+"""
+Deletion order of TTL stacks, shared by the TTL function (ttl.py) and the
+Step Functions orchestrator, which computes the waves at synth (lib/ttl_orchestrator.py).
+No AWS calls here.
+"""
+import logging
+
+LOG = logging.getLogger()
+
+
+def dependency_blockers(stack_names: list, dependencies: dict) -> dict:
+    """
+        stack -> stacks which have to be deleted before it,
+        dependencies: stack -> stacks it depends on, stacks outside stack_names are ignored
+    """
+    names = set(stack_names)
+    blockers = {name: set() for name in stack_names}
+    for stack_name, depends_on in dependencies.items():
+        for dependency in depends_on:
+            if stack_name in names and dependency in names:
+                blockers[dependency].add(stack_name)
+    return blockers
+
+
+def deletion_waves(stack_names: list, blockers: dict) -> list:
+    """
+        Topological order as waves, stacks of one wave don't depend on each other.
+        Stacks of a dependency cycle are deleted together in one wave.
+    """
+    remaining = list(stack_names)
+    deleted = set()
+    waves = []
+    while remaining:
+        wave = [name for name in remaining if not (blockers.get(name, set()) - deleted - {name})]
+        if not wave:
+            LOG.error(f"Dependency cycle between {remaining}, delete them together")
+            wave = remaining
+        waves.append(wave)
+        deleted.update(wave)
+        remaining = [name for name in remaining if name not in deleted]
+    return waves
@@ -1,16 +1,45 @@
-from .base_network import BaseNetwork
-from .ec2_spot import EC2Spot, EC2Props
-from .props import WebAsgProps, ECSProps, EnvProps, ClusterProps
-from .ttl import TTLProps, ttl_termination_stack_factory
-from .web_asg import WebAsg
-from .utils import *
-from .work_shop_ec2_spot_stack import (
-    WorkshopEC2SpotStack
-    , WorkshopWebAsgStack
-    , WorkshopECSStack
-    , WorkshopEnvStask
-    , WorkshopServiceStack
-)
+"""
+    Names are loaded on first access (PEP 562), so an app imports only
+    the modules it uses, e.g. `from lib import EC2Spot` doesn't load ECS or WebAsg.
+    The Workshop*Stack classes import their constructs when they are created.
+    Public names of utils are re-exported as before (`from .utils import *`).
+"""
+import warnings
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'BaseNetwork': 'base_network',
+    'EC2Spot': 'ec2_spot',
+    'EC2Props': 'ec2_spot',
+    'WebAsg': 'web_asg',
+    'WebAsgProps': 'props',
+    'ECSProps': 'props',
+    'EnvProps': 'props',
+    'ClusterProps': 'props',
+    'SubnetTier': 'props',
+    'NAT_SINGLE': 'props',
+    'NAT_PER_AZ': 'props',
+    'SharedNetwork': 'shared_network',
+    'SharedNetworkStack': 'work_shop_ec2_spot_stack',
+    'TTLProps': 'ttl',
+    'ttl_termination_stack_factory': 'ttl',
+    'TTL_MODE_RATE': 'ttl',
+    'TTL_MODE_AT': 'ttl',
+    'TTL_METRICS_NAMESPACE': 'ttl',
+    'ttl_tag_stacks': 'ttl',
+    'WorkshopEC2SpotStack': 'work_shop_ec2_spot_stack',
+    'WorkshopWebAsgStack': 'work_shop_ec2_spot_stack',
+    'WorkshopECSStack': 'work_shop_ec2_spot_stack',
+    'WorkshopEnvStask': 'work_shop_ec2_spot_stack',
+    'WorkshopServiceStack': 'work_shop_ec2_spot_stack',
+    # utils
+    'add_tags': 'utils',
+    'get_current_env': 'utils',
+    'get_my_external_ip': 'utils',
+    'get_latest_linux_ami_from_aws': 'utils',
+    'get_linux_ami_from_ssm': 'utils',
+    'describe_latest_amis': 'utils',
+}
 
 __all__ = [
     'BaseNetwork',
@@ -19,7 +48,7 @@ __all__ = [
     'WebAsg',
     'WebAsgProps',
     'ECSProps',
-    'EnvProps', 'ClusterProps',
+    'EnvProps', 'ClusterProps', 'SubnetTier',
     'TTLProps',
     'ttl_termination_stack_factory',
     'WorkshopEC2SpotStack',
@@ -27,5 +56,32 @@ __all__ = [
     'WorkshopECSStack',
     'WorkshopEnvStask',
     'WorkshopServiceStack',
-    'R53'
-]
\ No newline at end of file
+    'SharedNetworkStack',
+    'SharedNetwork',
+    'R53',
+]
+
+# deprecated names, name -> (module, attribute, replacement)
+_DEPRECATED = {
+    'R53': ('aws_cdk', 'aws_route53', 'aws_cdk.aws_route53'),
+}
+
+
+def __getattr__(name: str):
+    if name in _DEPRECATED:
+        module_name, attribute, replacement = _DEPRECATED[name]
+        warnings.warn(f"lib.{name} is deprecated, use {replacement}", DeprecationWarning, stacklevel=2)
+        return getattr(importlib.import_module(module_name), attribute)
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        if name.startswith("_") or not hasattr(importlib.import_module(".utils", __name__), name):
+            # `from lib import utils` falls back to the submodule import
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        module_name = "utils"
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
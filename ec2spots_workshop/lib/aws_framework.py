@@ -13,6 +13,7 @@ from aws_cdk import (
 
 
 from constructs import Construct
+from .profiler import profiled
 from dataclasses import dataclass
 
 import os
@@ -25,6 +26,7 @@ log = logging.getLogger(__name__)
 dirname = os.path.dirname(__file__)
 
 class AWSFramework(Construct):
+    @profiled()
     def create_arecord(self, id, domain_name:str, record_name:str, target) -> route53.ARecord:
         zone = route53.HostedZone.from_lookup(
             self, f"{id}-{domain_name}", 
@@ -42,6 +44,7 @@ class AWSFramework(Construct):
             )
         )
 
+    @profiled()
     def create_securety_group(self, id, name, vpc, ports, allow_ip_addresses=[], description=None) -> ec2.SecurityGroup:        
         sg = ec2.SecurityGroup(
             self, id,
@@ -58,6 +61,7 @@ class AWSFramework(Construct):
                 )
         return sg
 
+    @profiled()
     def create_instance_role(self, id, role_name, description, name_services: list, manage_policies: list=[]) -> iam.Role:
         service_principal = []
         for name_service in name_services:
@@ -83,6 +87,7 @@ class AWSFramework(Construct):
         for policy_name in policy_names:
             self._add_manage_policy(instance_role, policy_name)
 
+    @profiled()
     def create_acm_certificate(self, hosted_zone_id, domain_name, subjects) -> acm.Certificate:
         # it creats new zone, but I want to reused existing one
         
@@ -101,6 +106,7 @@ class AWSFramework(Construct):
             validation=acm.CertificateValidation.from_dns(hosted_zone)
         )
 
+    @profiled()
     def __init__(
             self,
             scope: Construct,
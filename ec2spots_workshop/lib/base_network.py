@@ -3,10 +3,12 @@ from aws_cdk import (
     Duration,
     aws_route53 as route53,
     aws_ec2 as ec2, 
+    aws_iam as iam,
     aws_certificatemanager as acm,
     aws_elasticloadbalancingv2 as elbv2
 )
 from constructs import Construct
+from .profiler import profiled
 from dataclasses import dataclass
 
 import os
@@ -16,7 +18,8 @@ import logging
 from typing import List, Dict
 from .utils import get_my_external_ip
 from .aws_framework import AWSFramework
-from .props import EnvProps
+from .props import EnvProps, SubnetTier, DEFAULT_SUBNET_TIERS, NAT_SINGLE, NAT_PER_AZ
+from .shared_network import SharedNetwork
 
 
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +31,22 @@ dirname = os.path.dirname(__file__)
 def upper_string(string: str) -> str:
     return string.upper()
 
+GATEWAY_SERVICES = {
+    "s3": ec2.GatewayVpcEndpointAwsService.S3,
+    "dynamodb": ec2.GatewayVpcEndpointAwsService.DYNAMODB,
+}
+
+def ecr_layers_statement(region: str) -> iam.PolicyStatement:
+    """
+        ECR keeps image layers in an S3 bucket of AWS, an S3 gateway endpoint policy has to allow it
+        https://docs.aws.amazon.com/AmazonECR/latest/userguide/vpc-endpoints.html#ecr-minimum-s3-perms
+    """
+    return iam.PolicyStatement(
+        principals=[iam.AnyPrincipal()],
+        actions=["s3:GetObject"],
+        resources=[f"arn:aws:s3:::prod-{region}-starport-layer-bucket/*"],
+    )
+
 class BaseNetwork(Construct):
     
     @property
@@ -42,15 +61,47 @@ class BaseNetwork(Construct):
     def sg_alb(self):
         return self._sg_alb
 
-    # TODO support multi subnets, 
-    # I wish to see opportunity to devide VPC on several publica and private subnets
+    @property
+    def endpoints(self) -> dict:
+        """
+            service name -> endpoint created by create_endpoints
+        """
+        return self._endpoints
+
+    @staticmethod
+    def subnet_group_name(prefix: str, tier: str) -> str:
+        return f"{prefix}-{tier}-subnet"
+
+    def subnets(self, tier: str) -> ec2.SubnetSelection:
+        """
+            Subnets of one tier of EnvProps.subnet_tiers
+        """
+        return ec2.SubnetSelection(subnet_group_name=self.subnet_group_name(self._prefix, tier))
+
+    def _nat_gateways(self, natgw: bool, nat_mode: str, max_azs: int) -> int:
+        if natgw is not True:
+            return 0
+        if nat_mode == NAT_SINGLE:
+            return 1
+        if nat_mode == NAT_PER_AZ:
+            # CDK routes private subnets of an AZ to the gateway of the same AZ
+            return max_azs
+        raise ValueError(f"Unknown NAT mode '{nat_mode}'")
+
     def _create_vpc(
             self, id: str, 
             prefix: str, 
             cidr_block: str,
             max_azs: int,
             natgw: bool,
-            properties: dict ) -> ec2.Vpc:
+            properties: dict,
+            subnet_tiers: List[SubnetTier]=None,
+            nat_mode: str=NAT_SINGLE) -> ec2.Vpc:
+        subnet_tiers = subnet_tiers or DEFAULT_SUBNET_TIERS
+        nat_gateways = self._nat_gateways(natgw, nat_mode, max_azs)
+        public_tiers = [tier for tier in subnet_tiers if tier.subnet_type == ec2.SubnetType.PUBLIC and not tier.reserved]
+        if nat_gateways and not public_tiers:
+            raise ValueError("NAT gateways need a public subnet tier")
         return ec2.Vpc(
             self, id,
             vpc_name=f"{prefix}-vpc",
@@ -59,16 +110,19 @@ class BaseNetwork(Construct):
             create_internet_gateway=properties.get("create_internet_gateway", False),
             enable_dns_hostnames=properties.get("enable_dns_hostnames", False),
             enable_dns_support=properties.get("enable_dns_support", False),
-            nat_gateways=1 if natgw is True else 0,
+            nat_gateways=nat_gateways,
+            # the first public tier keeps the gateways when there are several
+            nat_gateway_subnets=ec2.SubnetSelection(
+                subnet_group_name=self.subnet_group_name(prefix, public_tiers[0].name)
+            ) if nat_gateways else None,
             subnet_configuration=[
                 ec2.SubnetConfiguration(
-                    name=f"{prefix}-public-subnet",
-                    subnet_type=ec2.SubnetType.PUBLIC,
-                ),
-                ec2.SubnetConfiguration(
-                    name=f"{prefix}-private-subnet",
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+                    name=self.subnet_group_name(prefix, tier.name),
+                    subnet_type=tier.subnet_type,
+                    cidr_mask=tier.cidr_mask,
+                    reserved=tier.reserved,
                 )
+                for tier in subnet_tiers
             ]
         )
     def _create_acm_certificate(self, zone_name, domain_name, subjects) -> acm.Certificate:
@@ -151,20 +205,39 @@ class BaseNetwork(Construct):
             mutable=False
         )
     
+    @profiled()
     def create_endpoints(
             self, 
             service_names:list, 
             subnets:ec2.SubnetSelection, 
-            securety_groups:list=None):
+            securety_groups:list=None,
+            gateway_services:list=None,
+            policies:dict=None):
         """
             create endpoints for services
             list of service take a look here https://docs.aws.amazon.com/vpc/latest/privatelink/aws-services-privatelink-support.html
+            gateway_services: "s3", "dynamodb" - routes in the route tables of all private and
+                isolated subnets, no NAT gateway traffic and no hourly charge
+            policies: service name -> list of iam.PolicyStatement, the endpoint allows only these
         """
         if securety_groups is None:
             securety_groups = [self.sg_default]
+        policies = policies or {}
 
-        for service_name in service_names:
-            ec2.InterfaceVpcEndpoint(
+        private_subnets = self._vpc.private_subnets + self._vpc.isolated_subnets
+        for service_name in gateway_services or []:
+            endpoint = ec2.GatewayVpcEndpoint(
+                self, f"{self._prefix.upper()}-{service_name.upper()}-Gateway-Endpoint",
+                vpc=self._vpc,
+                service=GATEWAY_SERVICES.get(service_name) or ec2.GatewayVpcEndpointAwsService(service_name),
+                subnets=[ec2.SubnetSelection(subnets=private_subnets)]
+            )
+            for statement in policies.get(service_name, []):
+                endpoint.add_to_policy(statement)
+            self._endpoints[service_name] = endpoint
+
+        for service_name in service_names or []:
+            endpoint = ec2.InterfaceVpcEndpoint(
                 self, f"{self._prefix.upper()}-{service_name.upper()}-Endpoint",
                 vpc=self._vpc,
                 service=ec2.InterfaceVpcEndpointService(f"com.amazonaws.{self.region}.{service_name}"),
@@ -173,24 +246,51 @@ class BaseNetwork(Construct):
                 subnets=subnets,
                 security_groups=securety_groups
             )
+            for statement in policies.get(service_name, []):
+                endpoint.add_to_policy(statement)
+            self._endpoints[service_name] = endpoint
+
+    @profiled()
+    def import_vpc(self, name: str):
+        """
+            VPC of the shared network `name` (SharedNetworkStack), IDs come from SSM on deployment
+        """
+        shared_network = SharedNetwork(
+            self, f"{self._prefix.upper()}-Shared-Network",
+            name=name,
+            prefix=self._prefix,
+            max_azs=getattr(self._props, "max_avz", 3),
+            subnet_tiers=getattr(self._props, "subnet_tiers", None)
+        )
+        self._vpc = shared_network.vpc
+        self.sg_default = shared_network.sg_default
+        return self._vpc
 
+    @profiled()
     def create_vpc(self, is_natgw: bool=False):
         """
-        Create VPC with 2 subnets: 2 public and 1 private.
+        Create VPC with the subnet tiers of the props, public and private by default.
+        EnvProps.shared_network imports the shared VPC instead.
         """
+        if getattr(self._props, "shared_network", None):
+            return self.import_vpc(self._props.shared_network)
 
+        # WebAsgProps is used as network props too, it has no VPC layout fields
         self._vpc = self._create_vpc(
             id=f"{self._prefix.upper()}-VPC",
             prefix=self._prefix,
             cidr_block=self._props.cidr_block,
             natgw=is_natgw,
-            max_azs=self._props.max_avz,
-            properties=self._props.propertis
+            max_azs=getattr(self._props, "max_avz", 3),
+            properties=self._props.propertis or {},
+            subnet_tiers=getattr(self._props, "subnet_tiers", None),
+            nat_mode=getattr(self._props, "nat_mode", NAT_SINGLE)
         )
         self.sg_default = self.get_SG_default(id=f"{self._prefix.upper()}-SG-Default")
         return self._vpc
 
     # TODO replace hardcoded values with props
+    @profiled()
     def create_alb_with_connect_https_to(self, asg, sg_ports, port_source, port_target, internet_facing=True):
         self._acm_cert = self._create_acm_certificate(
             zone_name="Z0764436UNSJQPH92RK7", #"taloni.link",
@@ -208,7 +308,7 @@ class BaseNetwork(Construct):
             vpc=self._vpc,
             name=f"{self._prefix}-ALB-SG",
             description=f"{self._prefix}-ALB-SG",
-            allow_cidrs=[self._vpc.vpc_cidr_block, get_my_external_ip()],
+            allow_cidrs=[self._vpc.vpc_cidr_block, get_my_external_ip(self)],
             ports=sg_ports
         )
 
@@ -237,6 +337,7 @@ class BaseNetwork(Construct):
 
         self._alb.add_security_group(self._sg_alb)
 
+    @profiled()
     def create_alb(self, load_balancer_name, sg_alb, subnets, internet_facing=True):
         alb = self._create_alb(
             id=f"{self._prefix.capitalize()}-ALB",
@@ -264,6 +365,7 @@ class BaseNetwork(Construct):
         return alb
 
 
+    @profiled()
     def __init__(
             self,
             scope: Construct,
@@ -278,4 +380,5 @@ class BaseNetwork(Construct):
         self.region = region
         self.account = account
         self._props = props
+        self._endpoints = {}
         self._frame_work = AWSFramework(self, f"{self._prefix}-{construct_id}-Framework")
@@ -0,0 +1,160 @@
+"""
+    Record / replay of boto3 calls made during synth and tests.
+
+    BOTO_REPLAY=record cdk synth    # real calls, every response is stored as a fixture
+    BOTO_REPLAY=replay pytest       # responses are served from fixtures, no network, no credentials
+
+    Fixtures live in BOTO_REPLAY_DIR (default ./boto_fixtures), one json file per call:
+    <service>/<operation>-<hash of region and parameters>.json. Paginated calls are
+    stored page by page, error responses are stored and replayed as errors as well.
+    A call without a fixture fails in replay mode instead of going to AWS.
+"""
+
+import os
+import json
+import base64
+import hashlib
+import logging
+import datetime
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+DEFAULT_DIR = "boto_fixtures"
+_CONTEXT_KEY = "boto_replay_key"
+
+
+class ReplayMissError(Exception):
+    """
+        There is no fixture for a call in replay mode
+    """
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return datetime.datetime.fromisoformat(value["__datetime__"])
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    return value
+
+
+class BotoReplay:
+    """
+    botocore event handlers which record or replay API calls
+
+    Args:
+        mode (str): 'record' or 'replay'
+        directory (str): fixture directory
+    """
+
+    def __init__(self, mode: str, directory: str=None) -> None:
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"BOTO_REPLAY must be '{MODE_RECORD}' or '{MODE_REPLAY}', not '{mode}'")
+        self.mode = mode
+        self.directory = directory or os.environ.get("BOTO_REPLAY_DIR", DEFAULT_DIR)
+        self._events = None
+
+    def fixture_path(self, service: str, operation: str, region: str, params: dict) -> str:
+        call = json.dumps(
+            {"region": region, "params": _to_json(params)}, sort_keys=True, default=str)
+        digest = hashlib.sha256(call.encode("utf8")).hexdigest()[:16]
+        return os.path.join(self.directory, service, f"{operation}-{digest}.json")
+
+    def _on_parameters(self, params, model, context, **kwargs):
+        # api parameters as the caller passed them, before serialization
+        context[_CONTEXT_KEY] = self.fixture_path(
+            model.service_model.service_name, model.name, context.get("client_region"), params)
+
+    def _on_before_call(self, model, context, **kwargs):
+        if self.mode != MODE_REPLAY:
+            return None
+        from botocore.awsrequest import AWSResponse
+        path = context[_CONTEXT_KEY]
+        try:
+            with open(path) as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(
+                f"No fixture {path} for {model.service_model.service_name}.{model.name},"
+                f" record it with BOTO_REPLAY={MODE_RECORD}") from None
+        http = AWSResponse(None, fixture["status_code"], {}, None)
+        return http, _from_json(fixture["response"])
+
+    def _on_after_call(self, http_response, parsed, model, context, **kwargs):
+        if self.mode != MODE_RECORD or _CONTEXT_KEY not in context:
+            return
+        if model.has_streaming_output:
+            log.warning(f"Streaming response of {model.name} is not recorded")
+            return
+        path = context[_CONTEXT_KEY]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        response = dict(parsed)
+        # request ids and dates change on every call, fixtures should not
+        response.pop("ResponseMetadata", None)
+        with open(path, "w") as f:
+            json.dump({
+                "service": model.service_model.service_name,
+                "operation": model.name,
+                "region": context.get("client_region"),
+                "status_code": http_response.status_code,
+                "response": _to_json(response),
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        log.debug(f"Recorded {path}")
+
+    def install(self, session=None):
+        """
+            Register handlers on a boto3 session, the default one if not set.
+            Only clients created after install are recorded / replayed.
+        """
+        import boto3
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        self._events = session.events
+        self._events.register("before-parameter-build", self._on_parameters, unique_id="boto-replay-params")
+        self._events.register("before-call", self._on_before_call, unique_id="boto-replay-before")
+        self._events.register("after-call", self._on_after_call, unique_id="boto-replay-after")
+        log.info(f"boto3 calls are {self.mode}ed, fixtures: {self.directory}")
+        return self
+
+    def uninstall(self):
+        if self._events is None:
+            return
+        self._events.unregister("before-parameter-build", unique_id="boto-replay-params")
+        self._events.unregister("before-call", unique_id="boto-replay-before")
+        self._events.unregister("after-call", unique_id="boto-replay-after")
+        self._events = None
+
+
+_replay = None
+
+
+def install_from_env():
+    """
+        Enable recording / replay once per process when BOTO_REPLAY is set
+    """
+    global _replay
+    mode = os.environ.get("BOTO_REPLAY")
+    if mode and _replay is None:
+        _replay = BotoReplay(mode).install()
+    return _replay
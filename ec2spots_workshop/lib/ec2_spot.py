@@ -13,12 +13,12 @@ from aws_cdk import (
 from .utils import get_latest_linux_ami_from_aws
 
 from constructs import Construct
+from .profiler import profiled
 from dataclasses import dataclass
 
 import os
 import time
 import logging
-import boto3
 
 from operator import itemgetter
 from typing import List, Dict
@@ -37,11 +37,7 @@ class EC2Props:
     vpc: ec2.Vpc
     env: core.Environment
     prefix: str
-    ami_image: str
-    
-public_ip_addresses = [
-    get_my_external_ip()
-]
+    ami_image: ec2.IMachineImage
 
 
 class EC2Spot(Construct):
@@ -49,6 +45,7 @@ class EC2Spot(Construct):
     def asg(self):
         return self._asg
 
+    @profiled()
     def __init__(
             self,
             scope: Construct,
@@ -81,6 +78,10 @@ class EC2Spot(Construct):
         )
 
 
+        # resolved on construct creation, not on import
+        public_ip_addresses = [
+            get_my_external_ip(self)
+        ]
         for ip_address in public_ip_addresses:
             self._sg_instance.add_ingress_rule(
                 peer=ec2.Peer.ipv4(ip_address),
@@ -8,18 +8,18 @@ from aws_cdk import (
     aws_ec2 as ec2, 
     aws_iam as iam,
     aws_autoscaling as asg,
-    custom_resources as cr, 
-    aws_s3_assets as Asset
+    custom_resources as cr
 )
 from constructs import Construct
+from .profiler import profiled
 # from .props import ClusterProps
 from .utils import get_my_external_ip, get_latest_linux_ami_from_aws
 from .aws_framework import AWSFramework
+from .user_data_bundle import UserDataBundle
 
 import os
 import time
 import logging
-import boto3
 
 from operator import itemgetter
 from typing import List, Dict
@@ -70,36 +70,10 @@ class ECS(Construct):
 
     def _user_data(self, instance_role, script_paths: List[str]):
         """
-        Create an asset for each script in the list
+        Ship all scripts as one content-addressed bundle (see user_data_bundle.py)
         """
-        # check exists directory with script_paths
-        for script_path in script_paths:
-            if not os.path.exists(script_path):
-                raise ValueError(f"Script path {script_path} not found")
-        
-        # create assets and publish on s3 bucket
-        assets = []
-        for script_path in script_paths:
-            asset = Asset.Asset(
-                self, f"{self._prefix}-asset",
-                path=script_path
-            )
-            assets.append(asset)
-
-        # create class user_data aws_cdk.aws_ec2.UserData
         user_data = ec2.UserData.for_linux()
-
-        # Add commands to execute scripts
-        # Grant read permissions for all assets to the instance role
-        for asset in assets:
-            local_path = user_data.add_s3_download_command(
-                bucket=asset.bucket,
-                bucket_key=asset.s3_object_key
-            )
-            user_data.add_execute_file_command(
-                file_path=local_path
-            )
-            asset.grant_read(instance_role)
+        UserDataBundle(script_paths).add_to(self, user_data, role=instance_role)
         return user_data
     
     def _cretae_mixed_instances_policy(self, launch_template ):
@@ -170,16 +144,20 @@ class ECS(Construct):
             ]
         )
 
+    @profiled()
     def create_asg_for_ecs(
             self,
             sg_ports=None, 
-            instance_type=ec2.InstanceType("t3.media"), 
-            image=ecs.EcsOptimizedImage.amazon_linux2(), 
+            instance_type=None,
+            image=None,
             iam_role=None, 
             securety_group=None, 
             allow_ip_addresses=None,
             data_files: List=None
         ):
+        # defaults are created here, not on module import
+        instance_type = ec2.InstanceType("t3.media") if instance_type is None else instance_type
+        image = ecs.EcsOptimizedImage.amazon_linux2() if image is None else image
         vpc = self._get_vpc()
         vpc_subnets = self._get_subnets()
 
@@ -211,6 +189,7 @@ class ECS(Construct):
         )
         return _asg
     
+    @profiled()
     def create_cluster(self, autoscaling_group):
         _cluster = ecs.Cluster(
             self, f"{self._prefix.capitalize()}-Cluster", 
@@ -255,6 +234,7 @@ class ECS(Construct):
             # )
         )
 
+    @profiled()
     def create_service(self, cluster, container_name, image):
         # Create Task Definition
         task = self._create_task_definition()
@@ -280,6 +260,7 @@ class ECS(Construct):
         service = self._create_service(cluster, task, container_name)
         return service
 
+    @profiled()
     def __init__(
             self,
             scope: Construct,
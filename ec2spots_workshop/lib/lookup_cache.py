@@ -0,0 +1,118 @@
+"""
+    File based cache for values looked up during synth (external IP, AMI IDs ...).
+
+    The cache is a single json file which lives next to cdk.context.json
+    (the working directory of the cdk app). Every entry keeps its own expiry time.
+    Path can be overridden with CDK_LOOKUP_CACHE environment variable.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = "cdk.lookups.json"
+
+
+def default_cache_path() -> str:
+    return os.environ.get(
+        "CDK_LOOKUP_CACHE", os.path.join(os.getcwd(), CACHE_FILE_NAME))
+
+
+class LookupCache:
+    """
+    Json file cache with per entry expiry
+
+    Args:
+        path (str): path to the cache file, default is ./cdk.lookups.json
+    """
+
+    def __init__(self, path: str=None) -> None:
+        self._path = path or default_cache_path()
+
+    @property
+    def path(self):
+        return self._path
+
+    @contextmanager
+    def _locked(self):
+        # several synth processes can share one cache file
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self._path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as ex:
+            log.warning(f"Lookup cache {self._path} is broken, ignore it: {ex}")
+            return {}
+
+    def _write(self, data: dict):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".cdk-lookups-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+    def get(self, key: str):
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            log.debug(f"Lookup cache entry {key} is expired")
+            return None
+        return entry.get("value")
+
+    def get_many(self, keys: list) -> dict:
+        data = self._read()
+        now = time.time()
+        result = {}
+        for key in keys:
+            entry = data.get(key)
+            if entry is None:
+                continue
+            expires_at = entry.get("expires_at")
+            if expires_at is not None and expires_at < now:
+                continue
+            result[key] = entry.get("value")
+        return result
+
+    def set(self, key: str, value, ttl: int=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, values: dict, ttl: int=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._locked():
+            data = self._read()
+            for key, value in values.items():
+                data[key] = {"value": value, "expires_at": expires_at}
+            self._write(data)
+
+    def delete(self, key: str):
+        with self._locked():
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
@@ -0,0 +1,232 @@
+"""
+    Opt-in synth profiler.
+
+    CDK_SYNTH_PROFILE=synth.folded cdk synth
+
+    Records wall time, jsii round trips and outbound AWS (botocore) / HTTP (requests)
+    calls per construct and builder method decorated with @profiled. Every jsii
+    object creation (L1/L2 constructs, props ...) is a child frame as well.
+    On exit it writes a flame graph file in folded format (flamegraph.pl, speedscope)
+    and logs the top CDK_SYNTH_PROFILE_TOP (20) frames by wall time.
+"""
+
+import os
+import atexit
+import logging
+import functools
+
+from time import perf_counter
+from contextlib import contextmanager
+from collections import defaultdict
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+ROOT_FRAME = "<app>"
+# jsii kernel calls, every one is a round trip to the node process
+JSII_CALLS = ("create", "invoke", "sinvoke", "ainvoke", "get", "sget", "set", "sset", "delete")
+
+
+class _Frame:
+    __slots__ = ("wall", "child_wall", "calls", "jsii", "aws", "http")
+
+    def __init__(self) -> None:
+        self.wall = 0.0
+        self.child_wall = 0.0
+        self.calls = 0
+        self.jsii = 0
+        self.aws = 0
+        self.http = 0
+
+
+class SynthProfiler:
+    def __init__(self) -> None:
+        self._stack = []
+        self._frames = defaultdict(_Frame)
+        self._patches = []
+
+    @contextmanager
+    def frame(self, name: str):
+        self._stack.append(name)
+        path = tuple(self._stack)
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            self._stack.pop()
+            frame = self._frames[path]
+            frame.wall += elapsed
+            frame.calls += 1
+            if self._stack:
+                self._frames[tuple(self._stack)].child_wall += elapsed
+
+    def count(self, kind: str):
+        path = tuple(self._stack) or (ROOT_FRAME,)
+        frame = self._frames[path]
+        setattr(frame, kind, getattr(frame, kind) + 1)
+
+    def _patch(self, owner, name: str, wrapper):
+        original = getattr(owner, name)
+        self._patches.append((owner, name, original))
+        setattr(owner, name, wrapper(original))
+
+    def install(self):
+        # generated bindings call jsii.create / jsii.invoke ... module aliases of the kernel
+        import jsii
+
+        def jsii_call(call_name):
+            def wrapper(original):
+                @functools.wraps(original)
+                def call(*args, **kwargs):
+                    self.count("jsii")
+                    if call_name != "create":
+                        return original(*args, **kwargs)
+                    klass = args[0]
+                    fqn = getattr(klass, "__jsii_type__", None) or klass.__name__
+                    with self.frame(fqn.replace("aws-cdk-lib.", "")):
+                        return original(*args, **kwargs)
+                return call
+            return wrapper
+
+        for call_name in JSII_CALLS:
+            if hasattr(jsii, call_name):
+                self._patch(jsii, call_name, jsii_call(call_name))
+
+        def outbound(kind):
+            def wrapper(original):
+                @functools.wraps(original)
+                def send(*args, **kwargs):
+                    self.count(kind)
+                    return original(*args, **kwargs)
+                return send
+            return wrapper
+
+        def framed(frame_name):
+            def wrapper(original):
+                @functools.wraps(original)
+                def call(*args, **kwargs):
+                    with self.frame(frame_name):
+                        return original(*args, **kwargs)
+                return call
+            return wrapper
+
+        # template generation itself
+        from aws_cdk import App
+        self._patch(App, "synth", framed("App.synth"))
+
+        try:
+            from botocore.endpoint import Endpoint
+            self._patch(Endpoint, "_send", outbound("aws"))
+        except ImportError:
+            pass
+        try:
+            from requests import Session
+            self._patch(Session, "send", outbound("http"))
+        except ImportError:
+            pass
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+
+    def folded(self) -> list:
+        """
+            Lines 'frame;frame;frame <self time in microseconds>'
+        """
+        lines = []
+        for path, frame in sorted(self._frames.items()):
+            self_us = int(max(frame.wall - frame.child_wall, 0) * 1e6)
+            if self_us:
+                lines.append(f"{';'.join(path)} {self_us}")
+        return lines
+
+    def summary(self) -> list:
+        """
+            Inclusive numbers per frame name, sorted by wall time
+        """
+        totals = defaultdict(_Frame)
+        for path, frame in self._frames.items():
+            name = path[-1]
+            if name not in path[:-1]:
+                total = totals[name]
+                total.wall += frame.wall
+                total.child_wall += frame.child_wall
+                total.calls += frame.calls
+            for ancestor in set(path):
+                total = totals[ancestor]
+                total.jsii += frame.jsii
+                total.aws += frame.aws
+                total.http += frame.http
+        return sorted(totals.items(), key=lambda item: item[1].wall, reverse=True)
+
+    def report(self, top: int=20) -> str:
+        lines = [f"{'frame':<60} {'calls':>6} {'wall, ms':>10} {'jsii':>7} {'aws':>5} {'http':>5}"]
+        for name, total in self.summary()[:top]:
+            lines.append(
+                f"{name[:60]:<60} {total.calls:>6} {total.wall * 1000:>10.1f} "
+                f"{total.jsii:>7} {total.aws:>5} {total.http:>5}")
+        return "\n".join(lines)
+
+    def write(self, path: str, top: int=20):
+        with open(path, "w") as f:
+            f.write("\n".join(self.folded()) + "\n")
+        log.info(f"Synth profile is written to {path}\n{self.report(top)}")
+
+
+_profiler = None
+
+
+def get_profiler():
+    return _profiler
+
+
+def start() -> SynthProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = SynthProfiler()
+        _profiler.install()
+    return _profiler
+
+
+def stop(path: str=None, top: int=20) -> SynthProfiler:
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.uninstall()
+        if path:
+            profiler.write(path, top)
+    return profiler
+
+
+def profiled(name: str=None):
+    """
+        Decorator for construct constructors and builder methods.
+        Costs one global lookup when profiling is off.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return fn(*args, **kwargs)
+            frame_name = name
+            if frame_name is None and "." not in fn.__qualname__:
+                frame_name = fn.__name__
+            elif frame_name is None:
+                owner = type(args[0]).__name__
+                frame_name = owner if fn.__name__ == "__init__" else f"{owner}.{fn.__name__}"
+            with profiler.frame(frame_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if os.environ.get("CDK_SYNTH_PROFILE"):
+    start()
+    atexit.register(
+        stop,
+        path=os.environ["CDK_SYNTH_PROFILE"],
+        top=int(os.environ.get("CDK_SYNTH_PROFILE_TOP", 20))
+    )
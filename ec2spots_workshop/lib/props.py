@@ -1,11 +1,15 @@
 """
     Props for stacks
 """
+from __future__ import annotations
 
 import aws_cdk as core
 from dataclasses import dataclass
-from typing import List, Dict
-from .ecs import ECS
+from typing import List, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # only for annotations, props don't need ECS module on import
+    from .ecs import ECS
 
 @dataclass
 class WebAsgProps:
@@ -18,7 +22,8 @@ class WebAsgProps:
     min_capacity: int=0
     max_capacity: int=1
     desired_capacity: int=0
-    ami_image: str=None
+    # see utils.get_latest_linux_ami_from_aws(resolution=...)
+    ami_image: core.aws_ec2.IMachineImage=None
     domain_name: str=None
     record_name: str=None
     env: core.Environment=None
@@ -32,21 +37,52 @@ class EC2Props:
     vpc: core.aws_ec2.Vpc
     env: core.Environment
     prefix: str
-    ami_image: str
+    ami_image: core.aws_ec2.IMachineImage
+
+# NAT gateways of a VPC with egress:
+#  single - one gateway, private subnets of every AZ egress through it
+#  per_az - one gateway per AZ, private subnets egress in their own AZ
+NAT_SINGLE = "single"
+NAT_PER_AZ = "per_az"
+
+@dataclass
+class SubnetTier:
+    # subnet group '<prefix>-<name>-subnet', one subnet per AZ
+    name: str
+    subnet_type: core.aws_ec2.SubnetType=core.aws_ec2.SubnetType.PRIVATE_WITH_EGRESS
+    # None - CDK splits the VPC CIDR between the tiers evenly
+    cidr_mask: int=None
+    # the address range is kept, no subnets are created
+    reserved: bool=False
+
+# public, app, data, isolated: SubnetTier("public", PUBLIC, 26), SubnetTier("app", cidr_mask=24),
+# SubnetTier("data", PRIVATE_ISOLATED, 26), SubnetTier("isolated", PRIVATE_ISOLATED, 27)
+DEFAULT_SUBNET_TIERS = [
+    SubnetTier("public", core.aws_ec2.SubnetType.PUBLIC),
+    SubnetTier("private", core.aws_ec2.SubnetType.PRIVATE_WITH_EGRESS),
+]
 
 @dataclass
 class EnvProps:
     cidr_block: str
     vpc: core.aws_ec2.Vpc=None
     max_avz: int=3
+    subnet_tiers: List[SubnetTier]=None
+    nat_mode: str=NAT_SINGLE
     endpoints : List=None
     endpoint_subnets: core.aws_ec2.SubnetSelection=None
+    # "s3", "dynamodb", routed into every private route table
+    gateway_endpoints: List[str]=None
+    # service name -> list of iam.PolicyStatement
+    endpoint_policies: Dict=None
     propertis: Dict=None
     alb_sg: core.aws_ec2.SecurityGroup=None
     alb_internet_facing: bool=False
     domain_name: str=None
     hosted_zone_id: str=None
     record_name: str=None
+    # name of a SharedNetworkStack, the VPC is imported and no endpoints are created
+    shared_network: str=None
 
 @dataclass
 class ClusterProps:
@@ -55,7 +91,8 @@ class ClusterProps:
     min_capacity: int=0
     max_capacity: int=1
     desired_capacity: int=0
-    ami_image: str=None
+    # see utils.get_latest_linux_ami_from_aws(resolution=...)
+    ami_image: core.aws_ec2.IMachineImage=None
     data_path: str=None
     vpc: core.aws_ec2.Vpc=None
     alb: core.aws_elasticloadbalancingv2.ApplicationLoadBalancer=None
@@ -0,0 +1,161 @@
+"""
+Shared network of the apps
+
+SharedNetworkStack (work_shop_ec2_spot_stack) owns one VPC with its endpoints and publishes
+the IDs as SSM String parameters:
+
+    /<name>/network/vpc-id, vpc-cidr, azs, default-sg
+    /<name>/network/layout                AZ count and subnet tiers, see network_layout
+    /<name>/network/subnets/<tier>        comma separated, one subnet per AZ
+    /<name>/network/route-tables/<tier>   comma separated, one table per AZ
+    /<name>/network/endpoints/<service>
+
+SharedNetwork imports it with SSM parameter types resolved by CloudFormation on deployment,
+no Vpc.from_lookup, no credentials and cdk.context.json at synth. The number of subnets has to
+be known at synth, so the importer states the layout it expects and a template rule compares it
+with the published one before CloudFormation changes anything.
+sagemaker_lab and StepFunctions import this module too.
+"""
+
+import aws_cdk as core
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_ssm as ssm,
+)
+from constructs import Construct
+from typing import List
+
+from .props import SubnetTier, DEFAULT_SUBNET_TIERS
+
+
+def network_parameter(name: str, key: str) -> str:
+    return f"/{name}/network/{key}"
+
+
+def network_layout(max_azs: int, subnet_tiers: List[SubnetTier]=None) -> str:
+    """
+        AZ count and subnet tiers, e.g. 'azs=2;public=PUBLIC;private=PRIVATE_WITH_EGRESS'
+    """
+    tiers = [tier for tier in subnet_tiers or DEFAULT_SUBNET_TIERS if not tier.reserved]
+    return ";".join([f"azs={max_azs}"] + [f"{tier.name}={tier.subnet_type.name}" for tier in tiers])
+
+
+def publish_network(
+        scope: Construct,
+        name: str,
+        vpc: ec2.IVpc,
+        subnet_groups: dict,
+        layout: str,
+        endpoints: dict=None) -> List[ssm.StringParameter]:
+    """
+        SSM parameters of a VPC, subnet_groups: tier name -> subnet group name
+    """
+    values = {
+        "layout": layout,
+        "vpc-id": vpc.vpc_id,
+        "vpc-cidr": vpc.vpc_cidr_block,
+        "azs": core.Fn.join(",", vpc.availability_zones),
+        "default-sg": vpc.vpc_default_security_group,
+    }
+    for tier, group_name in subnet_groups.items():
+        subnets = vpc.select_subnets(subnet_group_name=group_name).subnets
+        values[f"subnets/{tier}"] = core.Fn.join(",", [subnet.subnet_id for subnet in subnets])
+        values[f"route-tables/{tier}"] = core.Fn.join(",", [subnet.route_table.route_table_id for subnet in subnets])
+    for service_name, endpoint in (endpoints or {}).items():
+        values[f"endpoints/{service_name}"] = endpoint.vpc_endpoint_id
+
+    return [
+        ssm.StringParameter(
+            scope, f"{name}-{key}-parameter",
+            parameter_name=network_parameter(name, key),
+            string_value=value,
+        )
+        for key, value in values.items()
+    ]
+
+
+class SharedNetwork(Construct):
+    """
+        VPC of SharedNetworkStack in another stack of the same account and region.
+        max_azs and subnet_tiers must match the shared network, CDK needs the number
+        of subnets at synth. Subnet groups are named as BaseNetwork.subnet_group_name(prefix, tier).
+    """
+
+    @property
+    def vpc(self) -> ec2.IVpc:
+        return self._vpc
+
+    @property
+    def sg_default(self) -> ec2.ISecurityGroup:
+        return self._sg_default
+
+    def parameter(self, key: str) -> str:
+        return ssm.StringParameter.value_for_string_parameter(self, network_parameter(self._name, key))
+
+    def endpoint_id(self, service_name: str) -> str:
+        return self.parameter(f"endpoints/{service_name}")
+
+    def _split(self, key: str, count: int) -> List[str]:
+        return core.Fn.split(",", self.parameter(key), assumed_length=count)
+
+    def __init__(
+            self,
+            scope: Construct,
+            construct_id: str,
+            name: str,
+            prefix: str,
+            max_azs: int=2,
+            subnet_tiers: List[SubnetTier]=None,
+            **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        self._name = name
+        subnet_tiers = [tier for tier in subnet_tiers or DEFAULT_SUBNET_TIERS if not tier.reserved]
+
+        # Fn::Select of a missing subnet fails in the middle of the deployment, the rule fails it first
+        layout = network_layout(max_azs, subnet_tiers)
+        core.CfnRule(
+            self, f"{name}-layout-rule",
+            assertions=[core.CfnRuleAssertion(
+                assert_=core.Fn.condition_equals(self.parameter("layout"), layout),
+                assert_description=f"The shared network '{name}' has another layout than {layout},"
+                                   f" see the SSM parameter {network_parameter(name, 'layout')}",
+            )]
+        )
+
+        # from_vpc_attributes takes one list per subnet type, groups of max_azs subnets
+        subnets = {
+            ec2.SubnetType.PUBLIC: ([], [], []),
+            ec2.SubnetType.PRIVATE_WITH_EGRESS: ([], [], []),
+            ec2.SubnetType.PRIVATE_ISOLATED: ([], [], []),
+        }
+        for tier in subnet_tiers:
+            subnet_ids, names, route_tables = subnets[tier.subnet_type]
+            subnet_ids += self._split(f"subnets/{tier.name}", max_azs)
+            names.append(f"{prefix}-{tier.name}-subnet")
+            route_tables += self._split(f"route-tables/{tier.name}", max_azs)
+
+        public, private, isolated = (
+            subnets[ec2.SubnetType.PUBLIC],
+            subnets[ec2.SubnetType.PRIVATE_WITH_EGRESS],
+            subnets[ec2.SubnetType.PRIVATE_ISOLATED],
+        )
+        self._vpc = ec2.Vpc.from_vpc_attributes(
+            self, f"{name}-vpc",
+            vpc_id=self.parameter("vpc-id"),
+            vpc_cidr_block=self.parameter("vpc-cidr"),
+            availability_zones=self._split("azs", max_azs),
+            public_subnet_ids=public[0] or None,
+            public_subnet_names=public[1] or None,
+            public_subnet_route_table_ids=public[2] or None,
+            private_subnet_ids=private[0] or None,
+            private_subnet_names=private[1] or None,
+            private_subnet_route_table_ids=private[2] or None,
+            isolated_subnet_ids=isolated[0] or None,
+            isolated_subnet_names=isolated[1] or None,
+            isolated_subnet_route_table_ids=isolated[2] or None,
+        )
+        self._sg_default = ec2.SecurityGroup.from_security_group_id(
+            self, f"{name}-sg-default",
+            self.parameter("default-sg"),
+            mutable=False
+        )
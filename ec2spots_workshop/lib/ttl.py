@@ -4,17 +4,22 @@ https://medium.com/capmo-stories/scheduling-automated-deletion-of-aws-cloudforma
 """
 
 import os
+import json
 import aws_cdk as core
 from aws_cdk import (
     CfnOutput,
     Stack,
+    aws_cloudwatch as cloudwatch,
     aws_events as events,
     aws_events_targets as events_targets,
     aws_iam as iam,
     aws_lambda as _lambda,
+    custom_resources as cr,
 )
 
 from constructs import Construct
+from .profiler import profiled
+from .ttl_orchestrator import TTLOrchestrator, TTLOrchestratorProps, deletion_order
 from dataclasses import dataclass
 
 import logging
@@ -24,6 +29,20 @@ log = logging.getLogger(__name__)
 
 dirname = os.path.dirname(__file__)
 
+# rate - events.Rule calls the lambda every `ttl` minutes
+# at   - one-shot EventBridge Scheduler schedule per deadline, created on deploy, deleted after firing
+TTL_MODE_RATE = "rate"
+TTL_MODE_AT = "at"
+
+# tags read by the TTL service (TTLProps.discovery)
+TTL_TAG = "ttl-expires-at"
+TTL_MINUTES_TAG = "ttl-minutes"
+
+# EMF metrics of the TTL lambda, dimension FunctionName
+TTL_METRICS_NAMESPACE = "TTL"
+# lambda timeout, wave deletion waits for the stacks
+TTL_TIMEOUT = core.Duration.minutes(15)
+
 @dataclass
 class TTLProps:
     """
@@ -35,28 +54,56 @@ class TTLProps:
         account (str): The account ID
         region (str): The region
         prefix_name (str): The prefix name of the stack
+        dependencies (dict): stack name -> names of the stacks it depends on,
+            dependents are deleted first (exports/imports are found by the lambda itself)
+        mode (str): 'rate' (default) or 'at', see TTL_MODE_*
+        stack_ttls (dict): stack name -> minutes, own deadlines in 'at' mode, others use ttl
+        discovery (bool): one TTL service per account and region, stacks are found by
+            TTL tags (see ttl_tag_stacks) instead of stack_names, ttl is the scan interval
+        regions (list): regions the stacks live in, the lambda reaps them concurrently,
+            by default the region of the TTL stack only
+        orchestrator (bool): the rule starts a Step Functions state machine instead of the lambda,
+            it deletes stacks wave by wave (dependencies), see ttl_orchestrator.py
+        max_concurrency (int): stacks of a wave deleted at once by the state machine
+        drain (bool): the lambda scales ECS services of a stack to zero, then its ASGs
+            and waits until they are empty before delete_stack
+        idle_window (int): minutes without ALB requests and ECS/ASG CPU above the idle
+            threshold after which a stack is deleted, ttl stays the hard limit since creation
+        idle_check (int): minutes between idle checks
     """
     prefix_name: str
     stack_names: list
     ttl: int
     account: str=None
     region: str=None
+    dependencies: dict=None
+    mode: str=TTL_MODE_RATE
+    stack_ttls: dict=None
+    discovery: bool=False
+    regions: list=None
+    orchestrator: bool=False
+    max_concurrency: int=10
+    drain: bool=False
+    idle_window: int=None
+    idle_check: int=15
+
+
+def expiry_groups(stack_names: list, ttl: int, stack_ttls: dict=None, last_stack: str=None) -> dict:
+    """
+        minutes -> stacks expiring then, last_stack (the TTL stack) goes with the latest deadline
+    """
+    stack_ttls = stack_ttls or {}
+    groups = {}
+    for stack_name in stack_names:
+        if stack_name != last_stack:
+            groups.setdefault(int(stack_ttls.get(stack_name, ttl)), []).append(stack_name)
+    if last_stack is not None:
+        groups.setdefault(max(groups, default=int(ttl)), []).append(last_stack)
+    return dict(sorted(groups.items()))
 
-class TTL(Construct):
-    def __init__(self, scope: Construct, id: str, props: TTLProps, **kwargs) -> None:
-        super().__init__(scope, id, **kwargs)
-        
-        _lambda_fn = _lambda.Function(
-            self, "TTL Lambda",
-            runtime=_lambda.Runtime.PYTHON_3_11,
-            function_name="ttl_lambda",
-            code = _lambda.Code.from_asset(os.path.join(dirname, "../lambda")),
-            handler='ttl.handler',
-            environment={
-                "STACK_NAMES": ",".join(props.stack_names),
-            }
-        )
 
+class TTL(Construct):
+    def _create_rate_rule(self, target: events.IRuleTarget, props: TTLProps):
         # https://docs.aws.amazon.com/cdk/api/v2/docs/aws-cdk-lib.aws_events.Schedule.html
         # https://docs.aws.amazon.com/cdk/api/v2/docs/aws-cdk-lib.aws_events-readme.html
         # https://docs.aws.amazon.com/eventbridge/latest/userguide/eb-create-rule-schedule.html
@@ -65,7 +112,7 @@ class TTL(Construct):
 
         rule = events.Rule(
             self, "Trigger Lambda",
-            schedule=events.Schedule.rate(core.Duration.minutes(props.ttl)),
+            schedule=events.Schedule.rate(core.Duration.minutes(props.idle_check if props.idle_window else props.ttl)),
             # schedule=events.Schedule.cron(
             #     minute="*/1",
             #     hour="*",
@@ -73,23 +120,292 @@ class TTL(Construct):
             #     month="*",
             # )
         )
-        rule.add_target(events_targets.LambdaFunction(_lambda_fn))
+        rule.add_target(target)
+
+    def _allow_tagged_stacks(self, _lambda_fn, regions: list):
+        """
+            Any stack of the account and regions, only when it has a TTL tag
+        """
+        stack = Stack.of(self)
+        for tag_key in (TTL_TAG, TTL_MINUTES_TAG):
+            _lambda_fn.add_to_role_policy(iam.PolicyStatement(
+                resources=[f"arn:aws:cloudformation:{region}:{stack.account}:stack/*" for region in regions],
+                actions=[
+                    'cloudformation:DescribeStacks',
+                    'cloudformation:DeleteStack',
+                    # resources of DELETE_FAILED stacks, they are retained on the next try
+                    'cloudformation:ListStackResources',
+                ],
+                conditions={"Null": {f"aws:ResourceTag/{tag_key}": "false"}}
+            ))
+        _lambda_fn.add_to_role_policy(iam.PolicyStatement(
+            resources=["*"],
+            actions=[
+                'tag:GetResources',
+                'cloudformation:ListStacks',
+            ]
+        ))
+
+    def _create_expiry_schedules(self, _lambda_fn, props: TTLProps):
+        """
+            Custom resource computes now + ttl on deploy and registers an at() schedule,
+            the schedule invokes the lambda with its stacks once and deletes itself
+        """
+        stack = Stack.of(self)
+        scheduler_role = iam.Role(
+            self, "TTL Scheduler Role",
+            assumed_by=iam.ServicePrincipal("scheduler.amazonaws.com")
+        )
+        _lambda_fn.grant_invoke(scheduler_role)
+
+        on_event = _lambda.Function(
+            self, "TTL Schedule Lambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code = _lambda.Code.from_asset(os.path.join(dirname, "../lambda")),
+            handler='ttl_schedule.handler',
+            timeout=core.Duration.minutes(1),
+        )
+        on_event.add_to_role_policy(iam.PolicyStatement(
+            resources=[f"arn:aws:scheduler:{stack.region}:{stack.account}:schedule/default/{props.prefix_name}-*"],
+            actions=[
+                'scheduler:CreateSchedule',
+                'scheduler:UpdateSchedule',
+                'scheduler:DeleteSchedule',
+            ]
+        ))
+        scheduler_role.grant_pass_role(on_event)
+        provider = cr.Provider(self, "TTL Schedule Provider", on_event_handler=on_event)
+
+        groups = expiry_groups(props.stack_names, props.ttl, props.stack_ttls, last_stack=stack.stack_name)
+        for ttl, stack_names in groups.items():
+            core.CustomResource(
+                self, f"TTL Expiry {ttl}",
+                service_token=provider.service_token,
+                properties={
+                    "ScheduleName": f"{props.prefix_name}-expiry-{ttl}m",
+                    "Ttl": ttl,
+                    "StackNames": stack_names,
+                    "TargetArn": _lambda_fn.function_arn,
+                    "RoleArn": scheduler_role.role_arn,
+                }
+            )
+
+    def _metric(self, _lambda_fn, name: str, statistic: str) -> cloudwatch.Metric:
+        return cloudwatch.Metric(
+            namespace=TTL_METRICS_NAMESPACE,
+            metric_name=name,
+            dimensions_map={"FunctionName": _lambda_fn.function_name},
+            statistic=statistic,
+            period=core.Duration.minutes(5),
+        )
+
+    def _create_monitoring(self, _lambda_fn, props: TTLProps):
+        """
+            Dashboard and alarms on the EMF metrics of the lambda
+        """
+        failed = self._metric(_lambda_fn, "StacksFailed", "Sum")
+        deleted = self._metric(_lambda_fn, "StacksDeleted", "Sum")
+        invocation = self._metric(_lambda_fn, "InvocationDuration", "Maximum")
+        expiry_lag = self._metric(_lambda_fn, "ExpiryLag", "Maximum")
+
+        alarms = [
+            failed.create_alarm(
+                self, "TTL Failed Alarm",
+                alarm_description="TTL could not delete a stack",
+                threshold=1,
+                evaluation_periods=1,
+                comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            ),
+            invocation.create_alarm(
+                self, "TTL Duration Alarm",
+                alarm_description="TTL invocation is close to the lambda timeout",
+                threshold=TTL_TIMEOUT.to_milliseconds() * 0.8,
+                evaluation_periods=1,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            ),
+        ]
+        # ExpiryLag has a real expiry only with an at() schedule or a TTL tag (discovery),
+        # the time of a rate rule is just its firing time
+        has_expiry = props.mode != TTL_MODE_RATE or props.discovery
+        if has_expiry:
+            # rate mode finds a tagged stack up to one interval after its expiry
+            alarms.append(expiry_lag.create_alarm(
+                self, "TTL Expiry Lag Alarm",
+                alarm_description="Stacks are deleted late after their expiry",
+                threshold=((props.ttl if props.mode == TTL_MODE_RATE else 0) + 15) * 60,
+                evaluation_periods=1,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            ))
+
+        # dashboard names are global in the account, one dashboard per region
+        dashboard = cloudwatch.Dashboard(
+            self, "TTL Dashboard", dashboard_name=f"{props.prefix_name}-ttl-{Stack.of(self).region}")
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Delete stack duration (ms)",
+                left=[
+                    self._metric(_lambda_fn, "DeleteStackDuration", "p50"),
+                    self._metric(_lambda_fn, "DeleteStackDuration", "Maximum"),
+                ],
+            ),
+            cloudwatch.GraphWidget(title="Invocation duration (ms)", left=[invocation]),
+            cloudwatch.GraphWidget(title="Stacks per run", left=[deleted, failed]),
+        )
+        if has_expiry:
+            dashboard.add_widgets(cloudwatch.GraphWidget(title="Expiry lag (s)", left=[expiry_lag]))
+        dashboard.add_widgets(cloudwatch.AlarmStatusWidget(title="TTL alarms", alarms=alarms, width=24))
+
+    def _create_orchestrator(self, props: TTLProps):
+        """
+            State machine which deletes the stacks, no lambda polls the deletion
+        """
+        stack = Stack.of(self)
+        ttl_stack = stack.stack_name
+        stack_names = [name for name in props.stack_names if name != ttl_stack]
+        orchestrator = TTLOrchestrator(
+            self, "TTL Orchestrator",
+            props=TTLOrchestratorProps(
+                stack_arns=[
+                    f'arn:aws:cloudformation:{stack.region}:{stack.account}:stack/{stack_name}/*'
+                    for stack_name in props.stack_names
+                ],
+                ttl_stack_name=ttl_stack if ttl_stack in props.stack_names else None,
+                max_concurrency=props.max_concurrency,
+            )
+        )
+        waves = deletion_order(stack_names, props.dependencies)
+        self._create_rate_rule(
+            events_targets.SfnStateMachine(
+                orchestrator.state_machine,
+                input=events.RuleTargetInput.from_object({"waves": waves})
+            ),
+            props
+        )
+        self.state_machine = orchestrator.state_machine
+
+    @profiled()
+    def __init__(self, scope: Construct, id: str, props: TTLProps, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+        if props.discovery and props.mode != TTL_MODE_RATE:
+            raise ValueError("TTL discovery scans stacks periodically, it works only with 'rate' mode")
+        if props.orchestrator and (props.discovery or props.mode != TTL_MODE_RATE or props.regions):
+            raise ValueError("TTL orchestrator deletes a fixed list of stacks of its own region in 'rate' mode")
+        if props.idle_window and (props.discovery or props.orchestrator or props.mode != TTL_MODE_RATE):
+            raise ValueError("TTL idle mode checks a fixed list of stacks periodically, it works only with 'rate' mode")
+        if props.orchestrator and props.drain:
+            raise ValueError("TTL drain runs in the lambda, it doesn't work with the orchestrator")
+        if props.orchestrator:
+            self._create_orchestrator(props)
+            return
+
+        if props.discovery:
+            environment = {
+                "TTL_TAG": TTL_TAG,
+                "TTL_MINUTES_TAG": TTL_MINUTES_TAG,
+            }
+        else:
+            environment = {
+                "STACK_NAMES": ",".join(props.stack_names),
+                "STACK_DEPENDENCIES": json.dumps(props.dependencies or {}, sort_keys=True),
+                "TTL_STACK_NAME": Stack.of(self).stack_name,
+            }
+        if props.regions:
+            environment["REGIONS"] = ",".join(props.regions)
+        if props.drain:
+            environment["DRAIN"] = "true"
+        if props.idle_window:
+            environment["IDLE_WINDOW"] = str(props.idle_window)
+            environment["HARD_TTL"] = str(props.ttl)
+        environment["METRICS_NAMESPACE"] = TTL_METRICS_NAMESPACE
+        regions = props.regions or [props.region or Stack.of(self).region]
+        # no fixed function_name, several TTL stacks can live in one account and region
+        _lambda_fn = _lambda.Function(
+            self, "TTL Lambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            code = _lambda.Code.from_asset(os.path.join(dirname, "../lambda")),
+            handler='ttl.handler',
+            # stacks are deleted wave by wave, every wave waits for the deletion
+            timeout=TTL_TIMEOUT,
+            environment=environment
+        )
+
+        if props.mode == TTL_MODE_AT:
+            self._create_expiry_schedules(_lambda_fn, props)
+        elif props.mode == TTL_MODE_RATE:
+            self._create_rate_rule(events_targets.LambdaFunction(_lambda_fn), props)
+        else:
+            raise ValueError(f"Unknown TTL mode '{props.mode}'")
+        self._create_monitoring(_lambda_fn, props)
 
         # Allow CF operations
         # https://docs.aws.amazon.com/IAM/latest/UserGuide/reference_policies_elements_principal.html        
+        if props.discovery:
+            self._allow_tagged_stacks(_lambda_fn, regions)
         for stack_name in props.stack_names:
             statement = iam.PolicyStatement(
                 resources=[
-                    f'arn:aws:cloudformation:{props.region}:{props.account}:stack/{stack_name}', 
-                    f'arn:aws:cloudformation:{props.region}:{props.account}:stack/{stack_name}/*', 
+                    arn
+                    for region in regions
+                    for arn in (
+                        f'arn:aws:cloudformation:{region}:{props.account}:stack/{stack_name}', 
+                        f'arn:aws:cloudformation:{region}:{props.account}:stack/{stack_name}/*', 
+                    )
                 ],
                 actions=[
                     'cloudformation:DescribeStacks',
                     'cloudformation:DeleteStack',
+                    # resources of DELETE_FAILED stacks, they are retained on the next try
+                    'cloudformation:ListStackResources',
                 ]
             )
 
             _lambda_fn.add_to_role_policy(statement)
+
+        # dependencies between stacks by exports / imports,
+        # ListStacks: stacks of STACK_NAMES which exist in a region
+        _lambda_fn.add_to_role_policy(iam.PolicyStatement(
+            resources=["*"],
+            actions=[
+                'cloudformation:ListExports',
+                'cloudformation:ListImports',
+                'cloudformation:ListStacks',
+            ]
+        ))
+
+        if props.drain:
+            # ASGs and services have generated names, the stacks are known by names only
+            _lambda_fn.add_to_role_policy(iam.PolicyStatement(
+                resources=["*"],
+                actions=[
+                    'autoscaling:DescribeAutoScalingGroups',
+                    'autoscaling:UpdateAutoScalingGroup',
+                    'autoscaling:SetInstanceProtection',
+                    'ecs:DescribeServices',
+                    'ecs:UpdateService',
+                    'ecs:UpdateCapacityProvider',
+                    'ec2:DescribeInstances',
+                ]
+            ))
+
+        if props.idle_window:
+            _lambda_fn.add_to_role_policy(iam.PolicyStatement(
+                resources=["*"],
+                actions=[
+                    'cloudwatch:GetMetricData',
+                ]
+            ))
+
+        # the lambda hands unfinished deletions to an async invocation of itself,
+        # a separate policy: the function already depends on the default policy of its role
+        iam.Policy(
+            self, "TTL Continuation Policy",
+            roles=[_lambda_fn.role],
+            statements=[iam.PolicyStatement(
+                resources=[_lambda_fn.function_arn],
+                actions=['lambda:InvokeFunction'],
+            )]
+        )
         
         # CfnOutput(
         #     self, "Stack TTL value", 
@@ -104,12 +420,15 @@ class TTL(Construct):
         # )
 
 class TTLStack(Stack):
+    @profiled()
     def __init__(self, scope: Construct, construct_id: str, 
                  props: TTLProps, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # add self name to the list of stacks on termination
-        props.stack_names.append(self.stack_name)
+        # add self name to the list of stacks on termination,
+        # the TTL service (discovery) stays until it's removed explicitly
+        if not props.discovery:
+            props.stack_names.append(self.stack_name)
         props.region = self.region
         props.account = self.account
         self._ttl = TTL(
@@ -117,6 +436,17 @@ class TTLStack(Stack):
             props=props
         )
         
+def ttl_tag_stacks(stacks: list, ttl: int, stack_ttls: dict=None):
+    """
+        Tag stacks for the TTL service (TTLProps.discovery), they expire `ttl` minutes
+        after their last deploy, stack_ttls: stack name -> own minutes
+    """
+    stack_ttls = stack_ttls or {}
+    for stack in stacks:
+        if stack.termination_protection is True:
+            continue
+        core.Tags.of(stack).add(TTL_MINUTES_TAG, str(stack_ttls.get(stack.stack_name, ttl)))
+
 # return Stack with TTL termination stacks get as argumetns of the functions
 def ttl_termination_stack_factory(
         scope: Construct, construct_id: str, 
@@ -131,6 +461,17 @@ def ttl_termination_stack_factory(
             continue
         ttl_props.stack_names.append(stack.stack_name)
         log.info(f"Added stack {stack.stack_name} to TTL termination stack")
+
+    # add_dependency() of the stacks, the lambda deletes dependents first
+    dependencies = dict(ttl_props.dependencies or {})
+    for stack in stacks:
+        depends_on = [
+            dependency.stack_name for dependency in stack.dependencies
+            if dependency.stack_name in ttl_props.stack_names
+        ]
+        if stack.stack_name in ttl_props.stack_names and depends_on:
+            dependencies[stack.stack_name] = sorted(set(dependencies.get(stack.stack_name, [])) | set(depends_on))
+    ttl_props.dependencies = dependencies
     
     log.info("Create TTL termination stack with follow props:")
     log.info(f"{ttl_props}")
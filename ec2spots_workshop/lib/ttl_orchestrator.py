@@ -0,0 +1,193 @@
+"""
+Step Functions teardown of TTL stacks
+
+The state machine gets {"waves": [[stack, ...], ...]}, waves go one after another,
+stacks of a wave are deleted by a Map state at once (max_concurrency):
+
+    DeleteStack -> Wait -> DescribeStacks -> DELETE_COMPLETE / gone  -> DELETED
+                     ^                    -> DELETE_FAILED / errors -> FAILED
+                     +-------------------- other statuses
+
+A failed stack doesn't stop the others, the TTL stack is deleted last and only when
+every stack is deleted. The waves come from lambda/ttl_waves.py, the same order as the TTL function.
+https://docs.aws.amazon.com/step-functions/latest/dg/amazon-states-language-map-state.html
+"""
+
+import os
+import importlib.util
+
+from aws_cdk import (
+    Duration,
+    aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as sfn_tasks,
+)
+
+from constructs import Construct
+from dataclasses import dataclass
+
+
+@dataclass
+class TTLOrchestratorProps:
+    """
+    Properties for TTLOrchestrator
+
+    Args:
+        stack_arns (list): ARNs of the stacks the state machine may delete (IAM)
+        ttl_stack_name (str): deleted after all the other stacks, None - never
+        max_concurrency (int): stacks of a wave deleted at once
+        wait_delay (int): seconds between DescribeStacks calls
+        timeout (int): minutes of one execution
+    """
+    stack_arns: list
+    ttl_stack_name: str=None
+    max_concurrency: int=10
+    wait_delay: int=30
+    timeout: int=240
+
+
+def _load_ttl_waves():
+    # 'lambda' is a keyword, the module of the function asset is loaded by path
+    path = os.path.join(os.path.dirname(__file__), "..", "lambda", "ttl_waves.py")
+    spec = importlib.util.spec_from_file_location("ttl_waves", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+ttl_waves = _load_ttl_waves()
+
+
+def deletion_order(stack_names: list, dependencies: dict=None) -> list:
+    """
+        Waves of stacks, dependents first. dependencies: stack name -> stacks it depends on,
+        a dependency cycle is deleted in one wave like in the TTL function
+    """
+    blockers = ttl_waves.dependency_blockers(stack_names, dependencies or {})
+    return ttl_waves.deletion_waves(stack_names, blockers)
+
+
+class TTLOrchestrator(Construct):
+    def _stack_branch(self, props: TTLOrchestratorProps) -> sfn.IChainable:
+        """
+            Delete one stack and wait for it, the result is {"stack_name", "status"}
+        """
+        deleted = sfn.Pass(
+            self, "Stack Deleted",
+            parameters={"stack_name.$": "$.stack_name", "status": "DELETED"}
+        )
+        failed = sfn.Pass(
+            self, "Stack Failed",
+            parameters={"stack_name.$": "$.stack_name", "status": "FAILED", "error.$": "$.error"}
+        )
+        delete_failed = sfn.Pass(
+            self, "Delete Failed",
+            parameters={
+                "stack_name.$": "$.stack_name",
+                "status": "FAILED",
+                # StackStatusReason is optional, the whole description is kept
+                "error.$": "$.describe",
+            }
+        )
+
+        delete_stack = sfn_tasks.CallAwsService(
+            self, "Delete Stack",
+            service="cloudformation",
+            action="deleteStack",
+            iam_resources=props.stack_arns,
+            parameters={"StackName.$": "$.stack_name"},
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        wait = sfn.Wait(
+            self, "Wait Deletion",
+            time=sfn.WaitTime.duration(Duration.seconds(props.wait_delay))
+        )
+        describe_stack = sfn_tasks.CallAwsService(
+            self, "Describe Stack",
+            service="cloudformation",
+            action="describeStacks",
+            iam_resources=props.stack_arns,
+            parameters={"StackName.$": "$.stack_name"},
+            result_selector={"Stacks.$": "$.Stacks"},
+            result_path="$.describe",
+        )
+        delete_stack.add_retry(
+            errors=["CloudFormation.CloudFormationException"],
+            interval=Duration.seconds(2),
+            max_attempts=3,
+            backoff_rate=2,
+        )
+        delete_stack.add_catch(failed, errors=["States.ALL"], result_path="$.error")
+
+        # a deleted stack doesn't exist for DescribeStacks (ValidationError), throttling waits again
+        describe_error = sfn.Choice(self, "Describe Error")
+        describe_error.when(sfn.Condition.string_matches("$.error.Cause", "*does not exist*"), deleted)
+        describe_error.when(sfn.Condition.string_matches("$.error.Cause", "*Rate exceeded*"), wait)
+        describe_error.otherwise(failed)
+        describe_stack.add_catch(describe_error, errors=["States.ALL"], result_path="$.error")
+
+        status = sfn.Choice(self, "Stack Status")
+        status.when(sfn.Condition.string_equals("$.describe.Stacks[0].StackStatus", "DELETE_COMPLETE"), deleted)
+        status.when(sfn.Condition.string_equals("$.describe.Stacks[0].StackStatus", "DELETE_FAILED"), delete_failed)
+        status.otherwise(wait)
+
+        return delete_stack.next(wait).next(describe_stack).next(status)
+
+    def __init__(self, scope: Construct, id: str, props: TTLOrchestratorProps, **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        delete_stacks = sfn.Map(
+            self, "Delete Stacks",
+            max_concurrency=props.max_concurrency,
+            parameters={"stack_name.$": "$$.Map.Item.Value"},
+        )
+        # Map.item_processor isn't in aws-cdk-lib 2.95.0 (requirements.txt), iterator is the inline processor
+        delete_stacks.iterator(self._stack_branch(props))
+
+        # waves one by one, dependents are gone before the stacks they depend on
+        delete_waves = sfn.Map(
+            self, "Delete Waves",
+            items_path="$.waves",
+            max_concurrency=1,
+            result_path="$.results",
+        )
+        delete_waves.iterator(delete_stacks)
+
+        # one list of results and statuses, intrinsic functions take plain paths only
+        flatten = sfn.Pass(
+            self, "Flatten Results",
+            parameters={
+                "results.$": "$.results[*][*]",
+                "statuses.$": "$.results[*][*].status",
+            }
+        )
+        summary = sfn.Pass(
+            self, "Summary",
+            parameters={
+                "results.$": "$.results",
+                "failed.$": "States.ArrayContains($.statuses, 'FAILED')",
+            }
+        )
+        left = sfn.Fail(self, "Stacks Left", error="TTLStacksFailed", cause="Some stacks were not deleted")
+        done = sfn.Succeed(self, "Stacks Deleted")
+
+        all_deleted = sfn.Choice(self, "All Deleted")
+        all_deleted.when(sfn.Condition.boolean_equals("$.failed", True), left)
+        if props.ttl_stack_name:
+            # last one, it removes this state machine, running executions finish
+            delete_ttl_stack = sfn_tasks.CallAwsService(
+                self, "Delete TTL Stack",
+                service="cloudformation",
+                action="deleteStack",
+                iam_resources=props.stack_arns,
+                parameters={"StackName": props.ttl_stack_name},
+                result_path=sfn.JsonPath.DISCARD,
+            )
+            all_deleted.otherwise(delete_ttl_stack.next(done))
+        else:
+            all_deleted.otherwise(done)
+
+        chain = delete_waves.next(flatten).next(summary).next(all_deleted)
+        self.state_machine = sfn.StateMachine(
+            self, "TTL State Machine",
+            definition_body=sfn.DefinitionBody.from_chainable(chain),
+            timeout=Duration.minutes(props.timeout)
+        )
@@ -0,0 +1,150 @@
+"""
+    Boot scripts and data files of an instance as one content-addressed asset.
+
+    All files are packed into a reproducible tar.gz (sorted entries, fixed mtime/owner),
+    the archive is named by its sha256. Constructs of the same stack which ship the same
+    files share one Asset, and an instance makes a single S3 GET on boot:
+
+        aws s3 cp s3://<assets bucket>/<key> /tmp/user-data-<sha>.tar.gz
+        echo "<sha>  /tmp/user-data-<sha>.tar.gz" | sha256sum -c - || exit 1
+        tar -xzf /tmp/user-data-<sha>.tar.gz -C /opt/user-data/<sha> || exit 1
+        /opt/user-data/<sha>/<script> ...   # scripts in the given order
+"""
+import os
+import io
+import gzip
+import tarfile
+import hashlib
+
+from typing import List
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+    aws_iam as iam,
+    aws_s3_assets as Asset
+)
+from constructs import Construct
+
+# per user, not the shared system temp dir: another user could plant an archive under a known hash
+BUNDLE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "cdk-user-data-bundles")
+INSTALL_DIR = "/opt/user-data"
+
+
+def _bundle_entries(paths: List[str]) -> list:
+    """
+        (archive name, file path) of every file, directories are added recursively
+    """
+    entries = {}
+    for path in paths:
+        if not os.path.exists(path):
+            raise ValueError(f"Script path {path} not found")
+        base = os.path.basename(os.path.normpath(path))
+        if os.path.isdir(path):
+            files = [
+                (os.path.join(base, os.path.relpath(os.path.join(root, name), path)), os.path.join(root, name))
+                for root, _, names in os.walk(path) for name in names
+            ]
+        else:
+            files = [(base, path)]
+        for name, file_path in files:
+            if name in entries and os.path.realpath(entries[name]) != os.path.realpath(file_path):
+                raise ValueError(f"Two files have the same name {name} in the user data bundle")
+            entries[name] = file_path
+    return sorted(entries.items())
+
+
+def _file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def build_bundle(paths: List[str], bundle_dir: str=None) -> (str, str):
+    """
+        Reproducible tar.gz of the files, returns (archive path, sha256).
+        The same files give the same bytes, so the asset hash is stable between synths.
+    """
+    raw = io.BytesIO()
+    with tarfile.open(fileobj=raw, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        for name, file_path in _bundle_entries(paths):
+            info = tar.gettarinfo(file_path, arcname=name)
+            info.mtime = 0
+            info.uid = info.gid = 0
+            info.uname = info.gname = "root"
+            info.mode = 0o755 if name.endswith(".sh") or os.access(file_path, os.X_OK) else 0o644
+            with open(file_path, "rb") as f:
+                tar.addfile(info, f)
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode="wb", filename="", mtime=0) as gz:
+        gz.write(raw.getvalue())
+    content = compressed.getvalue()
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    bundle_dir = bundle_dir or BUNDLE_DIR
+    os.makedirs(bundle_dir, mode=0o700, exist_ok=True)
+    bundle_path = os.path.join(bundle_dir, f"{sha256}.tar.gz")
+    # an existing archive is reused only when it still has the content of its name
+    if not os.path.exists(bundle_path) or _file_sha256(bundle_path) != sha256:
+        tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, bundle_path)
+    return bundle_path, sha256
+
+
+class UserDataBundle:
+    """
+    Scripts and data files shipped to instances as one archive
+
+    Args:
+        scripts (list): scripts executed on boot, in this order
+        data_files (list): files or directories which are only unpacked next to the scripts
+        bundle_dir (str): directory of the archives, default is BUNDLE_DIR
+    """
+
+    def __init__(self, scripts: List[str], data_files: List[str]=None, bundle_dir: str=None) -> None:
+        self.scripts = list(scripts)
+        self.data_files = list(data_files or [])
+        self.path, self.sha256 = build_bundle(self.scripts + self.data_files, bundle_dir)
+
+    @property
+    def install_dir(self) -> str:
+        return f"{INSTALL_DIR}/{self.sha256[:16]}"
+
+    def asset(self, scope: Construct) -> Asset.Asset:
+        """
+            One Asset per stack and content, other constructs of the stack reuse it
+        """
+        stack = Stack.of(scope)
+        asset_id = f"UserDataBundle-{self.sha256[:16]}"
+        asset = stack.node.try_find_child(asset_id)
+        if asset is None:
+            asset = Asset.Asset(stack, asset_id, path=self.path)
+        return asset
+
+    def add_to(self, scope: Construct, user_data: ec2.UserData, role: iam.IRole=None) -> Asset.Asset:
+        """
+            Download once, verify the checksum, unpack and run the scripts
+        """
+        asset = self.asset(scope)
+        archive = user_data.add_s3_download_command(
+            bucket=asset.bucket,
+            bucket_key=asset.s3_object_key,
+            local_file=f"/tmp/user-data-{self.sha256[:16]}.tar.gz"
+        )
+        # user data of for_linux() has no 'set -e', a failed download or check has to stop the boot here
+        user_data.add_commands(
+            f"echo '{self.sha256}  {archive}' | sha256sum -c - || exit 1",
+            f"mkdir -p {self.install_dir}",
+            f"tar -xzf {archive} -C {self.install_dir} || exit 1",
+        )
+        for script in self.scripts:
+            user_data.add_execute_file_command(
+                file_path=f"{self.install_dir}/{os.path.basename(os.path.normpath(script))}"
+            )
+        if role is not None:
+            asset.grant_read(role)
+        return asset
@@ -1,7 +1,7 @@
 # AMI linux
-import boto3        
 import aws_cdk as core 
-from operator import itemgetter
+from fnmatch import fnmatchcase
+from concurrent.futures import ThreadPoolExecutor
 from aws_cdk import (
     aws_ec2 as ec2,
     aws_iam as iam,
@@ -10,7 +10,11 @@ from aws_cdk import (
 
 import os
 import logging
-from requests import get
+import functools
+import threading
+from .lookup_cache import LookupCache
+from .profiler import profiled
+from .boto_replay import install_from_env
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -26,42 +30,173 @@ def _get_latest_amnz_ami():
     )
     return amnz_linux
 
-def _describe_ami(pattern: dict):
-    ec2_client = boto3.client('ec2') 
-    images = ec2_client.describe_images(
-            Filters=[
-                {
-                    'Name': 'architecture',
-                    'Values': [
-                        pattern.get("architecture"),
-                    ]
-                },{
-                    'Name': 'name',
-                    'Values': [
-                        pattern.get("name") ,
-                    ]
-                }
-            ],
-            Owners=[
-                pattern.get("owner"),
-            ],
-        )
-    image_details = sorted(images['Images'],key=itemgetter('CreationDate'),reverse=True)
-    image_details[0]['ImageId']
-    return image_details[0]['ImageId']
+AMI_CACHE_TTL = 24 * 3600
+
+_ec2_clients = {}
+# creating clients from the default boto3 session isn't thread safe
+_ec2_clients_lock = threading.Lock()
+
+def _ec2_client(region: str=None):
+    """
+        One EC2 client per region for the whole synth,
+        recorded / replayed when BOTO_REPLAY is set
+    """
+    with _ec2_clients_lock:
+        if region not in _ec2_clients:
+            import boto3
+            install_from_env()
+            _ec2_clients[region] = boto3.client('ec2', region_name=region)
+        return _ec2_clients[region]
+
+def _ami_cache_key(region: str, pattern: dict) -> str:
+    return ":".join([
+        "ami", str(region),
+        str(pattern.get("owner")),
+        str(pattern.get("architecture")),
+        str(pattern.get("name"))
+    ])
+
+def _newest_images(images, names: list) -> dict:
+    """
+        Linear pass over images, keep the newest image for every name pattern
+    """
+    newest = {}
+    for image in images:
+        for name in names:
+            if not fnmatchcase(image.get("Name", ""), name):
+                continue
+            current = newest.get(name)
+            if current is None or image['CreationDate'] > current['CreationDate']:
+                newest[name] = image
+    return newest
+
+def _describe_latest_images(region: str, owner: str, architecture: str, names: list) -> dict:
+    """
+        One paginated describe_images call for all name patterns of the same owner/architecture
+    """
+    paginator = _ec2_client(region).get_paginator('describe_images')
+    pages = paginator.paginate(
+        Filters=[
+            {
+                'Name': 'architecture',
+                'Values': [
+                    architecture,
+                ]
+            },{
+                'Name': 'name',
+                'Values': names
+            }
+        ],
+        Owners=[
+            owner,
+        ],
+    )
+    images = (image for page in pages for image in page['Images'])
+    return {
+        name: image['ImageId'] for name, image in _newest_images(images, names).items()
+    }
+
+@profiled()
+def describe_latest_amis(patterns: list, regions: list, cache: LookupCache=None) -> dict:
+    """
+        Resolve the newest AMI ID for every (region, pattern) pair.
+        Results are kept in cdk.lookups.json for CDK_AMI_CACHE_TTL seconds,
+        missed entries are resolved with one batched request per (region, owner, architecture).
+
+        Returns:
+            dict: cache key (see _ami_cache_key) -> AMI ID
+    """
+    cache = cache or LookupCache()
+    ttl = int(os.environ.get("CDK_AMI_CACHE_TTL", AMI_CACHE_TTL))
+    keys = {
+        _ami_cache_key(region, pattern): (region, pattern)
+        for region in regions for pattern in patterns
+    }
+    result = cache.get_many(list(keys))
+
+    batches = {}
+    for key, (region, pattern) in keys.items():
+        if key in result:
+            continue
+        batch = (region, pattern.get("owner"), pattern.get("architecture"))
+        batches.setdefault(batch, set()).add(pattern.get("name"))
+    if not batches:
+        return result
+
+    log.info(f"Describe AMIs for {len(batches)} region/owner groups")
+    # clients are created here, the pool threads only use them
+    for region in {region for region, _, _ in batches}:
+        _ec2_client(region)
+    with ThreadPoolExecutor(max_workers=min(len(batches), 8)) as executor:
+        futures = {
+            executor.submit(_describe_latest_images, region, owner, architecture, sorted(names)): (region, owner, architecture)
+            for (region, owner, architecture), names in batches.items()
+        }
+        resolved = {}
+        for future, (region, owner, architecture) in futures.items():
+            for name, ami_id in future.result().items():
+                key = _ami_cache_key(region, {"owner": owner, "architecture": architecture, "name": name})
+                resolved[key] = ami_id
+
+    cache.set_many(resolved, ttl=ttl)
+    result.update(resolved)
+    return result
 
-def get_latest_linux_ami_from_aws(pattern: dict, region: str) -> str:
-    log.info(f"Getting latest linux AMI from AWS")
+def _describe_ami(pattern: dict, region: str=None) -> str:
+    key = _ami_cache_key(region, pattern)
+    images = describe_latest_amis([pattern], [region])
+    if key not in images:
+        raise ValueError(f"There is no image for {pattern} in {region}")
+    return images[key]
+
+# AMI resolution modes
+#  synth  - AMI ID is looked up via EC2 API on synth and baked into the template
+#  deploy - template refers to SSM parameter, CloudFormation resolves it on every deploy
+AMI_RESOLUTION_SYNTH = "synth"
+AMI_RESOLUTION_DEPLOY = "deploy"
+
+def get_linux_ami_from_ssm(parameter_name: str) -> ec2.IMachineImage:
+    """
+        AMI ID from SSM parameter, resolved by CloudFormation at deploy time
+        (AWS::SSM::Parameter::Value<AWS::EC2::Image::Id> template parameter)
+    """
+    return ec2.MachineImage.from_ssm_parameter(
+        parameter_name,
+        os=ec2.OperatingSystemType.LINUX
+    )
+
+@profiled()
+def get_latest_linux_ami_from_aws(pattern: dict, region: str, resolution: str=None) -> ec2.IMachineImage:
+    """
+        Image for WebAsgProps.ami_image / ClusterProps.ami_image
+
+        Args:
+            pattern (dict): owner, architecture, name and optional ssm_parameter,
+                the parameter which keeps the newest AMI ID of a custom owner
+                (e.g. published by EC2 Image Builder)
+            region (str): region of the stack
+            resolution (str): 'synth' or 'deploy', default is CDK_AMI_RESOLUTION or 'synth'
+    """
+    resolution = resolution or os.environ.get("CDK_AMI_RESOLUTION", AMI_RESOLUTION_SYNTH)
+    if resolution not in (AMI_RESOLUTION_SYNTH, AMI_RESOLUTION_DEPLOY):
+        raise ValueError(f"Unknown AMI resolution '{resolution}'")
+    log.info(f"Getting latest linux AMI from AWS, resolution {resolution}")
     _latest_image = None
-    if pattern.get("owner") == "amazon":
+    if pattern.get("ssm_parameter") and resolution == AMI_RESOLUTION_DEPLOY:
+        _latest_image = get_linux_ami_from_ssm(pattern.get("ssm_parameter"))
+    elif pattern.get("owner") == "amazon":
+        # public SSM parameter, it's always resolved on deploy
         _latest_image = _get_latest_amnz_ami()
         log.debug(f"the linux AMI will be {_latest_image}")
+    elif resolution == AMI_RESOLUTION_DEPLOY:
+        raise ValueError(
+            f"AMI pattern {pattern} needs 'ssm_parameter' to be resolved on deploy")
     else:
         # Get latest image from AWS
         # aws ec2 describe-images --filters Name=owner-id,Values=777548758970 --query 'sort_by(Images, &CreationDate)[].Name' --region us-west-1 | jq '.[1]'
         # Sort on Creation date Desc
         try:
-            ami_id = _describe_ami(pattern)
+            ami_id = _describe_ami(pattern, region)
             _latest_image = ec2.MachineImage.generic_linux({
                 region : ami_id      
             })
@@ -91,6 +226,61 @@ def get_current_env() -> core.Environment:
         raise
     return env
 
-def get_my_external_ip():
-    ip = get('https://api.ipify.org').content.decode('utf8')
-    return f"{ip}/32"
\ No newline at end of file
+EXTERNAL_IP_URL = "https://api.ipify.org"
+EXTERNAL_IP_CONTEXT_KEY = "external_ip"
+EXTERNAL_IP_CACHE_KEY = "external-ip"
+
+
+def _http_get(url: str, timeout: float):
+    # requests is imported only when the lookup really goes to the network
+    from requests import get
+    return get(url, timeout=timeout)
+
+def _as_cidr(ip: str) -> str:
+    ip = ip.strip()
+    return ip if "/" in ip else f"{ip}/32"
+
+@functools.lru_cache(maxsize=None)
+def _lookup_external_ip() -> str:
+    """
+        Resolve external IP once per process:
+        disk cache first, then ipify with a hard timeout
+    """
+    cache = LookupCache()
+    ip = cache.get(EXTERNAL_IP_CACHE_KEY)
+    if ip is not None:
+        log.debug(f"External IP {ip} from {cache.path}")
+        return ip
+
+    timeout = float(os.environ.get("CDK_EXTERNAL_IP_TIMEOUT", 5))
+    ttl = int(os.environ.get("CDK_EXTERNAL_IP_TTL", 3600))
+    try:
+        response = _http_get(EXTERNAL_IP_URL, timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        log.error(f" Can't resolve external IP via {EXTERNAL_IP_URL} in {timeout}s,"
+                  f" set CDK_EXTERNAL_IP or '-c {EXTERNAL_IP_CONTEXT_KEY}=<ip>' to skip the lookup")
+        raise e
+    ip = _as_cidr(response.content.decode('utf8'))
+    cache.set(EXTERNAL_IP_CACHE_KEY, ip, ttl=ttl)
+    log.info(f"External IP: {ip}")
+    return ip
+
+@profiled()
+def get_my_external_ip(scope=None) -> str:
+    """
+        Return external IP of this host as CIDR (x.x.x.x/32).
+        Order of resolving:
+        - cdk context 'external_ip' (if scope is provided)
+        - CDK_EXTERNAL_IP environment variable
+        - in-process memo / cdk.lookups.json cache (CDK_EXTERNAL_IP_TTL seconds)
+        - api.ipify.org with CDK_EXTERNAL_IP_TIMEOUT seconds timeout
+    """
+    if scope is not None:
+        ip = scope.node.try_get_context(EXTERNAL_IP_CONTEXT_KEY)
+        if ip:
+            return _as_cidr(ip)
+    ip = os.environ.get("CDK_EXTERNAL_IP")
+    if ip:
+        return _as_cidr(ip)
+    return _lookup_external_ip()
\ No newline at end of file
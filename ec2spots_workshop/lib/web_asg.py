@@ -6,17 +6,17 @@ from aws_cdk import (
     aws_kms as kms, 
     aws_iam as iam,
     aws_autoscaling as asg,
-    custom_resources as cr, 
-    aws_s3_assets as Asset
+    custom_resources as cr
 )
 from constructs import Construct
+from .profiler import profiled
 from .props import WebAsgProps
 from .utils import get_my_external_ip, get_latest_linux_ami_from_aws
+from .user_data_bundle import UserDataBundle
 
 import os
 import time
 import logging
-import boto3
 
 from operator import itemgetter
 from typing import List, Dict
@@ -129,33 +129,11 @@ class WebAsg(Construct):
     
     def _asset_user_data(self, asg, script_paths: List[str]):
         """
-        Create an asset for each script in the list
+        Ship all scripts as one content-addressed bundle (see user_data_bundle.py)
         """
-        assets = []
-        for script_path in script_paths:
-            asset = Asset.Asset(
-                self, f"{self._prefix}-asset",
-                path=script_path
-            )
-
-            local_path = asg.user_data.add_s3_download_command(
-                bucket=asset.bucket,
-                bucket_key=asset.s3_object_key
-            )
-
-            assets.append(asset)
-
-        # Add commands to execute downloaded scripts
-        for asset in assets:
-            asg.user_data.add_execute_file_command(
-                file_path=local_path
-            )
-
-        # Grant read permissions for all assets to the instance role
-        for asset in assets:
-            asset.grant_read(self._instance_role)
-
-        return assets
+        asset = UserDataBundle(script_paths).add_to(
+            self, asg.user_data, role=self._instance_role)
+        return [asset]
     
     def _create_asg(
             self, props: WebAsgProps,
@@ -175,12 +153,14 @@ class WebAsg(Construct):
             mixed_instances_policy=mixed_instances_policy,
         )
         
+    @profiled()
     def asset_user_data(self, data_path: str=None):
         script_paths=[]
         script_paths.append(
             os.path.join(dirname, f"{self.props.data_path}/scripts/user_data.sh"))
         return self._asset_user_data(self._asg, script_paths)
     
+    @profiled()
     def create_asg(self, props: WebAsgProps=None):
         if props is None:
             props = self.props
@@ -203,6 +183,7 @@ class WebAsg(Construct):
             subnets=props.subnets
         )
 
+    @profiled()
     def __init__(
             self,
             scope: Construct,
@@ -10,24 +10,25 @@ from aws_cdk import (
 )
 
 from constructs import Construct
-from .base_network  import BaseNetwork
-from .ec2_spot import EC2Spot, EC2Props
-from .web_asg import WebAsg
-from .ecs import ECS
-from .aws_framework import AWSFramework
-from .props import WebAsgProps, ECSProps, ClusterProps
-from .utils import get_my_external_ip
+from .profiler import profiled
+from .props import WebAsgProps, ECSProps, ClusterProps, EnvProps, DEFAULT_SUBNET_TIERS
+
+# the constructs of a stack are imported by the stack itself,
+# an app imports only the modules of the stacks it creates (see lib/__init__.py)
 
 
 class WorkshopEC2SpotStack(Stack):
     # TODO list mixed instance policy
     # - use spot but without mix
+    @profiled()
     def __init__(
             self, scope: Construct, construct_id: str, 
             env_props, 
             ec2_type: str,
-            ami_image: str, 
+            ami_image: ec2.IMachineImage, 
             **kwargs) -> None:
+        from .base_network import BaseNetwork
+        from .ec2_spot import EC2Spot, EC2Props
         super().__init__(scope, construct_id, **kwargs)
 
         base_env = BaseNetwork(self, f"${env_props.prefix}-base-network-env", env_props)
@@ -45,7 +46,12 @@ class WorkshopWebAsgStack(Stack):
     def add_assets(self):
         self._web_asg.asset_user_data()
     
+    @profiled()
     def __init__(self, scope: Construct, construct_id: str, prefix: str, props: WebAsgProps, **kwargs) -> None:
+        from .base_network import BaseNetwork
+        from .web_asg import WebAsg
+        from .aws_framework import AWSFramework
+        from .utils import get_my_external_ip
         super().__init__(scope, construct_id, **kwargs)
         # [WARNING] aws-cdk-lib.aws_ec2.SubnetType#PRIVATE_WITH_NAT is deprecated.
         subnets = ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS)
@@ -63,7 +69,9 @@ class WorkshopWebAsgStack(Stack):
                 "ec2messages",
                 "ssmmessages"
             ],
-            subnets=subnets
+            subnets=subnets,
+            # user data assets are downloaded from S3
+            gateway_services=["s3"]
         )
 
         props.vpc = base_env.vpc
@@ -71,7 +79,7 @@ class WorkshopWebAsgStack(Stack):
         props.sg = base_env.create_securety_group(
             name = "sg-asg-hosts",
             ports=[443, 8080, 3389], 
-            allow_ip_addresses=[props.vpc.vpc_cidr_block, get_my_external_ip()]
+            allow_ip_addresses=[props.vpc.vpc_cidr_block, get_my_external_ip(self)]
             # allow_ip_addresses=[props.vpc.vpc_cidr_block]
         )
         self._web_asg = WebAsg(self, f"{props.prefix}-web-asg-stack", props )
@@ -103,7 +111,11 @@ class WorkshopEnvStask(Stack):
     def acm_cert(self):
         return self._acm_certificate
 
+    @profiled()
     def __init__(self, scope: Construct, construct_id: str, prefix: str, props, **kwargs) -> None:
+        from .base_network import BaseNetwork
+        from .aws_framework import AWSFramework
+        from .utils import get_my_external_ip
         super().__init__(scope, construct_id, **kwargs)
         self._prefix = prefix
         self._base_env = BaseNetwork(
@@ -112,10 +124,14 @@ class WorkshopEnvStask(Stack):
             props=props, 
             region=self.region, account=self.account)
         self._vpc = self._base_env.create_vpc(is_natgw=True)
-        self._base_env.create_endpoints(
-            service_names=props.endpoints,
-            subnets=props.endpoint_subnets
-        )
+        # the shared network has the endpoints already
+        if not props.shared_network:
+            self._base_env.create_endpoints(
+                service_names=props.endpoints,
+                subnets=props.endpoint_subnets,
+                gateway_services=props.gateway_endpoints,
+                policies=props.endpoint_policies
+            )
 
         aws_framework = AWSFramework(self, f"{prefix}-framwork-ecs-env")
         sg_alb = aws_framework.create_securety_group(
@@ -123,7 +139,7 @@ class WorkshopEnvStask(Stack):
             name = f"{self._prefix}-sg-alb-hosts",
             vpc=self._vpc,
             ports=[443, 80, 8080, 3389], 
-            allow_ip_addresses=[props.cidr_block, get_my_external_ip()]
+            allow_ip_addresses=[props.cidr_block, get_my_external_ip(self)]
         )
 
         # move to Env 
@@ -141,6 +157,47 @@ class WorkshopEnvStask(Stack):
             internet_facing=props.alb_internet_facing,
         )
 
+class SharedNetworkStack(Stack):
+    """
+    stack creates one VPC for all apps
+    - VPC with the subnet tiers and NAT mode of EnvProps
+    - interface and gateway endpoints of EnvProps
+    - SSM parameters /<name>/network/... with the IDs, see lib.shared_network
+    apps set EnvProps.shared_network=<name> to import it
+    """
+    @property
+    def vpc(self):
+        return self._vpc
+
+    @profiled()
+    def __init__(self, scope: Construct, construct_id: str, name: str, props: EnvProps, **kwargs) -> None:
+        from .base_network import BaseNetwork
+        from .shared_network import publish_network, network_layout
+        super().__init__(scope, construct_id, **kwargs)
+        self._base_env = BaseNetwork(
+            self, f"{name}-base-network",
+            prefix=name,
+            props=props,
+            region=self.region, account=self.account)
+        self._vpc = self._base_env.create_vpc(is_natgw=True)
+        self._base_env.create_endpoints(
+            service_names=props.endpoints,
+            subnets=props.endpoint_subnets,
+            gateway_services=props.gateway_endpoints,
+            policies=props.endpoint_policies
+        )
+        subnet_tiers = props.subnet_tiers or DEFAULT_SUBNET_TIERS
+        publish_network(
+            self, name,
+            vpc=self._vpc,
+            subnet_groups={
+                tier.name: BaseNetwork.subnet_group_name(name, tier.name)
+                for tier in subnet_tiers if not tier.reserved
+            },
+            layout=network_layout(len(self._vpc.availability_zones), subnet_tiers),
+            endpoints=self._base_env.endpoints
+        )
+
 class WorkshopECSStack(Stack):
     @property
     def cluster(self):
@@ -166,8 +223,12 @@ class WorkshopECSStack(Stack):
     """
     # TODO fix deletion EC2, the instance attached to public IP
     # devide on two stack: cluster and capasity
+    @profiled()
     def __init__(
         self, scope: Construct, construct_id: str, prefix: str, props: ECSProps, **kwargs) -> None:
+        from .ecs import ECS
+        from .aws_framework import AWSFramework
+        from .utils import get_my_external_ip
         super().__init__(scope, construct_id, **kwargs)
         self._prefix = prefix
         # 1 VPC with 2 subnets; 1 public and 1 private subnets
@@ -186,7 +247,7 @@ class WorkshopECSStack(Stack):
             name = f"{self._prefix}-sg-asg-hosts",
             vpc=props.cluster_props.vpc,
             ports=[443, 80, 8080, 3389], 
-            allow_ip_addresses=[props.env_props.cidr_block, get_my_external_ip()]
+            allow_ip_addresses=[props.env_props.cidr_block, get_my_external_ip(self)]
         )
 
         self._asg = self._ecs.create_asg_for_ecs(
@@ -207,8 +268,10 @@ class WorkshopECSStack(Stack):
         # ? Cloud9 Environment and its IAM Role 
 
 class WorkshopServiceStack(Stack):
+    @profiled()
     def __init__(
         self, scope: Construct, construct_id: str, prefix: str, props: ClusterProps, **kwargs) -> None:
+        from .ecs import ECS
         super().__init__(scope, construct_id, **kwargs)
         self._prefix = prefix
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import os
+import sys
+import logging
+import aws_cdk as core
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../../../ec2spots_workshop"))
+
+from lib import (
+    EnvProps
+    , SharedNetworkStack
+    , utils
+)
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# one VPC for the workshop apps, they import it with
+#   EnvProps(shared_network="shared")  or  cdk synth -c shared_network=shared
+env = utils.get_current_env()
+tags = {
+    "Region" : env.region,
+    "Owner" : "smarkin",
+    "Environment" : "dev",
+    "Role": "network",
+    "Type": "cdk"
+}
+
+app = core.App()
+name = app.node.try_get_context("shared_network") or "shared"
+
+network_stack = SharedNetworkStack(
+    app, f"{name.capitalize()}-Network-Stack"
+    , name=name
+    , props=EnvProps(
+        cidr_block="172.30.0.0/22"
+        , max_avz=2
+        , endpoints = [
+                "ecs",
+                "ecs-agent",
+                "ssm",
+                "ecr.dkr"
+            ]
+        , endpoint_subnets=core.aws_ec2.SubnetSelection(subnet_type=core.aws_ec2.SubnetType.PRIVATE_WITH_EGRESS)
+        , gateway_endpoints=["s3"]
+        , propertis={
+            "create_internet_gateway":True,
+            "enable_dns_hostnames":True,
+            "enable_dns_support":True,
+        }
+    )
+    , env=env
+)
+
+utils.add_tags([network_stack], tags)
+app.synth()
@@ -47,6 +47,8 @@ ecs_props = ECSProps(
             ]
         , max_avz=2
         , endpoint_subnets=core.aws_ec2.SubnetSelection(subnet_type=core.aws_ec2.SubnetType.PRIVATE_WITH_EGRESS)
+        # ECR image layers and user data assets bypass the NAT gateway
+        , gateway_endpoints=["s3"]
         , propertis={
             "create_internet_gateway":True,
             "enable_dns_hostnames":True,
@@ -56,6 +58,8 @@ ecs_props = ECSProps(
         , domain_name="taloni.link"
         , hosted_zone_id="Z0764436UNSJQPH92RK7"
         , record_name="test"
+        # -c shared_network=shared imports the VPC of main/shared_network instead
+        , shared_network=app.node.try_get_context("shared_network")
     )
     , cluster_props=ClusterProps(
         subnets = core.aws_ec2.SubnetSelection(subnet_type=core.aws_ec2.SubnetType.PRIVATE_WITH_EGRESS)
@@ -128,7 +132,9 @@ stacks.append(service_stack)
 ttl_props = TTLProps(
     ttl = 120,
     prefix_name = f"{prefix}-ttl",
-    stack_names = []
+    stack_names = [],
+    # ECS services and the Spot ASG are scaled to zero before the stacks are deleted
+    drain = True
 )
 
 ttl_stack = ttl_termination_stack_factory(
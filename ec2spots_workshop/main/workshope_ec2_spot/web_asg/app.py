@@ -44,7 +44,9 @@ ami_image_test = utils.get_latest_linux_ami_from_aws(
     , pattern={
             "owner" : "500480925365",
             "architecture" : "x86_64",
-            "name" : "amazon-linux-2-test"
+            "name" : "amazon-linux-2-test",
+            # used with CDK_AMI_RESOLUTION=deploy
+            "ssm_parameter" : "/workshop/ami/amazon-linux-2-test"
     }
 )
 
@@ -2,9 +2,13 @@ import pytest
 import json
 import os
 
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
 from lib.work_shop_ec2_spot_stack import WorkshopWebAsgStack, WorkshopECSStack
 from lib.props import WebAsgProps, ECSProps
 from lib.utils import get_latest_linux_ami_from_aws, get_current_env
+from .template_cache import CACHE_PREFIX, UncacheableValue, template_key
 
 @pytest.fixture
 def snapshot():
@@ -14,6 +18,34 @@ def snapshot():
     return data
 
 
+@pytest.fixture
+def synth_template(request):
+    """
+        synth_template(StackClass, construct_id, **kwargs) -> template json,
+        taken from the pytest cache while the stack, its props and lib sources are the same
+        (`pytest --cache-clear` synthesizes everything again),
+        props with VPCs, security groups ... and runs without the cache plugin
+        (`-p no:cacheprovider`) are synthesized every time
+    """
+    cache = getattr(request.config, "cache", None)
+
+    def _synth(stack_class, construct_id, **kwargs):
+        key = None
+        if cache is not None:
+            try:
+                key = f"{CACHE_PREFIX}/{template_key(stack_class, construct_id, **kwargs)}"
+            except UncacheableValue:
+                pass
+        template = cache.get(key, None) if key else None
+        if template is None:
+            stack = stack_class(core.App(), construct_id, **kwargs)
+            template = assertions.Template.from_stack(stack).to_json()
+            if key:
+                cache.set(key, template)
+        return template
+    return _synth
+
+
 @pytest.fixture
 def env():
     os.environ["CDK_DEFAULT_ACCOUNT"]="500480925365"
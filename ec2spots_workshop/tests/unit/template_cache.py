@@ -0,0 +1,167 @@
+"""
+    Synthesized templates cached between test runs (pytest cache, .pytest_cache).
+
+    The key is a hash of the stack class, stack id, env, props, the environment and context
+    the stacks read (CDK_EXTERNAL_IP, CDK_AMI_RESOLUTION, CDK_CONTEXT_JSON, the cached external IP)
+    and the sources which make the template: lib/*.py, lambda/ and data/ files and the aws-cdk-lib version.
+    Machine images count by what they render to, props with other jsii objects (VPCs,
+    security groups) raise UncacheableValue and the stack is synthesized every time.
+    An unchanged stack is not synthesized again, see `synth_template` fixture in conftest.py.
+    `diff_templates` compares templates resource by resource.
+"""
+import os
+import json
+import hashlib
+import enum
+import dataclasses
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from importlib import metadata
+from lib.lookup_cache import LookupCache
+from lib.utils import EXTERNAL_IP_CACHE_KEY
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# lambda/ is bundled into the TTL stack assets
+SOURCE_DIRS = ("lib", "lambda", "data")
+CACHE_PREFIX = "template_cache"
+SECTIONS = ("Parameters", "Resources", "Outputs", "Conditions", "Mappings")
+# environment the stacks read on synth
+ENV_INPUTS = ("CDK_EXTERNAL_IP", "CDK_AMI_RESOLUTION", "CDK_CONTEXT_JSON")
+
+
+class UncacheableValue(TypeError):
+    """
+        props hold an object the key can't see into
+    """
+
+
+def _render_image(image, env) -> dict:
+    """
+        What an ec2.IMachineImage renders to in a stack of the same env:
+        the image id and the mappings / SSM parameters it adds to the template
+    """
+    stack = core.Stack(core.App(), "template-key", env=env if isinstance(env, core.Environment) else None)
+    config = image.get_image(stack)
+    return {
+        "__type__": f"{type(image).__module__}.{type(image).__qualname__}",
+        "image_id": stack.resolve(config.image_id),
+        "os_type": str(config.os_type),
+        "template": assertions.Template.from_stack(stack).to_json(),
+    }
+
+
+def _stable(value, env=None):
+    """
+        Json friendly form of props. jsii structs (Environment, SubnetSelection ...) keep
+        their values in `_values`, machine images are rendered, other jsii objects raise UncacheableValue.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {
+            "__type__": type(value).__qualname__,
+            **{field.name: _stable(getattr(value, field.name), env) for field in dataclasses.fields(value)},
+        }
+    if isinstance(value, dict):
+        return {str(key): _stable(item, env) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_stable(item, env) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, enum.Enum):
+        return f"{type(value).__qualname__}.{value.name}"
+    if isinstance(getattr(value, "_values", None), dict):
+        return {"__type__": type(value).__qualname__, **_stable(value._values, env)}
+    if callable(getattr(value, "get_image", None)):
+        return _render_image(value, env)
+    raise UncacheableValue(f"Can't hash {type(value).__module__}.{type(value).__qualname__} for the template cache")
+
+
+def _environment() -> dict:
+    inputs = {name: os.environ.get(name) for name in ENV_INPUTS}
+    # get_my_external_ip falls back to the disk cache, a new IP is a new template
+    inputs["external_ip"] = LookupCache().get(EXTERNAL_IP_CACHE_KEY)
+    return inputs
+
+
+def _sources_digest() -> str:
+    sha = hashlib.sha256()
+    for source_dir in SOURCE_DIRS:
+        for root, dirnames, filenames in os.walk(os.path.join(ROOT, source_dir)):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                sha.update(os.path.relpath(path, ROOT).encode("utf8"))
+                with open(path, "rb") as f:
+                    sha.update(f.read())
+    return sha.hexdigest()
+
+
+_sources = None
+
+
+def template_key(stack_class, construct_id: str, **kwargs) -> str:
+    """
+        Stable hash of everything the template depends on,
+        sources are hashed once per test session. Raises UncacheableValue
+    """
+    global _sources
+    if _sources is None:
+        _sources = _sources_digest()
+    key = json.dumps({
+        "stack": f"{stack_class.__module__}.{stack_class.__qualname__}",
+        "id": construct_id,
+        "kwargs": _stable(kwargs, kwargs.get("env")),
+        "environment": _environment(),
+        "sources": _sources,
+        "cdk": metadata.version("aws-cdk-lib"),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf8")).hexdigest()
+
+
+def _changed_paths(old, new, path=""):
+    if isinstance(old, dict) and isinstance(new, dict):
+        paths = []
+        for key in sorted(set(old) | set(new)):
+            paths += _changed_paths(old.get(key), new.get(key), f"{path}.{key}" if path else key)
+        return paths
+    return [] if old == new else [path or "."]
+
+
+def diff_templates(old: dict, new: dict) -> dict:
+    """
+        Changed template entries: {section: {logical id: 'added' | 'removed' | [changed property paths]}}
+    """
+    diff = {}
+    for section in SECTIONS:
+        old_items, new_items = old.get(section, {}), new.get(section, {})
+        changes = {}
+        for logical_id in sorted(set(old_items) | set(new_items)):
+            if logical_id not in old_items:
+                changes[logical_id] = "added"
+            elif logical_id not in new_items:
+                changes[logical_id] = "removed"
+            else:
+                paths = _changed_paths(old_items[logical_id], new_items[logical_id])
+                if paths:
+                    changes[logical_id] = paths
+        if changes:
+            diff[section] = changes
+    # Description, Rules, AWSTemplateFormatVersion ... as a whole
+    others = {
+        key: "changed"
+        for key in sorted((set(old) | set(new)) - set(SECTIONS))
+        if old.get(key) != new.get(key)
+    }
+    if others:
+        diff["Template"] = others
+    return diff
+
+
+def format_diff(diff: dict) -> str:
+    lines = []
+    for section, changes in diff.items():
+        for logical_id, change in changes.items():
+            detail = change if isinstance(change, str) else "changed " + ", ".join(change)
+            lines.append(f"{section}.{logical_id}: {detail}")
+    return "\n".join(lines)
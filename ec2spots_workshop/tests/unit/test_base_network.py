@@ -0,0 +1,150 @@
+import pytest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import aws_ec2 as ec2
+
+from lib.base_network import BaseNetwork, ecr_layers_statement
+from lib.props import EnvProps, SubnetTier, NAT_PER_AZ
+
+ENV = core.Environment(account="111111111111", region="us-east-1")
+TIERS = [
+    SubnetTier("public", ec2.SubnetType.PUBLIC, 26),
+    SubnetTier("app", cidr_mask=24),
+    SubnetTier("data", ec2.SubnetType.PRIVATE_ISOLATED, 26),
+    SubnetTier("isolated", ec2.SubnetType.PRIVATE_ISOLATED, 27),
+]
+
+
+def _network(props: EnvProps, natgw: bool=True):
+    stack = core.Stack(core.App(), "network", env=ENV)
+    network = BaseNetwork(stack, "network", prefix="test", props=props, region=ENV.region, account=ENV.account)
+    network.create_vpc(is_natgw=natgw)
+    return stack, network
+
+
+@pytest.mark.unit
+def test_default_layout_keeps_one_nat():
+    stack, _ = _network(EnvProps(cidr_block="10.0.0.0/24", max_avz=2, propertis={"create_internet_gateway": True}))
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::EC2::Subnet", 4)
+    template.resource_count_is("AWS::EC2::NatGateway", 1)
+
+
+@pytest.mark.unit
+def test_subnet_tiers_with_nat_per_az():
+    stack, network = _network(EnvProps(
+        cidr_block="10.0.0.0/20", max_avz=2, propertis={"create_internet_gateway": True},
+        subnet_tiers=TIERS, nat_mode=NAT_PER_AZ
+    ))
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::EC2::Subnet", 8)
+    template.resource_count_is("AWS::EC2::NatGateway", 2)
+    template.has_resource_properties("AWS::EC2::Subnet", {"CidrBlock": "10.0.1.0/24"})
+
+    # every app subnet egresses through the gateway of its own AZ
+    app_subnets = network.vpc.select_subnets(subnet_group_name=BaseNetwork.subnet_group_name("test", "app")).subnets
+    public_subnets = network.vpc.select_subnets(subnet_group_name=BaseNetwork.subnet_group_name("test", "public")).subnets
+    assert len(app_subnets) == 2
+    resolve = stack.resolve
+    gateways = {
+        subnet.availability_zone: resolve(subnet.node.find_child("NATGateway").ref) for subnet in public_subnets
+    }
+    for subnet in app_subnets:
+        route = subnet.node.find_child("DefaultRoute")
+        assert resolve(route.nat_gateway_id) == gateways[subnet.availability_zone]
+
+
+@pytest.mark.unit
+def test_nat_needs_public_tier():
+    with pytest.raises(ValueError):
+        _network(EnvProps(
+            cidr_block="10.0.0.0/24", max_avz=2, propertis={},
+            subnet_tiers=[SubnetTier("app")]
+        ))
+
+
+@pytest.mark.unit
+def test_gateway_endpoints_route_private_subnets():
+    stack, network = _network(EnvProps(
+        cidr_block="10.0.0.0/20", max_avz=2, propertis={"create_internet_gateway": True}, subnet_tiers=TIERS
+    ))
+    network.create_endpoints(
+        service_names=["ssm"],
+        subnets=network.subnets("app"),
+        gateway_services=["s3", "dynamodb"],
+        policies={"s3": [ecr_layers_statement(ENV.region)]}
+    )
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 3)
+    # app, data and isolated tiers in 2 AZs, public subnets go through the internet gateway
+    private_tables = [
+        stack.resolve(subnet.route_table.route_table_id)
+        for subnet in network.vpc.private_subnets + network.vpc.isolated_subnets
+    ]
+    assert len(private_tables) == 6
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "VpcEndpointType": "Gateway",
+        "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, ".s3"]]},
+        "RouteTableIds": assertions.Match.array_with(private_tables),
+        "PolicyDocument": {"Statement": [assertions.Match.object_like({
+            "Action": "s3:GetObject",
+            "Resource": "arn:aws:s3:::prod-us-east-1-starport-layer-bucket/*",
+        })]},
+    })
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "VpcEndpointType": "Gateway",
+        "RouteTableIds": assertions.Match.array_with(private_tables),
+        "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, ".dynamodb"]]},
+    })
+
+
+@pytest.mark.unit
+def test_shared_network_published_and_imported():
+    from lib.shared_network import network_parameter, network_layout
+    from lib.work_shop_ec2_spot_stack import SharedNetworkStack
+
+    props = EnvProps(
+        cidr_block="10.0.0.0/20", max_avz=2, propertis={"create_internet_gateway": True},
+        subnet_tiers=TIERS, endpoints=["ssm"], gateway_endpoints=["s3"]
+    )
+    shared = SharedNetworkStack(core.App(), "shared", name="shared", props=props, env=ENV)
+    template = assertions.Template.from_stack(shared)
+    # layout, vpc-id, vpc-cidr, azs, default-sg, subnets and route tables of 4 tiers, 2 endpoints
+    template.resource_count_is("AWS::SSM::Parameter", 15)
+    template.has_resource_properties("AWS::SSM::Parameter", {
+        "Name": network_parameter("shared", "layout"),
+        "Value": "azs=2;public=PUBLIC;app=PRIVATE_WITH_EGRESS;data=PRIVATE_ISOLATED;isolated=PRIVATE_ISOLATED",
+    })
+    template.has_resource_properties("AWS::SSM::Parameter", {"Name": network_parameter("shared", "subnets/app")})
+
+    # consumers are other apps, no reference to the shared stack
+    stack = core.Stack(core.App(), "app", env=ENV)
+    network = BaseNetwork(stack, "network", prefix="test", props=EnvProps(
+        cidr_block="10.0.0.0/20", max_avz=2, subnet_tiers=TIERS, shared_network="shared"
+    ))
+    vpc = network.create_vpc(is_natgw=True)
+    template = assertions.Template.from_stack(stack)
+    # nothing is created, the IDs are SSM parameters of the template
+    template.resource_count_is("AWS::EC2::VPC", 0)
+    template.resource_count_is("AWS::EC2::Subnet", 0)
+    parameters = template.find_parameters("*", {"Type": "AWS::SSM::Parameter::Value<String>"})
+    assert {
+        parameter["Default"] for parameter in parameters.values() if parameter["Default"].startswith("/shared/")
+    } == {
+        network_parameter("shared", key) for key in [
+            "layout", "vpc-id", "vpc-cidr", "azs", "default-sg",
+            "subnets/public", "subnets/app", "subnets/data", "subnets/isolated",
+            "route-tables/public", "route-tables/app", "route-tables/data", "route-tables/isolated",
+        ]
+    }
+    # the layout the importer expects is checked before CloudFormation changes anything
+    [rule] = [rule for rule_id, rule in template.to_json()["Rules"].items() if "layoutrule" in rule_id]
+    [assertion] = rule["Assertions"]
+    layout_parameter = assertion["Assert"]["Fn::Equals"][0]["Ref"]
+    assert parameters[layout_parameter]["Default"] == network_parameter("shared", "layout")
+    assert assertion["Assert"]["Fn::Equals"][1] == network_layout(2, TIERS)
+    assert len(vpc.public_subnets) == 2
+    assert len(vpc.private_subnets) == 2
+    assert len(vpc.isolated_subnets) == 4
+    data_subnets = vpc.select_subnets(subnet_group_name=BaseNetwork.subnet_group_name("test", "data")).subnets
+    assert len(data_subnets) == 2
@@ -0,0 +1,84 @@
+import json
+import datetime
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from lib.boto_replay import BotoReplay, ReplayMissError, _to_json, _from_json
+
+
+IMAGES = {
+    "Images": [
+        {"ImageId": "ami-1", "Name": "amzn2-ami-hvm-1", "CreationDate": "2024-01-01T00:00:00.000Z"},
+    ]
+}
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "stub")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "stub")
+    # nothing listens there, a call which is not replayed fails fast
+    monkeypatch.setenv("AWS_ENDPOINT_URL", "http://127.0.0.1:9")
+    monkeypatch.setenv("AWS_MAX_ATTEMPTS", "1")
+    return boto3.session.Session(region_name="us-east-1")
+
+
+def _record(session, directory, calls):
+    replay = BotoReplay("record", str(directory)).install(session)
+    client = session.client("ec2")
+    with Stubber(client) as stubber:
+        for response, params in calls:
+            if isinstance(response, str):
+                stubber.add_client_error("describe_images", service_error_code=response, expected_params=params)
+            else:
+                stubber.add_response("describe_images", response, params)
+        for _, params in calls:
+            try:
+                client.describe_images(**params)
+            except ClientError:
+                pass
+    replay.uninstall()
+
+
+@pytest.mark.unit
+def test_record_then_replay(session, tmp_path):
+    params = {"Owners": ["amazon"]}
+    _record(session, tmp_path, [(IMAGES, params)])
+
+    replay = BotoReplay("replay", str(tmp_path)).install(session)
+    try:
+        response = session.client("ec2").describe_images(**params)
+    finally:
+        replay.uninstall()
+    assert response["Images"] == IMAGES["Images"]
+
+
+@pytest.mark.unit
+def test_replay_errors(session, tmp_path):
+    _record(session, tmp_path, [("InvalidAMIID.NotFound", {"ImageIds": ["ami-0"]})])
+
+    replay = BotoReplay("replay", str(tmp_path)).install(session)
+    try:
+        with pytest.raises(ClientError, match="InvalidAMIID.NotFound"):
+            session.client("ec2").describe_images(ImageIds=["ami-0"])
+    finally:
+        replay.uninstall()
+
+
+@pytest.mark.unit
+def test_fixture_round_trip_types():
+    value = {"Time": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc), "Blob": b"\x00", "List": (1,)}
+    assert _from_json(json.loads(json.dumps(_to_json(value)))) == {**value, "List": [1]}
+
+
+@pytest.mark.unit
+def test_replay_miss_does_not_call_aws(session, tmp_path):
+    replay = BotoReplay("replay", str(tmp_path)).install(session)
+    try:
+        with pytest.raises(ReplayMissError):
+            session.client("ec2").describe_images(Owners=["amazon"])
+    finally:
+        replay.uninstall()
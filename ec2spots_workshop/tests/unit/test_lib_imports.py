@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+import lib
+from lib import utils
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+
+
+@pytest.mark.unit
+def test_lib_reexports_utils():
+    # `from .utils import *` of the package before the lazy loading
+    assert lib.add_tags is utils.add_tags
+    assert lib.get_latest_linux_ami_from_aws is utils.get_latest_linux_ami_from_aws
+    assert lib.EXTERNAL_IP_URL == utils.EXTERNAL_IP_URL
+    with pytest.raises(AttributeError):
+        lib._lookup_external_ip
+    with pytest.raises(AttributeError):
+        lib.NoSuchName
+
+
+@pytest.mark.unit
+def test_lib_r53_is_deprecated():
+    from aws_cdk import aws_route53
+    with pytest.deprecated_call():
+        assert lib.R53 is aws_route53
+
+
+@pytest.mark.unit
+def test_stack_imports_only_its_constructs():
+    statement = (
+        "import sys, json; from lib import WorkshopEC2SpotStack, EnvProps, TTLProps; "
+        "print(json.dumps(sorted(name for name in sys.modules if name.startswith('lib.'))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True,
+        env=dict(os.environ, JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1"),
+    ).stdout
+    loaded = json.loads(output.strip().splitlines()[-1])
+    assert "lib.work_shop_ec2_spot_stack" in loaded
+    for module in ("lib.ecs", "lib.web_asg", "lib.ec2_spot", "lib.base_network", "lib.utils"):
+        assert module not in loaded
@@ -0,0 +1,56 @@
+import pytest
+import aws_cdk as core
+
+from lib import profiler
+from lib.base_network import BaseNetwork
+from lib.props import EnvProps
+
+
+@pytest.fixture
+def synth_profiler():
+    yield profiler.start()
+    profiler.stop()
+
+
+@pytest.mark.unit
+def test_profiler_records_constructs(synth_profiler, tmp_path):
+    app = core.App()
+    stack = core.Stack(app, "profiled", env=core.Environment(account="111111111111", region="us-east-1"))
+    network = BaseNetwork(
+        stack, "network", prefix="test",
+        props=EnvProps(cidr_block="10.0.0.0/24", max_avz=2, propertis={}),
+        region="us-east-1", account="111111111111"
+    )
+    network.create_vpc()
+
+    summary = dict(synth_profiler.summary())
+    assert summary["BaseNetwork"].calls == 1
+    assert summary["BaseNetwork.create_vpc"].jsii > 0
+    assert "aws_ec2.Vpc" in summary
+
+    path = tmp_path / "synth.folded"
+    synth_profiler.write(str(path))
+    lines = path.read_text().splitlines()
+    assert any(line.startswith("BaseNetwork.create_vpc;aws_ec2.Vpc ") for line in lines)
+
+
+@pytest.mark.unit
+def test_profiler_off_by_default():
+    calls = []
+
+    @profiler.profiled()
+    def builder(value):
+        calls.append(value)
+        return value
+
+    assert profiler.get_profiler() is None
+    assert builder(1) == 1
+    assert calls == [1]
+
+
+@pytest.mark.unit
+def test_profiler_app_synth(synth_profiler):
+    app = core.App()
+    core.Stack(app, "empty")
+    app.synth()
+    assert dict(synth_profiler.summary())["App.synth"].calls == 1
@@ -0,0 +1,126 @@
+import sys
+import subprocess
+
+import pytest
+import aws_cdk as core
+from aws_cdk import aws_ec2 as ec2
+
+from lib.props import WebAsgProps
+from .template_cache import CACHE_PREFIX, UncacheableValue, template_key, diff_templates, format_diff
+
+
+def _props(**kwargs):
+    return WebAsgProps(prefix="workshop", cidr_block="172.30.0.0/24", propertis={}, **kwargs)
+
+
+@pytest.mark.unit
+def test_template_key_is_stable():
+    env = core.Environment(account="123456789012", region="us-east-1")
+    assert template_key(core.Stack, "a", props=_props(), env=env) \
+        == template_key(core.Stack, "a", props=_props(), env=env)
+    assert template_key(core.Stack, "a", props=_props(), env=env) \
+        != template_key(core.Stack, "a", props=_props(max_capacity=2), env=env)
+    assert template_key(core.Stack, "a", props=_props(), env=env) \
+        != template_key(core.Stack, "a", props=_props(),
+                        env=core.Environment(account="123456789012", region="eu-west-1"))
+
+
+@pytest.mark.unit
+def test_diff_templates_reports_changed_resources_only():
+    old = {
+        "Resources": {
+            "Vpc": {"Type": "AWS::EC2::VPC", "Properties": {"CidrBlock": "10.0.0.0/16"}},
+            "Bucket": {"Type": "AWS::S3::Bucket"},
+            "Old": {"Type": "AWS::SQS::Queue"},
+        },
+        "Description": "a",
+    }
+    new = {
+        "Resources": {
+            "Vpc": {"Type": "AWS::EC2::VPC", "Properties": {"CidrBlock": "10.1.0.0/16"}},
+            "Bucket": {"Type": "AWS::S3::Bucket"},
+            "New": {"Type": "AWS::SQS::Queue"},
+        },
+        "Description": "b",
+    }
+    diff = diff_templates(old, new)
+    assert diff == {
+        "Resources": {"New": "added", "Old": "removed", "Vpc": ["Properties.CidrBlock"]},
+        "Template": {"Description": "changed"},
+    }
+    assert "Resources.Vpc: changed Properties.CidrBlock" in format_diff(diff)
+    assert diff_templates(old, old) == {}
+
+
+class _ImageStack(core.Stack):
+    def __init__(self, scope, construct_id: str, props: WebAsgProps, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        ec2.CfnInstance(self, "instance", image_id=props.ami_image.get_image(self).image_id)
+
+
+def _image_props(ami_id: str):
+    return _props(ami_image=ec2.MachineImage.generic_linux({"us-east-1": ami_id}))
+
+
+@pytest.mark.unit
+def test_template_key_sees_images_and_environment(monkeypatch):
+    env = core.Environment(account="123456789012", region="us-east-1")
+    key = template_key(core.Stack, "a", props=_image_props("ami-aaaa"), env=env)
+    assert key == template_key(core.Stack, "a", props=_image_props("ami-aaaa"), env=env)
+    assert key != template_key(core.Stack, "a", props=_image_props("ami-bbbb"), env=env)
+    assert template_key(core.Stack, "a", props=_props(ami_image=ec2.MachineImage.from_ssm_parameter("/a"))) \
+        != template_key(core.Stack, "a", props=_props(ami_image=ec2.MachineImage.from_ssm_parameter("/b")))
+
+    monkeypatch.setenv("CDK_EXTERNAL_IP", "10.0.0.1")
+    assert key != template_key(core.Stack, "a", props=_image_props("ami-aaaa"), env=env)
+    monkeypatch.delenv("CDK_EXTERNAL_IP")
+    monkeypatch.setenv("CDK_CONTEXT_JSON", '{"external_ip": "10.0.0.1"}')
+    assert key != template_key(core.Stack, "a", props=_image_props("ami-aaaa"), env=env)
+
+
+@pytest.mark.unit
+def test_template_key_refuses_opaque_objects():
+    stack = core.Stack(core.App(), "vpc")
+    vpc = ec2.Vpc(stack, "vpc")
+    with pytest.raises(UncacheableValue):
+        template_key(core.Stack, "a", props=_props(vpc=vpc))
+
+
+@pytest.mark.unit
+def test_synth_template_misses_cache_on_other_image(synth_template, request):
+    if getattr(request.config, "cache", None) is None:
+        pytest.skip("runs with the pytest cache plugin")
+    env = core.Environment(account="123456789012", region="us-east-1")
+    images = {}
+    for ami_id in ["ami-aaaa", "ami-bbbb", "ami-aaaa"]:
+        template = synth_template(_ImageStack, "image", props=_image_props(ami_id), env=env)
+        images[ami_id] = template["Resources"]["instance"]["Properties"]["ImageId"]
+        key = template_key(_ImageStack, "image", props=_image_props(ami_id), env=env)
+        assert request.config.cache.get(f"{CACHE_PREFIX}/{key}", None) == template
+    assert images == {"ami-aaaa": "ami-aaaa", "ami-bbbb": "ami-bbbb"}
+
+
+@pytest.mark.unit
+def test_sources_digest_sees_lambda_code(tmp_path, monkeypatch):
+    from . import template_cache
+    monkeypatch.setattr(template_cache, "ROOT", str(tmp_path))
+    (tmp_path / "lambda").mkdir()
+    (tmp_path / "lambda" / "ttl.py").write_text("HARD_TTL = 1\n")
+    digest = template_cache._sources_digest()
+    (tmp_path / "lambda" / "ttl.py").write_text("HARD_TTL = 2\n")
+    assert template_cache._sources_digest() != digest
+
+
+@pytest.mark.unit
+def test_synth_template_without_cache_plugin(synth_template, request):
+    if getattr(request.config, "cache", None) is not None:
+        # the same test again in a run without the cache plugin
+        result = subprocess.run(
+            [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider",
+             f"{__file__}::test_synth_template_without_cache_plugin"],
+            cwd=request.config.rootpath, capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+        return
+    env = core.Environment(account="123456789012", region="us-east-1")
+    template = synth_template(_ImageStack, "image", props=_image_props("ami-aaaa"), env=env)
+    assert template["Resources"]["instance"]["Properties"]["ImageId"] == "ami-aaaa"
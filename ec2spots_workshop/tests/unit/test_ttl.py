@@ -0,0 +1,192 @@
+import json
+
+import pytest
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from lib.ttl import (
+    TTLProps, TTLStack, TTL_MODE_AT, TTL_TAG, TTL_MINUTES_TAG, TTL_METRICS_NAMESPACE,
+    expiry_groups, ttl_tag_stacks
+)
+from lib.ttl_orchestrator import deletion_order
+
+
+@pytest.mark.unit
+def test_expiry_groups():
+    assert expiry_groups(["env", "ecs", "web"], 120, {"web": 30}, last_stack="ttl") == {
+        30: ["web"],
+        120: ["env", "ecs", "ttl"],
+    }
+    assert expiry_groups([], 60, last_stack="ttl") == {60: ["ttl"]}
+
+
+@pytest.mark.unit
+def test_ttl_at_mode_has_no_rate_rule():
+    app = core.App()
+    stack = TTLStack(
+        app, "ttl",
+        props=TTLProps(
+            prefix_name="workshop-ttl", stack_names=["env", "web"], ttl=120,
+            mode=TTL_MODE_AT, stack_ttls={"web": 30}
+        ),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::Events::Rule", 0)
+    template.resource_count_is("AWS::CloudFormation::CustomResource", 2)
+    template.has_resource_properties("AWS::CloudFormation::CustomResource", {
+        "ScheduleName": "workshop-ttl-expiry-120m",
+        "StackNames": ["env", "ttl"],
+    })
+
+
+@pytest.mark.unit
+def test_ttl_discovery_service():
+    app = core.App()
+    env = core.Environment(account="123456789012", region="us-east-1")
+    stack = TTLStack(
+        app, "ttl-service",
+        props=TTLProps(prefix_name="ttl-service", stack_names=[], ttl=15, discovery=True),
+        env=env
+    )
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": {"TTL_TAG": TTL_TAG, "TTL_MINUTES_TAG": TTL_MINUTES_TAG}},
+    })
+    assert "FunctionName" not in json.dumps(template.find_resources("AWS::Lambda::Function"))
+
+    tagged_app = core.App()
+    ttl_tag_stacks([core.Stack(tagged_app, "web", env=env)], 120)
+    # Tags are applied on synth
+    assert tagged_app.synth().get_stack_by_name("web").tags == {TTL_MINUTES_TAG: "120"}
+
+
+@pytest.mark.unit
+def test_ttl_regions():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["web"], ttl=60, regions=["us-east-1", "eu-west-1"]),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({"REGIONS": "us-east-1,eu-west-1"})},
+    })
+    policies = json.dumps(template.find_resources("AWS::IAM::Policy"))
+    assert "arn:aws:cloudformation:eu-west-1:123456789012:stack/web/*" in policies
+    assert "arn:aws:cloudformation:us-east-1:123456789012:stack/web/*" in policies
+
+
+@pytest.mark.unit
+def test_ttl_monitoring():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["web"], ttl=60),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    # a rate rule has no expiry, no ExpiryLag alarm
+    template.resource_count_is("AWS::CloudWatch::Alarm", 2)
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "Namespace": TTL_METRICS_NAMESPACE,
+        "MetricName": "StacksFailed",
+        "Statistic": "Sum",
+        "Threshold": 1,
+    })
+    template.has_resource_properties("AWS::CloudWatch::Dashboard", {"DashboardName": "workshop-ttl-ttl-us-east-1"})
+
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["web"], ttl=60, discovery=True),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::CloudWatch::Alarm", 3)
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {"MetricName": "ExpiryLag", "Threshold": 75 * 60})
+
+
+@pytest.mark.unit
+def test_ttl_continuation_policy():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["web"], ttl=60),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    [function_id] = template.find_resources("AWS::Lambda::Function", {"Properties": {"Handler": "ttl.handler"}})
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {"Statement": [{
+            "Action": "lambda:InvokeFunction",
+            "Effect": "Allow",
+            "Resource": {"Fn::GetAtt": [function_id, "Arn"]},
+        }]},
+    })
+
+
+@pytest.mark.unit
+def test_deletion_order():
+    assert deletion_order(["env", "ecs", "web", "service"], {"ecs": ["env"], "service": ["ecs", "env"]}) == [
+        ["web", "service"], ["ecs"], ["env"]
+    ]
+    # a cycle goes in one wave, the same as in the TTL function
+    assert deletion_order(["a", "b", "c"], {"a": ["b"], "b": ["a"], "c": ["a"]}) == [["c"], ["a", "b"]]
+
+
+@pytest.mark.unit
+def test_ttl_orchestrator():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(
+            prefix_name="workshop-ttl", stack_names=["env", "web"], ttl=60,
+            dependencies={"web": ["env"]}, orchestrator=True, max_concurrency=4
+        ),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::Lambda::Function", 0)
+    template.resource_count_is("AWS::StepFunctions::StateMachine", 1)
+    [rule] = template.find_resources("AWS::Events::Rule").values()
+    [target] = rule["Properties"]["Targets"]
+    assert json.loads(target["Input"]) == {"waves": [["web"], ["env"]]}
+
+    definition = template.find_resources("AWS::StepFunctions::StateMachine")
+    rendered = json.dumps(definition)
+    assert '\\"MaxConcurrency\\":4' in rendered
+    assert ":states:::aws-sdk:cloudformation:deleteStack" in rendered
+    assert ":states:::aws-sdk:cloudformation:describeStacks" in rendered
+    assert '\\"statuses.$\\":\\"$.results[*][*].status\\"' in rendered
+    assert "States.ArrayContains($.statuses, 'FAILED')" in rendered
+
+
+@pytest.mark.unit
+def test_ttl_drain():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["ecs"], ttl=60, drain=True),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({"DRAIN": "true"})},
+    })
+    assert "autoscaling:SetInstanceProtection" in json.dumps(template.find_resources("AWS::IAM::Policy"))
+    with pytest.raises(ValueError):
+        TTLStack(
+            core.App(), "ttl",
+            props=TTLProps(prefix_name="workshop-ttl", stack_names=["ecs"], ttl=60, drain=True, orchestrator=True),
+        )
+
+
+@pytest.mark.unit
+def test_ttl_idle_mode():
+    stack = TTLStack(
+        core.App(), "ttl",
+        props=TTLProps(prefix_name="workshop-ttl", stack_names=["web"], ttl=480, idle_window=60, idle_check=10),
+        env=core.Environment(account="123456789012", region="us-east-1")
+    )
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties("AWS::Events::Rule", {"ScheduleExpression": "rate(10 minutes)"})
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({"IDLE_WINDOW": "60", "HARD_TTL": "480"})},
+    })
+    assert "cloudwatch:GetMetricData" in json.dumps(template.find_resources("AWS::IAM::Policy"))
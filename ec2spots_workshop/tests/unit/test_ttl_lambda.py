@@ -0,0 +1,657 @@
+import os
+import sys
+import json
+import datetime
+import importlib.util
+import threading
+
+import boto3
+import boto3.session
+import pytest
+
+
+SIBLINGS = ("ttl_common", "ttl_discovery", "ttl_idle", "ttl_drain", "ttl_waves")
+
+
+def _load_ttl(name: str="ttl"):
+    # 'lambda' is a keyword, the handler module is loaded by path
+    directory = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+    # the function imports its sibling modules like in the Lambda runtime
+    if directory not in sys.path:
+        sys.path.append(directory)
+    # a new container: the sibling modules and their clients are imported again
+    for sibling in SIBLINGS:
+        sys.modules.pop(sibling, None)
+    path = os.path.join(directory, f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_lambda", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _common():
+    # clients of the last loaded function, see _load_ttl
+    return sys.modules["ttl_common"]
+
+
+def _patch_clients(monkeypatch, module, client):
+    """
+        Sessions of the handler create clients with client(service, region_name)
+    """
+    class _Session:
+        def __init__(self, region_name=None):
+            self.region_name = region_name
+
+        def client(self, service):
+            return client(service, region_name=self.region_name)
+
+    monkeypatch.setattr(boto3.session, "Session", _Session)
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def paginate(self, **kwargs):
+        return self._pages(**kwargs)
+
+
+class _ClientError(RuntimeError):
+    def __init__(self, code, message=""):
+        super().__init__(message or code)
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class _Cfn:
+    class exceptions:
+        ClientError = _ClientError
+
+    def __init__(self, fail=(), exports=None, statuses=None, missing=()):
+        self.deleted = []
+        self.waited = []
+        self.retained = {}
+        # StackSummaries of list_stacks, None - every stack of STACK_NAMES but the missing ones
+        self.stacks = None
+        self._missing = missing
+        # stack name -> StackResourceSummaries
+        self.resources = {}
+        self._fail = fail
+        # stack name -> statuses returned by describe_stacks one by one, then it's gone
+        self._statuses = statuses or {}
+        # export name -> (exporting stack, importing stacks)
+        self._exports = exports or {}
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        if name == "list_stacks":
+            return _Paginator(lambda StackStatusFilter: [{"StackSummaries": self._summaries()}])
+        if name == "list_exports":
+            return _Paginator(lambda: [{"Exports": [
+                {"Name": export, "ExportingStackId": f"arn:aws:cloudformation:us-east-1:1:stack/{stack}/id"}
+                for export, (stack, _) in self._exports.items()
+            ]}])
+        if name == "list_stack_resources":
+            return _Paginator(lambda StackName: [{"StackResourceSummaries": self.resources.get(StackName, [
+                {"LogicalResourceId": "Bucket", "ResourceStatus": "DELETE_FAILED"},
+                {"LogicalResourceId": "Role", "ResourceStatus": "DELETE_COMPLETE"},
+            ])}])
+        return _Paginator(lambda ExportName: [{"Imports": self._exports[ExportName][1]}])
+
+    def _summaries(self):
+        if self.stacks is not None:
+            return self.stacks
+        return [
+            {"StackName": name, "StackStatus": "CREATE_COMPLETE"}
+            for name in os.environ.get("STACK_NAMES", "").split(",") if name and name not in self._missing
+        ]
+
+    def describe_stacks(self, StackName):
+        with self._lock:
+            self.waited.append(StackName)
+            statuses = self._statuses.get(StackName)
+            if not statuses:
+                raise _ClientError("ValidationError", f"Stack with id {StackName} does not exist")
+            return {"Stacks": [{"StackName": StackName, "StackStatus": statuses.pop(0)}]}
+
+    def delete_stack(self, StackName, RetainResources=None):
+        with self._lock:
+            self.deleted.append(StackName)
+            if RetainResources is not None:
+                self.retained[StackName] = RetainResources
+        if StackName in self._fail:
+            raise _ClientError("AccessDenied", "denied")
+
+
+@pytest.fixture
+def ttl(monkeypatch):
+    module = _load_ttl()
+    created = []
+
+    def _client(service, region_name=None):
+        created.append(service)
+        return _common()._clients["cfn"]
+
+    _patch_clients(monkeypatch, module, _client)
+    return module, created
+
+
+@pytest.mark.unit
+def test_handler_reuses_client(ttl, monkeypatch):
+    module, created = ttl
+    _common()._clients["cfn"] = _Cfn()
+    monkeypatch.setenv("STACK_NAMES", "a,b,c")
+    assert module.handler({}, None)["statusCode"] == 200
+    assert module.handler({}, None)["statusCode"] == 200
+    assert created == ["cloudformation"]
+    assert sorted(_common()._clients["cfn"].deleted) == ["a", "a", "b", "b", "c", "c"]
+
+
+@pytest.mark.unit
+def test_get_client_creates_one_client_across_threads(monkeypatch):
+    module = _load_ttl()
+    created = []
+    start = threading.Barrier(8)
+
+    def _client(service, region_name=None):
+        created.append((service, region_name))
+        return object()
+
+    _patch_clients(monkeypatch, module, _client)
+
+    def _get(region):
+        start.wait()
+        return module.get_client("ecs", region)
+
+    threads = [threading.Thread(target=_get, args=(region,)) for region in ["us-east-1", "eu-west-1"] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(created) == [("ecs", "eu-west-1"), ("ecs", "us-east-1")]
+    assert sorted(_common()._sessions) == ["eu-west-1", "us-east-1"]
+
+
+@pytest.mark.unit
+def test_handler_counts_only_stacks_of_the_region(monkeypatch, capsys):
+    module = _load_ttl()
+    clients = {"us-east-1": _Cfn(), "eu-west-1": _Cfn(missing={"web"}), None: _Cfn()}
+    _patch_clients(monkeypatch, module, lambda service, region_name=None: clients[region_name])
+    monkeypatch.setenv("STACK_NAMES", "web,api")
+    monkeypatch.setenv("REGIONS", "us-east-1,eu-west-1")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 200
+    assert sorted(clients["us-east-1"].deleted) == ["api", "web"]
+    assert clients["eu-west-1"].deleted == ["api"]
+    assert "eu-west-1: stack 'web' doesn't exist" in result["body"]
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["StacksDeleted"] for record in records if "StacksDeleted" in record] == [3]
+
+
+@pytest.mark.unit
+def test_handler_collects_results_in_order(ttl, monkeypatch):
+    module, _ = ttl
+    _common()._clients["cfn"] = _Cfn(fail={"b"})
+    monkeypatch.setenv("STACK_NAMES", "a,b,c")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 500
+    assert [("faield" in body) for body in result["body"]] == [False, True, False]
+
+
+@pytest.mark.unit
+def test_handler_skips_empty_stack_names(ttl, monkeypatch):
+    module, _ = ttl
+    cfn = _common()._clients["cfn"] = _Cfn()
+    monkeypatch.setenv("STACK_NAMES", "a,,b,")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 200
+    assert sorted(cfn.deleted) == ["a", "b"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("project", ["StepFunctions", "sagemaker_lab"])
+def test_basic_handlers_skip_empty_stack_names(project, monkeypatch):
+    # the frozen copies of the other projects
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "..", project, "lambda", "ttl.py")
+    spec = importlib.util.spec_from_file_location(f"ttl_{project}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    cfn = module._clients["cloudformation"] = _Cfn()
+    monkeypatch.setenv("STACK_NAMES", "")
+    assert module.handler({}, None)["statusCode"] == 200
+    monkeypatch.setenv("STACK_NAMES", "a,,b")
+    assert module.handler({}, None)["statusCode"] == 200
+    assert sorted(cfn.deleted) == ["a", "b"]
+
+
+@pytest.mark.unit
+def test_deletion_waves(ttl, monkeypatch):
+    module, _ = ttl
+    _common()._clients["cfn"] = _Cfn(exports={"vpc-id": ("env", ["ecs", "service"]), "cluster": ("ecs", ["service"])})
+    monkeypatch.setenv("STACK_DEPENDENCIES", '{"ecs": ["env"], "other": ["env"]}')
+    names = ["env", "ecs", "service"]
+    assert module.deletion_waves(names, module.stack_blockers(names)) == [["service"], ["ecs"], ["env"]]
+
+
+@pytest.mark.unit
+def test_handler_waits_for_every_wave(ttl, monkeypatch):
+    module, _ = ttl
+    cfn = _Cfn(fail={"ecs"}, exports={"vpc-id": ("env", ["ecs"])})
+    _common()._clients["cfn"] = cfn
+    monkeypatch.setenv("STACK_NAMES", "env,ecs,web,ttl")
+    monkeypatch.setenv("TTL_STACK_NAME", "ttl")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 500
+    # env waits for ecs, which failed, the TTL stack is never deleted
+    assert sorted(cfn.deleted) == ["ecs", "web"]
+    assert cfn.waited == ["web"]
+    assert len(result["body"]) == 3
+
+
+@pytest.mark.unit
+def test_handler_deletes_stacks_of_the_schedule(ttl, monkeypatch):
+    module, _ = ttl
+    cfn = _Cfn()
+    _common()._clients["cfn"] = cfn
+    monkeypatch.setenv("STACK_NAMES", "env,web,ttl")
+    assert module.handler({"stack_names": ["web", "unknown"]}, None)["statusCode"] == 200
+    assert cfn.deleted == ["web"]
+
+
+@pytest.mark.unit
+def test_handler_fans_out_regions(monkeypatch):
+    module = _load_ttl()
+    clients = {"us-east-1": _Cfn(), "eu-west-1": _Cfn(fail={"web"}), None: _Cfn()}
+    _patch_clients(monkeypatch, module, lambda service, region_name=None: clients[region_name])
+    monkeypatch.setenv("STACK_NAMES", "web,ttl")
+    monkeypatch.setenv("TTL_STACK_NAME", "ttl")
+    monkeypatch.setenv("REGIONS", "us-east-1,eu-west-1")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 500
+    assert clients["us-east-1"].deleted == clients["eu-west-1"].deleted == ["web"]
+    assert [body.split(":")[0] for body in result["body"]] == ["us-east-1", "eu-west-1"]
+    # one region failed, the TTL stack stays
+    assert clients[None].deleted == []
+
+    clients["eu-west-1"] = _Cfn()
+    _common()._clients.pop(("cloudformation", "eu-west-1"))
+    assert module.handler({}, None)["statusCode"] == 200
+    assert clients[None].deleted == ["ttl"]
+
+
+@pytest.mark.unit
+def test_handler_emits_metrics(ttl, monkeypatch, capsys):
+    module, _ = ttl
+    _common()._clients["cfn"] = _Cfn(fail={"b"})
+    monkeypatch.setenv("STACK_NAMES", "a,b")
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "ttl-fn")
+    module.handler({"time": "2024-01-01T12:00:00Z"}, None)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+
+    deletes = {record["StackName"]: record for record in records if "DeleteStackDuration" in record}
+    assert sorted(deletes) == ["a", "b"]
+    # the time of a rate rule isn't an expiry
+    assert "ExpiryLag" not in deletes["a"]
+    assert deletes["b"]["StatusCode"] == 500
+    invocation = records[-1]
+    assert (invocation["StacksDeleted"], invocation["StacksFailed"]) == (1, 1)
+    assert invocation["FunctionName"] == "ttl-fn"
+    [directive] = invocation["_aws"]["CloudWatchMetrics"]
+    assert directive["Dimensions"] == [["FunctionName"]]
+    assert {metric["Name"] for metric in directive["Metrics"]} == {
+        "InvocationDuration", "StacksDeleted", "StacksFailed", "StacksPending"
+    }
+
+    module.handler({"expires_at": "2024-01-01T12:00:00+00:00"}, None)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    deletes = {record["StackName"]: record for record in records if "DeleteStackDuration" in record}
+    assert deletes["a"]["ExpiryLag"] > 0
+
+
+@pytest.mark.unit
+def test_backoff_retries_throttling(ttl, monkeypatch):
+    module, _ = ttl
+    monkeypatch.setattr(module.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def throttled(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise _ClientError("Throttling", "Rate exceeded")
+        return "ok"
+
+    assert module.with_backoff(throttled, StackName="web") == "ok"
+    assert len(calls) == 3
+    with pytest.raises(_ClientError):
+        module.with_backoff(lambda: (_ for _ in ()).throw(_ClientError("AccessDenied")))
+
+
+
+@pytest.mark.unit
+def test_delete_stack_does_not_swallow_errors(ttl):
+    module, _ = ttl
+    cfn = _common()._clients["cfn"] = _Cfn(fail={"b"})
+    assert module.delete_stack("b")["statusCode"] == 500
+
+    class _Timeout(BaseException):
+        # like the SystemExit of a Lambda timeout, not an error of the call
+        pass
+
+    def interrupted(StackName):
+        raise _Timeout()
+
+    cfn.delete_stack = interrupted
+    with pytest.raises(_Timeout):
+        module.delete_stack("a")
+
+@pytest.mark.unit
+def test_delete_failed_retains_blocking_resources(ttl, monkeypatch):
+    module, _ = ttl
+    monkeypatch.setattr(module.time, "sleep", lambda seconds: None)
+    cfn = _common()._clients["cfn"] = _Cfn(statuses={
+        "web": ["DELETE_FAILED", "DELETE_IN_PROGRESS"],
+        "db": ["DELETE_FAILED", "DELETE_FAILED"],
+    })
+    monkeypatch.setenv("STACK_NAMES", "web,db")
+    result = module.handler({}, None)
+    assert result["statusCode"] == 500
+    assert cfn.retained == {"web": ["Bucket"], "db": ["Bucket"]}
+    assert [body for body in result["body"] if "not deleted" in body] == ["stack 'db' was not deleted: DELETE_FAILED"]
+
+
+class _Context:
+    invoked_function_arn = "arn:aws:lambda:us-east-1:1:function:ttl"
+
+    def __init__(self, remaining):
+        self._remaining = remaining
+
+    def get_remaining_time_in_millis(self):
+        return self._remaining * 1000
+
+
+class _Lambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+@pytest.mark.unit
+def test_handler_continues_pending_stacks(ttl, monkeypatch):
+    module, _ = ttl
+    monkeypatch.setattr(module.time, "sleep", lambda seconds: None)
+    cfn = _common()._clients["cfn"] = _Cfn(
+        exports={"vpc-id": ("env", ["web"])}, statuses={"web": ["DELETE_IN_PROGRESS"]})
+    invoker = _common()._clients["lambda"] = _Lambda()
+    monkeypatch.setenv("STACK_NAMES", "env,web,ttl")
+    monkeypatch.setenv("TTL_STACK_NAME", "ttl")
+
+    # web is still deleted close to the timeout, env and the TTL stack go to the follow-up
+    result = module.handler({"stack_names": ["env", "web", "ttl"]}, _Context(module.TIME_MARGIN + 10))
+    assert result["statusCode"] == 202
+    [invocation] = invoker.invocations
+    assert invocation["InvocationType"] == "Event"
+    assert invocation["FunctionName"] == _Context.invoked_function_arn
+    payload = json.loads(invocation["Payload"])
+    assert payload == {"pending": {"": ["web", "env"]}, "continuation": 1, "stack_names": ["env", "web", "ttl"]}
+
+    result = module.handler(payload, _Context(600))
+    assert result["statusCode"] == 200
+    assert cfn.deleted == ["web", "web", "env", "ttl"]
+
+    payload["continuation"] = module.MAX_CONTINUATIONS
+    cfn._statuses["web"] = ["DELETE_IN_PROGRESS"]
+    assert module.handler(payload, _Context(module.TIME_MARGIN + 10))["statusCode"] == 500
+
+
+class _Drainable:
+    """
+        ecs, autoscaling and ec2 clients in one, calls are recorded in order
+    """
+    def __init__(self, cfn):
+        self._cfn = cfn
+        self.calls = []
+
+    def _record(self, call, **kwargs):
+        with self._cfn._lock:
+            self.calls.append((call, kwargs))
+
+    def update_service(self, **kwargs):
+        self._record("update_service", **kwargs)
+        # tasks stop one poll after the scale in
+        self._running = [1, 0]
+
+    def describe_services(self, cluster, services):
+        running = self._running.pop(0)
+        self._record("describe_services", runningCount=running)
+        return {"services": [{"serviceArn": services[0], "runningCount": running, "pendingCount": 0}]}
+
+    def update_capacity_provider(self, **kwargs):
+        self._record("update_capacity_provider", **kwargs)
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames):
+        return {"AutoScalingGroups": [{"Instances": [
+            {"InstanceId": "i-1", "ProtectedFromScaleIn": True},
+            {"InstanceId": "i-2", "ProtectedFromScaleIn": False},
+        ]}]}
+
+    def set_instance_protection(self, **kwargs):
+        self._record("set_instance_protection", **kwargs)
+
+    def update_auto_scaling_group(self, **kwargs):
+        self._record("update_auto_scaling_group", **kwargs)
+
+    def get_waiter(self, name):
+        drainable = self
+
+        class _Waiter:
+            def wait(self, WaiterConfig, **kwargs):
+                drainable._record(name, **kwargs)
+        return _Waiter()
+
+    def delete_stack(self, StackName):
+        # drained before the deletion starts
+        self._record("delete_stack", StackName=StackName)
+
+
+@pytest.mark.unit
+def test_handler_drains_before_delete(monkeypatch):
+    module = _load_ttl()
+    cfn = _Cfn()
+    cfn.resources["ecs"] = [
+        {"ResourceType": "AWS::ECS::Service", "ResourceStatus": "CREATE_COMPLETE",
+         "PhysicalResourceId": "arn:aws:ecs:us-east-1:1:service/cluster/web"},
+        {"ResourceType": "AWS::AutoScaling::AutoScalingGroup", "ResourceStatus": "CREATE_COMPLETE",
+         "PhysicalResourceId": "spot-asg"},
+        {"ResourceType": "AWS::ECS::Cluster", "ResourceStatus": "CREATE_COMPLETE", "PhysicalResourceId": "cluster"},
+        {"ResourceType": "AWS::ECS::CapacityProvider", "ResourceStatus": "CREATE_COMPLETE",
+         "PhysicalResourceId": "spot-capacity"},
+    ]
+    drainable = _Drainable(cfn)
+    cfn_delete = cfn.delete_stack
+
+    def delete_stack(StackName):
+        drainable.delete_stack(StackName)
+        cfn_delete(StackName)
+
+    cfn.delete_stack = delete_stack
+    clients = {"cloudformation": cfn, "ecs": drainable, "autoscaling": drainable, "ec2": drainable}
+    _patch_clients(monkeypatch, module, lambda service, region_name=None: clients[service])
+    monkeypatch.setattr(module, "DRAIN", True)
+    monkeypatch.setattr(module.time, "sleep", lambda seconds: None)
+    monkeypatch.setenv("STACK_NAMES", "ecs")
+    assert module.handler({}, None)["statusCode"] == 200
+
+    calls = dict(drainable.calls)
+    assert calls["update_service"] == {"cluster": "cluster", "service": "arn:aws:ecs:us-east-1:1:service/cluster/web", "desiredCount": 0}
+    assert calls["update_capacity_provider"] == {"name": "spot-capacity", "autoScalingGroupProvider": {
+        "managedScaling": {"status": "DISABLED"}, "managedTerminationProtection": "DISABLED",
+    }}
+    assert calls["set_instance_protection"]["InstanceIds"] == ["i-1"]
+    assert calls["update_auto_scaling_group"] == {
+        "AutoScalingGroupName": "spot-asg", "MinSize": 0, "MaxSize": 0, "DesiredCapacity": 0
+    }
+    assert calls["instance_terminated"] == {"InstanceIds": ["i-1", "i-2"]}
+    # the services have no tasks before the capacity goes away
+    assert [name for name, _ in drainable.calls] == [
+        "update_service", "describe_services", "describe_services", "update_capacity_provider",
+        "set_instance_protection", "update_auto_scaling_group", "instance_terminated", "delete_stack",
+    ]
+    assert drainable.calls[2] == ("describe_services", {"runningCount": 0})
+
+
+class _CloudWatch:
+    def __init__(self, values):
+        # dimension value -> data points
+        self._values = values
+        self.calls = []
+
+    def get_paginator(self, name):
+        def pages(MetricDataQueries, StartTime, EndTime):
+            self.calls.append(MetricDataQueries)
+            return [{"MetricDataResults": [
+                {"Id": query["Id"], "Values": self._values.get(query["MetricStat"]["Metric"]["Dimensions"][-1]["Value"], [])}
+                for query in MetricDataQueries
+            ]}]
+        return _Paginator(pages)
+
+
+@pytest.mark.unit
+def test_idle_stacks_are_deleted(monkeypatch):
+    module = _load_ttl()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cfn = _Cfn(exports={"vpc-id": ("env", ["web", "ecs"]), "subnets": ("net", ["ecs"])})
+    cfn.stacks = [
+        {"StackName": name, "CreationTime": now - datetime.timedelta(minutes=minutes)}
+        for name, minutes in (
+            ("env", 300), ("net", 300), ("bucket", 300), ("web", 90), ("ecs", 90), ("fresh", 10), ("old", 500)
+        )
+    ]
+    cfn.resources = {
+        "web": [{"ResourceType": "AWS::ElasticLoadBalancingV2::LoadBalancer", "ResourceStatus": "CREATE_COMPLETE",
+                 "PhysicalResourceId": "arn:aws:elasticloadbalancing:us-east-1:1:loadbalancer/app/web/1"},
+                {"ResourceType": "AWS::AutoScaling::AutoScalingGroup", "ResourceStatus": "CREATE_COMPLETE",
+                 "PhysicalResourceId": "web-asg"}],
+        "ecs": [{"ResourceType": "AWS::ECS::Service", "ResourceStatus": "CREATE_COMPLETE",
+                 "PhysicalResourceId": "arn:aws:ecs:us-east-1:1:service/cluster/api"}],
+        "old": [{"ResourceType": "AWS::AutoScaling::AutoScalingGroup", "ResourceStatus": "CREATE_COMPLETE",
+                 "PhysicalResourceId": "old-asg"}],
+    }
+    # web has requests, ecs is idle, old is busy but over the hard TTL, fresh is younger than the window
+    cloudwatch = _CloudWatch({"app/web/1": [0, 3], "api": [1.2, 0.4], "old-asg": [90]})
+    clients = {"cloudformation": cfn, "cloudwatch": cloudwatch}
+    _patch_clients(monkeypatch, module, lambda service, region_name=None: clients[service])
+    monkeypatch.setattr(module, "IDLE_WINDOW", 60)
+    monkeypatch.setattr(module, "HARD_TTL", 480)
+    monkeypatch.setenv("STACK_NAMES", "env,net,bucket,web,ecs,fresh,old,ttl")
+    monkeypatch.setenv("TTL_STACK_NAME", "ttl")
+
+    result = module.handler({}, None)
+    assert result["statusCode"] == 200
+    # env, net and bucket have no activity metrics: env stays, web imports its VPC,
+    # net goes with ecs, bucket has no dependents and stays until the hard TTL
+    assert sorted(cfn.deleted) == ["ecs", "net", "old"]
+    assert [len(queries) for queries in cloudwatch.calls] == [4]
+    assert sum("is kept" in body for body in result["body"]) == 4
+
+    cfn.deleted.clear()
+    cfn.stacks = [{"StackName": "bucket", "CreationTime": now - datetime.timedelta(minutes=500)}]
+    monkeypatch.setenv("STACK_NAMES", "bucket,ttl")
+    assert module.handler({}, None)["statusCode"] == 200
+    # nothing is kept, the TTL stack goes too
+    assert cfn.deleted == ["bucket", "ttl"]
+
+
+class _Scheduler:
+    class exceptions:
+        class ConflictException(Exception):
+            pass
+
+        class ResourceNotFoundException(Exception):
+            pass
+
+    def __init__(self):
+        self.schedules = {}
+
+    def create_schedule(self, **schedule):
+        if schedule["Name"] in self.schedules:
+            raise self.exceptions.ConflictException()
+        self.schedules[schedule["Name"]] = schedule
+
+    def update_schedule(self, **schedule):
+        self.schedules[schedule["Name"]] = schedule
+
+    def delete_schedule(self, Name):
+        if self.schedules.pop(Name, None) is None:
+            raise self.exceptions.ResourceNotFoundException()
+
+
+@pytest.mark.unit
+def test_expiry_schedule_lifecycle():
+    module = _load_ttl("ttl_schedule")
+    scheduler = module._clients["scheduler"] = _Scheduler()
+    props = {
+        "ScheduleName": "workshop-ttl-expiry-30m", "Ttl": "30", "StackNames": ["web"],
+        "TargetArn": "arn:aws:lambda:us-east-1:1:function:ttl", "RoleArn": "arn:aws:iam::1:role/scheduler",
+    }
+    assert module.deadline(30, datetime.datetime(2024, 1, 1, 23, 50)) == "at(2024-01-02T00:20:00)"
+
+    created = module.handler({"RequestType": "Create", "ResourceProperties": props}, None)
+    schedule = scheduler.schedules["workshop-ttl-expiry-30m"]
+    assert created["PhysicalResourceId"] == "workshop-ttl-expiry-30m"
+    assert schedule["ActionAfterCompletion"] == "DELETE"
+    assert schedule["ScheduleExpression"] == created["Data"]["ScheduleExpression"]
+    schedule_input = json.loads(schedule["Target"]["Input"])
+    assert schedule_input["stack_names"] == ["web"]
+    assert f"at({schedule_input['expires_at'][:19]})" == schedule["ScheduleExpression"]
+
+    # the schedule fired and deleted itself
+    scheduler.schedules.clear()
+    module.handler({"RequestType": "Delete", "PhysicalResourceId": "workshop-ttl-expiry-30m",
+                    "ResourceProperties": props}, None)
+
+
+class _Tagging:
+    def __init__(self, tags):
+        # stack name -> tags
+        self._tags = tags
+        self.scans = 0
+
+    def get_paginator(self, name):
+        def pages(TagFilters, ResourceTypeFilters):
+            self.scans += 1
+            key = TagFilters[0]["Key"]
+            return [{"ResourceTagMappingList": [
+                {"ResourceARN": f"arn:{stack}", "Tags": [{"Key": k, "Value": v} for k, v in tags.items()]}
+                for stack, tags in self._tags.items() if key in tags
+            ]}]
+        return _Paginator(pages)
+
+
+@pytest.mark.unit
+def test_discovery_by_tags(ttl, monkeypatch):
+    module, _ = ttl
+    monkeypatch.delenv("STACK_NAMES", raising=False)
+    now = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    cfn = _Cfn()
+    cfn.stacks = [
+        {"StackName": name, "StackId": f"arn:{name}", "CreationTime": now - datetime.timedelta(minutes=90)}
+        for name in ("old", "fresh", "dated", "untagged")
+    ]
+    tagging = _Tagging({
+        "old": {"ttl-minutes": "60"},
+        "fresh": {"ttl-minutes": "120"},
+        "dated": {"ttl-expires-at": "2024-01-01T11:00:00Z"},
+        "gone": {"ttl-minutes": "1"},
+    })
+    _common()._clients.update({"cloudformation": cfn, "resourcegroupstaggingapi": tagging})
+
+    assert module.expired_stacks(now) == ["dated", "old"]
+    # warm invocation reuses the scan
+    assert module.expired_stacks(now) == ["dated", "old"]
+    assert tagging.scans == 2
+
+    monkeypatch.setattr(module, "expired_stacks", lambda region=None: ["dated", "old"])
+    assert module.handler({}, None)["statusCode"] == 200
+    assert sorted(cfn.deleted) == ["dated", "old"]
+    assert sorted(module.cached_scan()["stacks"]) == ["fresh"]
@@ -0,0 +1,83 @@
+import os
+import time
+import hashlib
+
+import pytest
+import aws_cdk as core
+from aws_cdk import aws_ec2 as ec2, aws_iam as iam
+import aws_cdk.assertions as assertions
+
+from lib.user_data_bundle import UserDataBundle, build_bundle
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    paths = []
+    for name in ("a.sh", "b.sh"):
+        path = tmp_path / name
+        path.write_text(f"echo {name}\n")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.unit
+def test_bundle_is_reproducible(scripts, tmp_path):
+    _, sha = build_bundle(scripts, str(tmp_path / "out1"))
+    os.utime(scripts[0], (time.time() + 100, time.time() + 100))
+    _, same_sha = build_bundle(list(reversed(scripts)), str(tmp_path / "out2"))
+    assert sha == same_sha
+
+
+@pytest.mark.unit
+def test_bundle_rewrites_changed_archive(scripts, tmp_path):
+    path, sha = build_bundle(scripts, str(tmp_path / "out"))
+    with open(path, "wb") as f:
+        f.write(b"tampered")
+    same_path, same_sha = build_bundle(scripts, str(tmp_path / "out"))
+    assert (same_path, same_sha) == (path, sha)
+    with open(path, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == sha
+
+
+@pytest.mark.unit
+def test_bundle_name_collision(scripts, tmp_path):
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "a.sh").write_text("echo other\n")
+    with pytest.raises(ValueError):
+        build_bundle(scripts + [str(other / "a.sh")], str(tmp_path / "out"))
+
+
+@pytest.mark.unit
+def test_bundle_shared_by_constructs(scripts, tmp_path):
+    bundle_dir = str(tmp_path / "out")
+    stack = core.Stack(core.App(), "bundle")
+    role = iam.Role(stack, "Role", assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"))
+    bundle = UserDataBundle(scripts, bundle_dir=bundle_dir)
+    user_data = ec2.UserData.for_linux()
+    first = bundle.add_to(stack, user_data, role=role)
+    second = UserDataBundle(scripts, bundle_dir=bundle_dir).add_to(stack, ec2.UserData.for_linux(), role=role)
+    assert first.node.path == second.node.path
+    assert os.path.dirname(bundle.path) == bundle_dir
+
+    rendered = user_data.render()
+    assert rendered.count("aws s3 cp") == 1
+    assert rendered.index(f"{bundle.install_dir}/a.sh") < rendered.index(f"{bundle.install_dir}/b.sh")
+    assertions.Template.from_stack(stack)
+
+
+@pytest.mark.unit
+def test_bundle_stops_boot_on_bad_checksum(scripts, tmp_path):
+    bundle = UserDataBundle(scripts, bundle_dir=str(tmp_path / "out"))
+    stack = core.Stack(core.App(), "bundle")
+    user_data = ec2.UserData.for_linux()
+    bundle.add_to(stack, user_data)
+    lines = user_data.render().splitlines()
+    archive = f"/tmp/user-data-{bundle.sha256[:16]}.tar.gz"
+
+    download = next(i for i, line in enumerate(lines) if line.startswith("aws s3 cp"))
+    check = lines.index(f"echo '{bundle.sha256}  {archive}' | sha256sum -c - || exit 1")
+    extract = lines.index(f"tar -xzf {archive} -C {bundle.install_dir} || exit 1")
+    first_script = next(i for i, line in enumerate(lines) if f"{bundle.install_dir}/a.sh" in line)
+    # the boot stops before anything of a bad archive is unpacked or run
+    assert download < check < extract < first_script
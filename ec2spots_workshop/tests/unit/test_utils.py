@@ -0,0 +1,179 @@
+import threading
+import pytest
+
+from lib import utils
+from lib.lookup_cache import LookupCache
+
+
+class _Response:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def lookup_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "cdk.lookups.json")
+    monkeypatch.setenv("CDK_LOOKUP_CACHE", path)
+    monkeypatch.delenv("CDK_EXTERNAL_IP", raising=False)
+    utils._lookup_external_ip.cache_clear()
+    yield LookupCache(path)
+    utils._lookup_external_ip.cache_clear()
+
+
+@pytest.fixture
+def ipify(monkeypatch):
+    calls = []
+
+    def _get(url, timeout=None):
+        calls.append(timeout)
+        return _Response(b"203.0.113.10")
+
+    monkeypatch.setattr(utils, "_http_get", _get)
+    return calls
+
+
+@pytest.mark.unit
+def test_external_ip_env_override(lookup_cache, ipify, monkeypatch):
+    monkeypatch.setenv("CDK_EXTERNAL_IP", "198.51.100.1")
+    assert utils.get_my_external_ip() == "198.51.100.1/32"
+    assert ipify == []
+
+
+@pytest.mark.unit
+def test_external_ip_resolved_once(lookup_cache, ipify, monkeypatch):
+    monkeypatch.setenv("CDK_EXTERNAL_IP_TIMEOUT", "2")
+    assert utils.get_my_external_ip() == "203.0.113.10/32"
+    assert utils.get_my_external_ip() == "203.0.113.10/32"
+    assert ipify == [2.0]
+    assert lookup_cache.get(utils.EXTERNAL_IP_CACHE_KEY) == "203.0.113.10/32"
+
+
+@pytest.mark.unit
+def test_external_ip_from_disk_cache(lookup_cache, ipify):
+    lookup_cache.set(utils.EXTERNAL_IP_CACHE_KEY, "192.0.2.7/32", ttl=60)
+    assert utils.get_my_external_ip() == "192.0.2.7/32"
+    assert ipify == []
+
+
+@pytest.mark.unit
+def test_lookup_cache_expiry(lookup_cache):
+    lookup_cache.set("key", "value", ttl=-1)
+    assert lookup_cache.get("key") is None
+    lookup_cache.set("key", "value")
+    assert lookup_cache.get("key") == "value"
+
+
+class _Paginator:
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Filters, Owners):
+        self._client.calls.append((Filters, Owners))
+        images = self._client.images
+        # two pages to be sure all of them are read
+        yield {"Images": images[:1]}
+        yield {"Images": images[1:]}
+
+
+class _EC2Client:
+    def __init__(self, images):
+        self.images = images
+        self.calls = []
+
+    def get_paginator(self, name):
+        assert name == "describe_images"
+        return _Paginator(self)
+
+
+@pytest.fixture
+def ec2_client(lookup_cache, monkeypatch):
+    client = _EC2Client([
+        {"ImageId": "ami-old", "Name": "web-2023", "CreationDate": "2023-01-01T00:00:00.000Z"},
+        {"ImageId": "ami-new", "Name": "web-2024", "CreationDate": "2024-01-01T00:00:00.000Z"},
+        {"ImageId": "ami-db", "Name": "db-2023", "CreationDate": "2023-06-01T00:00:00.000Z"},
+    ])
+    monkeypatch.setattr(utils, "_ec2_client", lambda region=None: client)
+    return client
+
+
+@pytest.mark.unit
+def test_describe_latest_amis_batched_and_cached(ec2_client):
+    patterns = [
+        {"owner": "111111111111", "architecture": "x86_64", "name": "web-*"},
+        {"owner": "111111111111", "architecture": "x86_64", "name": "db-*"},
+    ]
+    amis = utils.describe_latest_amis(patterns, ["us-east-1"])
+    assert amis == {
+        "ami:us-east-1:111111111111:x86_64:web-*": "ami-new",
+        "ami:us-east-1:111111111111:x86_64:db-*": "ami-db",
+    }
+    # both patterns in one request
+    assert len(ec2_client.calls) == 1
+    assert ec2_client.calls[0][0][1]["Values"] == ["db-*", "web-*"]
+
+    # warm cache, no more requests
+    assert utils._describe_ami(patterns[0], "us-east-1") == "ami-new"
+    assert len(ec2_client.calls) == 1
+
+
+@pytest.mark.unit
+def test_describe_ami_not_found(ec2_client):
+    with pytest.raises(ValueError):
+        utils._describe_ami(
+            {"owner": "111111111111", "architecture": "x86_64", "name": "missing-*"}, "us-east-1")
+
+
+@pytest.mark.unit
+def test_ami_resolved_on_deploy(ec2_client):
+    import aws_cdk as core
+    import aws_cdk.assertions as assertions
+
+    app = core.App()
+    stack = core.Stack(app, "ami-deploy", env=core.Environment(account="111111111111", region="us-east-1"))
+    image = utils.get_latest_linux_ami_from_aws(
+        pattern={
+            "owner": "111111111111",
+            "architecture": "x86_64",
+            "name": "web-*",
+            "ssm_parameter": "/workshop/ami/web",
+        },
+        region="us-east-1",
+        resolution=utils.AMI_RESOLUTION_DEPLOY
+    )
+    core.aws_ec2.LaunchTemplate(stack, "LT", machine_image=image)
+
+    template = assertions.Template.from_stack(stack)
+    template.has_parameter("*", {
+        "Type": "AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>",
+        "Default": "/workshop/ami/web",
+    })
+    assert ec2_client.calls == []
+
+
+@pytest.mark.unit
+def test_ami_deploy_resolution_needs_parameter(ec2_client):
+    with pytest.raises(ValueError):
+        utils.get_latest_linux_ami_from_aws(
+            {"owner": "111111111111", "architecture": "x86_64", "name": "web-*"},
+            "us-east-1", resolution=utils.AMI_RESOLUTION_DEPLOY)
+
+
+@pytest.mark.unit
+def test_describe_latest_amis_creates_clients_on_calling_thread(lookup_cache, monkeypatch):
+    import boto3
+    threads = []
+
+    def _client(service, region_name=None):
+        threads.append((region_name, threading.current_thread()))
+        return _EC2Client([])
+
+    monkeypatch.setattr(boto3, "client", _client)
+    monkeypatch.setattr(utils, "_ec2_clients", {})
+    monkeypatch.delenv("BOTO_REPLAY", raising=False)
+    pattern = {"owner": "111111111111", "architecture": "x86_64", "name": "web-*"}
+    utils.describe_latest_amis([pattern], ["us-east-1", "eu-west-1", "eu-central-1"])
+    assert sorted(region for region, _ in threads) == ["eu-central-1", "eu-west-1", "us-east-1"]
+    assert {thread for _, thread in threads} == {threading.current_thread()}
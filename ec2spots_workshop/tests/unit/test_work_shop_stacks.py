@@ -11,6 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "../../ec2spots_workshop
 from lib.work_shop_ec2_spot_stack import WorkshopWebAsgStack, WorkshopECSStack
 from lib.props import WebAsgProps, ECSProps
 from lib.utils import get_latest_linux_ami_from_aws, get_current_env
+from .template_cache import diff_templates, format_diff
 
 # This is a sample test case. You can modify it to test the behavior of your
 # pytestmark = [pytest.mark.unit, pytest.mark.integration]
@@ -21,29 +22,26 @@ from lib.utils import get_latest_linux_ami_from_aws, get_current_env
 # syrupy, the snapshot testing library we're using:
 # https://docs.pytest.org/en/stable/explanation/fixtures.html
 @pytest.mark.unit
-def test_webasg_created(snapshot, env, web_props):
-    app = core.App()
-    stack = WorkshopWebAsgStack(
-        app
+def test_webasg_created(snapshot, env, web_props, synth_template):
+    template = synth_template(
+        WorkshopWebAsgStack
         , "work-shop-ec2-spot"
+        , prefix = web_props.prefix
         , props = web_props
         , env = env
     )
-    template = assertions.Template.from_stack(stack)
-    assert template.to_json() == snapshot
+    diff = diff_templates(snapshot, template)
+    assert not diff, format_diff(diff)
 
 
 @pytest.mark.unit
-def test_ecs_created(ecs_props, env):
-    app = core.App()
-
-    stack = WorkshopECSStack(
-        app
+def test_ecs_created(ecs_props, env, synth_template):
+    template = assertions.Template.from_json(synth_template(
+        WorkshopECSStack
         , "workshop-ecs-spot"
         , props = ecs_props
         , env = env
-    )
-    template = assertions.Template.from_stack(stack)
+    ))
     # https://github.com/cdklabs/aws-cdk-testing-examples/blob/main/python/test/test_processor_stack.py
     template.resource_count_is("AWS::EC2::VPC", 1)
     template.resource_count_is("AWS::AutoScaling::AutoScalingGroup", 1)
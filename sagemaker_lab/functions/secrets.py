@@ -0,0 +1,134 @@
+"""
+    Decrypted sops files for synth.
+
+    Values are keyed by sha256 of the encrypted file, so a file is decrypted
+    (sops process + KMS call) only once per process, and once per change of the file
+    when the local cache is enabled with SOPS_CACHE_DIR.
+"""
+import os
+import json
+import stat
+import yaml
+import hashlib
+import logging
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def _file_digest(file: str) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _run_sops(file: str, data_type: str) -> dict:
+    sops_args=[
+        "sops" , "-d",
+        "--input-type", data_type ,"--output-type", data_type,
+        file
+    ]
+    log.debug(f"Decrypt {file} with sops")
+    result = subprocess.run(sops_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"sops can't decrypt {file}: {result.stderr.decode('utf8', errors='replace').strip()}")
+    if data_type == "json":
+        return json.loads(result.stdout)
+    return yaml.safe_load(result.stdout)
+
+
+class SopsSecrets:
+    """
+    Secrets provider on top of sops
+
+    Args:
+        cache_dir (str): directory for decrypted values, default is SOPS_CACHE_DIR,
+            no local cache if it's not set. The directory has to be private to the user (0700),
+            files are 0600 and files which are not private are skipped.
+        max_workers (int): files decrypted concurrently by decode_many
+    """
+    # decrypted values for the process lifetime, content hash -> secrets
+    _memo = {}
+
+    def __init__(self, cache_dir: str=None, max_workers: int=4) -> None:
+        self._cache_dir = cache_dir or os.environ.get("SOPS_CACHE_DIR")
+        self._max_workers = max_workers
+
+    def _cache_file(self, digest: str, data_type: str) -> str:
+        # the same file decrypted as yaml and as json are different values, like in _memo
+        return os.path.join(self._cache_dir, f"{digest}.{data_type}.json")
+
+    def _private(self, st: os.stat_result) -> bool:
+        # owned by this user and no group / other access, nobody else can read or plant values
+        return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+    def _cache_ready(self) -> bool:
+        """
+            The cache directory is created 0700, an existing one is used only when it's private,
+            otherwise the values stay in memory
+        """
+        if not self._cache_dir:
+            return False
+        try:
+            os.makedirs(self._cache_dir, mode=0o700)
+            # the mode of makedirs is masked by umask
+            os.chmod(self._cache_dir, 0o700)
+        except FileExistsError:
+            pass
+        st = os.lstat(self._cache_dir)
+        if not stat.S_ISDIR(st.st_mode) or not self._private(st):
+            log.warning(f"SOPS_CACHE_DIR {self._cache_dir} is not a private directory of this user, it isn't used")
+            return False
+        return True
+
+    def _read_cache(self, digest: str, data_type: str):
+        if not self._cache_ready():
+            return None
+        try:
+            fd = os.open(self._cache_file(digest, data_type), os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return None
+        with os.fdopen(fd) as f:
+            if not self._private(os.fstat(fd)):
+                log.warning(f"Skip cached secrets {self._cache_file(digest, data_type)}, the file is not private")
+                return None
+            try:
+                return json.load(f)
+            except ValueError:
+                return None
+
+    def _write_cache(self, digest: str, data_type: str, secrets: dict):
+        if not self._cache_ready():
+            return
+        fd = os.open(
+            self._cache_file(digest, data_type), os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+        with os.fdopen(fd, "w") as f:
+            # the mode of os.open applies to a new file only
+            os.fchmod(fd, 0o600)
+            json.dump(secrets, f)
+
+    def decode(self, file: str, data_type: str="yaml") -> dict:
+        digest = _file_digest(file)
+        key = (digest, data_type)
+        if key in self._memo:
+            return self._memo[key]
+        secrets = self._read_cache(digest, data_type)
+        if secrets is None:
+            secrets = _run_sops(file, data_type)
+            self._write_cache(digest, data_type, secrets)
+        self._memo[key] = secrets
+        return secrets
+
+    def decode_many(self, files: list, data_type: str="yaml") -> dict:
+        """
+            Decrypt several files concurrently, returns file -> secrets
+        """
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            results = executor.map(lambda file: self.decode(file, data_type), files)
+            return dict(zip(files, results))
@@ -1,7 +1,10 @@
 import os
+import sys
 import logging
+import importlib
+import importlib.util
 import aws_cdk as core
-from requests import get
+from pathlib import Path
 from constructs import Construct
 from .ttl import (
     TTLProps,
@@ -29,10 +32,28 @@ def get_current_env() -> core.Environment:
         raise
     return env
 
-# Get My external IP address
-def get_my_external_ip():
-    ip = get('https://api.ipify.org').content.decode('utf8')
-    return f"{ip}/32"
+# the external IP resolver of ec2spots_workshop/lib/utils.py, one implementation for all apps
+# (context 'external_ip' -> CDK_EXTERNAL_IP -> memo/cdk.lookups.json -> ipify with timeout).
+# ec2spots_workshop/lib is loaded from its path under the package name ec2spots_workshop_lib,
+# like stacks/sagemaker_lib/shared_network.py does
+_PACKAGE = "ec2spots_workshop_lib"
+_LIB_DIR = Path(__file__).resolve().parents[2] / "ec2spots_workshop" / "lib"
+
+
+def _load_workshop_utils():
+    if _PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            _PACKAGE, _LIB_DIR / "__init__.py", submodule_search_locations=[str(_LIB_DIR)])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[_PACKAGE] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{_PACKAGE}.utils")
+
+
+_workshop_utils = _load_workshop_utils()
+EXTERNAL_IP_CONTEXT_KEY = _workshop_utils.EXTERNAL_IP_CONTEXT_KEY
+EXTERNAL_IP_CACHE_KEY = _workshop_utils.EXTERNAL_IP_CACHE_KEY
+get_my_external_ip = _workshop_utils.get_my_external_ip
 
 
 # return Stack with TTL termination stacks get as argumetns of the functions
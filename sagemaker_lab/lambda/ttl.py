@@ -1,15 +1,33 @@
+"""
+    Basic TTL handler: deletes STACK_NAMES, nothing else.
+    Frozen copy, the TTL features (regions, waves, drain, idle mode, metrics, continuations)
+    are in ec2spots_workshop/lambda/ttl.py only and are not ported here.
+"""
 import boto3
 import os
 import json
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 LOG = logging.getLogger()
 LOG.setLevel(logging.INFO)
 
+# deletions in flight at once, delete_stack only starts the deletion
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 8))
+
+# created once per container and reused by warm invocations
+_clients = {}
+
+
+def get_client(service: str):
+    if service not in _clients:
+        _clients[service] = boto3.client(service)
+    return _clients[service]
+
 
 def delete_stack(stack_name: str) -> dict:
     try:
-        cfn = boto3.client("cloudformation")
+        cfn = get_client("cloudformation")
         cfn.delete_stack(
             StackName=stack_name,
             # OnFailure='ROLLBACK',
@@ -44,13 +62,19 @@ def handler(event, context):
     LOG.debug('## ENVIRONMENT VARIABLES')
     LOG.debug(os.environ)
     
+    status_code = 500
+    body = []
     try:
-        stack_names = os.environ["STACK_NAMES"]
+        # "" has no stacks, "a,,b" has two
+        stack_names = [name for name in os.environ["STACK_NAMES"].split(",") if name]
+        LOG.info(f"delete stacks {stack_names}...\n")
+        results = []
+        if stack_names:
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(stack_names))) as executor:
+                # results keep the order of STACK_NAMES
+                results = list(executor.map(lambda stack_name: delete_stack(stack_name=stack_name), stack_names))
         status_code = 200
-        body = []
-        for stack_name in stack_names.split(","):
-            LOG.info(f"delete stack {stack_name}...\n")
-            result = delete_stack(stack_name=stack_name)
+        for result in results:
             if result.get("statusCode") == 500:
                 status_code = 500
             body.append(result.get("body"))
@@ -3,3 +3,4 @@ from .props import NotebookLabProps # noqa: F401
 from .storage import Storage # noqa: F401
 from .base_infra import BaseInfra # noqa: F401
 from .step_function import StepFunction # noqa: F401
+from .shared_network import SharedNetwork # noqa: F401
@@ -12,6 +12,7 @@ from aws_cdk import (
 )
 
 from functions.utils import get_my_external_ip
+from .shared_network import SharedNetwork
 
 class BaseInfra(Construct):
 
@@ -40,6 +41,8 @@ class BaseInfra(Construct):
                  cidr_block: str,
                  region: str,
                  account: str,
+                 shared_network: str=None,
+                 shared_network_azs: int=2,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -47,45 +50,54 @@ class BaseInfra(Construct):
         self.region = region
         self.account = account
         
-        self._vpc = ec2.Vpc(
-            self, "VPC",
-            vpc_name="vpc-workshop",
-            ip_addresses=ec2.IpAddresses.cidr(cidr_block), 
-            enable_dns_hostnames=True,
-            enable_dns_support=True,
-            nat_gateways=0,
-            subnet_configuration=[
-                ec2.SubnetConfiguration(
-                    name="public",
-                    subnet_type=ec2.SubnetType.PUBLIC
-                ),
-                ec2.SubnetConfiguration(
-                    name="private",
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
-                )
-            ]
-        )
-        Aspects.of(self._vpc).add( Tag("Name", "vpc-workshop-lab"))
-        # # Create ssm endpoint via AWS CDk
-        # CodeWhisperer doesn't know CDK API documents
-        # self._ssm_endpoint = SsmEndpoint(self, "SsmEndpoint", vpc=self._vpc)
+        if shared_network:
+            # the shared network has the ssm endpoint already, public and private subnets
+            self._vpc = SharedNetwork(
+                self, "VPC",
+                name=shared_network,
+                prefix="vpc-workshop",
+                max_azs=shared_network_azs
+            ).vpc
+        else:
+            self._vpc = ec2.Vpc(
+                self, "VPC",
+                vpc_name="vpc-workshop",
+                ip_addresses=ec2.IpAddresses.cidr(cidr_block), 
+                enable_dns_hostnames=True,
+                enable_dns_support=True,
+                nat_gateways=0,
+                subnet_configuration=[
+                    ec2.SubnetConfiguration(
+                        name="public",
+                        subnet_type=ec2.SubnetType.PUBLIC
+                    ),
+                    ec2.SubnetConfiguration(
+                        name="private",
+                        subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+                    )
+                ]
+            )
+            Aspects.of(self._vpc).add( Tag("Name", "vpc-workshop-lab"))
+            # # Create ssm endpoint via AWS CDk
+            # CodeWhisperer doesn't know CDK API documents
+            # self._ssm_endpoint = SsmEndpoint(self, "SsmEndpoint", vpc=self._vpc)
         
-        # import SG by ID
-        security_group = ec2.SecurityGroup.from_security_group_id(
-            self, "SG", 
-            self._vpc.vpc_default_security_group,
-            mutable=False
-        )
+            # import SG by ID
+            security_group = ec2.SecurityGroup.from_security_group_id(
+                self, "SG", 
+                self._vpc.vpc_default_security_group,
+                mutable=False
+            )
 
-        ec2.InterfaceVpcEndpoint(
-            self, "VPC Endpoint",
-            vpc=self._vpc,
-            service=ec2.InterfaceVpcEndpointService(f"com.amazonaws.{self.region}.ssm", 443),
-            # Choose which availability zones to place the VPC endpoint in, based on
-            # available AZs
-            subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
-            security_groups=[security_group]
-        )
+            ec2.InterfaceVpcEndpoint(
+                self, "VPC Endpoint",
+                vpc=self._vpc,
+                service=ec2.InterfaceVpcEndpointService(f"com.amazonaws.{self.region}.ssm", 443),
+                # Choose which availability zones to place the VPC endpoint in, based on
+                # available AZs
+                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+                security_groups=[security_group]
+            )
 
         # AMI
         amzn_linux = ec2.MachineImage.latest_amazon_linux2(
@@ -109,7 +121,7 @@ class BaseInfra(Construct):
 
         # allow only MyIp
         self._asg_sg.add_ingress_rule(
-            peer = ec2.Peer.ipv4(get_my_external_ip()),
+            peer = ec2.Peer.ipv4(get_my_external_ip(self)),
             connection=ec2.Port.all_tcp()
         )
 
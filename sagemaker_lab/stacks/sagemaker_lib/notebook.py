@@ -8,21 +8,13 @@ from aws_cdk import (
 )
 
 import os
-import subprocess
-import yaml
 from constructs import Construct
+from functions.secrets import SopsSecrets
 from .props import NotebookLabProps 
 
 def sops_decode(file: str, data_type: str, kms_key_arn: str=None) -> dict:
-    sops_args=[
-        "sops" , "-d", 
-        "--input-type", data_type ,"--output-type", data_type,
-        "--verbose",  file
-    ]
-    print(sops_args)
-    result = subprocess.run(sops_args, stdout=subprocess.PIPE)
-    secrets = yaml.safe_load(result.stdout)
-    return secrets
+    # kms key is taken by sops from the file metadata
+    return SopsSecrets().decode(file, data_type)
 
 class NotebookLab(Construct):
 
@@ -24,6 +24,8 @@ class SageMakerLab(Stack):
     def __init__(self, scope: Construct, construct_id: str,
                  cidr_block: str,
                  prefix_name: str,
+                 shared_network: str=None,
+                 shared_network_azs: int=2,
                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -31,7 +33,9 @@ class SageMakerLab(Stack):
             self, "VPC",
             cidr_block=cidr_block,
             region=self.region,
-            account=self.account    
+            account=self.account,
+            shared_network=shared_network,
+            shared_network_azs=shared_network_azs
         )
 
         vpc_id = self._base_infra.vpc.vpc_id
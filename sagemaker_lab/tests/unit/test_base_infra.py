@@ -0,0 +1,45 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from stacks.sagemaker_lib import BaseInfra
+
+ENV = core.Environment(account="111111111111", region="us-east-1")
+
+
+def _template(monkeypatch, **kwargs):
+    monkeypatch.setenv("CDK_EXTERNAL_IP", "10.0.0.1")
+    stack = core.Stack(core.App(), "base-infra", env=ENV)
+    BaseInfra(stack, "VPC", cidr_block="172.30.0.0/24", region=ENV.region, account=ENV.account, **kwargs)
+    return assertions.Template.from_stack(stack)
+
+
+def test_base_infra_own_vpc(monkeypatch):
+    template = _template(monkeypatch)
+    template.resource_count_is("AWS::EC2::VPC", 1)
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 1)
+
+
+def test_base_infra_shared_network(monkeypatch):
+    template = _template(monkeypatch, shared_network="shared", shared_network_azs=3)
+    # the VPC and the ssm endpoint belong to the shared network
+    template.resource_count_is("AWS::EC2::VPC", 0)
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 0)
+    template.resource_count_is("AWS::AutoScaling::AutoScalingGroup", 1)
+    parameters = template.find_parameters("*", {"Type": "AWS::SSM::Parameter::Value<String>"})
+    assert {"/shared/network/vpc-id", "/shared/network/subnets/public", "/shared/network/layout"} \
+        <= {parameter["Default"] for parameter in parameters.values()}
+    # the ASG spreads over the public subnets of 3 AZs
+    [asg] = template.find_resources("AWS::AutoScaling::AutoScalingGroup").values()
+    assert len(asg["Properties"]["VPCZoneIdentifier"]) == 3
+    rules = template.to_json()["Rules"]
+    assert any(
+        rule["Assertions"][0]["Assert"]["Fn::Equals"][1] == "azs=3;public=PUBLIC;private=PRIVATE_WITH_EGRESS"
+        for rule in rules.values() if "Fn::Equals" in rule["Assertions"][0]["Assert"]
+    )
+
+
+def test_external_ip_resolver_of_workshop_lib(monkeypatch):
+    from functions import utils
+    monkeypatch.setenv("CDK_EXTERNAL_IP", "10.0.0.2")
+    assert utils.get_my_external_ip.__module__ == "ec2spots_workshop_lib.utils"
+    assert utils.get_my_external_ip() == "10.0.0.2/32"
@@ -0,0 +1,116 @@
+import os
+import stat
+import subprocess
+
+import pytest
+
+from functions import secrets as sops
+
+
+class _Result:
+    def __init__(self, stdout: bytes):
+        self.returncode = 0
+        self.stdout = stdout
+        self.stderr = b""
+
+
+@pytest.fixture
+def sops_calls(monkeypatch):
+    calls = []
+
+    def _run(args, stdout=None, stderr=None):
+        calls.append(args[-1])
+        if args[args.index("--output-type") + 1] == "json":
+            return _Result(b'{"github": {"username": "user", "password": "secret"}}')
+        return _Result(b"github:\n  username: user\n  password: secret\n")
+
+    monkeypatch.setattr(subprocess, "run", _run)
+    monkeypatch.setattr(sops.SopsSecrets, "_memo", {})
+    return calls
+
+
+@pytest.fixture
+def encrypted_files(tmp_path):
+    files = []
+    for name in ["a.yaml.enc", "b.yaml.enc"]:
+        path = tmp_path / name
+        path.write_text(f"encrypted {name}")
+        files.append(str(path))
+    return files
+
+
+def test_decoded_once_per_content(sops_calls, encrypted_files):
+    provider = sops.SopsSecrets()
+    secrets = provider.decode(encrypted_files[0])
+    assert secrets["github"]["username"] == "user"
+    provider.decode(encrypted_files[0])
+    sops.SopsSecrets().decode(encrypted_files[0])
+    assert sops_calls == [encrypted_files[0]]
+
+    # new content, new decryption
+    with open(encrypted_files[0], "w") as f:
+        f.write("rotated")
+    provider.decode(encrypted_files[0])
+    assert len(sops_calls) == 2
+
+
+def test_decode_many(sops_calls, encrypted_files):
+    secrets = sops.SopsSecrets().decode_many(encrypted_files)
+    assert list(secrets) == encrypted_files
+    assert sorted(sops_calls) == sorted(encrypted_files)
+
+
+def test_local_cache(sops_calls, encrypted_files, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "sops-cache")
+    sops.SopsSecrets(cache_dir=cache_dir).decode(encrypted_files[0])
+
+    # new process: memo is empty, the value comes from the local cache
+    monkeypatch.setattr(sops.SopsSecrets, "_memo", {})
+    sops.SopsSecrets(cache_dir=cache_dir).decode(encrypted_files[0])
+    assert sops_calls == [encrypted_files[0]]
+
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    for name in os.listdir(cache_dir):
+        assert stat.S_IMODE(os.stat(os.path.join(cache_dir, name)).st_mode) == 0o600
+
+
+def test_local_cache_per_data_type(sops_calls, encrypted_files, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "sops-cache"
+    sops.SopsSecrets(cache_dir=str(cache_dir)).decode(encrypted_files[0], "yaml")
+    monkeypatch.setattr(sops.SopsSecrets, "_memo", {})
+    sops.SopsSecrets(cache_dir=str(cache_dir)).decode(encrypted_files[0], "json")
+    assert sops_calls == [encrypted_files[0], encrypted_files[0]]
+    assert sorted(name.split(".", 1)[1] for name in os.listdir(cache_dir)) == ["json.json", "yaml.json"]
+
+
+def test_local_cache_refuses_shared_dir(sops_calls, encrypted_files, tmp_path, monkeypatch):
+    # group / other access: the values stay in memory only
+    cache_dir = tmp_path / "shared-cache"
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o750)
+    sops.SopsSecrets(cache_dir=str(cache_dir)).decode(encrypted_files[0])
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o750
+    assert os.listdir(cache_dir) == []
+
+    # owned by another user
+    os.chmod(cache_dir, 0o700)
+    monkeypatch.setattr(sops.SopsSecrets, "_memo", {})
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(cache_dir).st_uid + 1)
+    sops.SopsSecrets(cache_dir=str(cache_dir)).decode(encrypted_files[0])
+    assert os.listdir(cache_dir) == []
+    assert len(sops_calls) == 2
+
+
+def test_local_cache_skips_planted_files(sops_calls, encrypted_files, tmp_path):
+    cache_dir = tmp_path / "sops-cache"
+    cache_dir.mkdir(mode=0o700)
+    planted = cache_dir / f"{sops._file_digest(encrypted_files[0])}.yaml.json"
+    planted.write_text('{"github": {"username": "attacker"}}')
+    os.chmod(planted, 0o644)
+
+    secrets = sops.SopsSecrets(cache_dir=str(cache_dir)).decode(encrypted_files[0])
+    assert secrets["github"]["username"] == "user"
+    assert sops_calls == [encrypted_files[0]]
+    # the existing file is rewritten and made private
+    assert stat.S_IMODE(os.stat(planted).st_mode) == 0o600
+    assert "attacker" not in planted.read_text()